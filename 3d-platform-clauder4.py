@@ -4,36 +4,78 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 import math
 import random
+import argparse
 import json
 import os
+import threading
+import time
+import numpy as np
+from audio_engine import DEFAULT_BUFFER, DEFAULT_VOICES, AudioEngine
+from music_engine import MusicEngine
+from bvh import PlatformBVH
+from frame_pacing import FixedStep, FramePacer, PACING_MODES
+from ghosts import GhostRecorder, GhostSet, level_key
+from hazards import HazardSet, visible_hazards
+from input_snapshot import InputSampler
+from instrumentation import Instrumentation
+from level_streaming import ChunkStreamer, is_world
+from level_lod import LODSettings, PlatformLOD
+from level_pack import LevelPack
+from live_preview import PREVIEW_NAME, PreviewReader
+from memory_monitor import MemoryMonitor
+from moving_platforms import MovingPlatforms
+from netcode import DEFAULT_PORT, NetClient, NetHost, quantize_input
+from platform_batches import PlatformBatches
+from prefabs import expand_level
+from quality_governor import QUALITY_MODES, QualityGovernor, scaled_lod_settings
+from render_scale import parse_render_scale, set_perspective
+from sampling_profiler import SamplingProfiler
+from renderers import RENDERERS, Scene, create_renderer
+from spatial_grid import SpatialGrid
+from sim_thread import FrameSnapshot, PlayerPose, SimulationThread, blend_poses
 
 # Initialize pygame and OpenGL
 pygame.init()
 display_width, display_height = 800, 600
-screen = pygame.display.set_mode((display_width, display_height), DOUBLEBUF | OPENGL)
-pygame.display.set_caption("Enhanced 3D Platformer")
 
-# OpenGL setup
-glEnable(GL_DEPTH_TEST)
-glMatrixMode(GL_PROJECTION)
-gluPerspective(45, (display_width / display_height), 0.1, 50.0)
-glMatrixMode(GL_MODELVIEW)
-glClearColor(0.5, 0.8, 1.0, 1.0)
-
-# Enable lighting
-glEnable(GL_LIGHTING)
-glEnable(GL_LIGHT0)
-glEnable(GL_COLOR_MATERIAL)
-glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
-
-# Set up light
-light_position = [5.0, 10.0, 5.0, 1.0]
-light_ambient = [0.3, 0.3, 0.3, 1.0]
-light_diffuse = [0.8, 0.8, 0.8, 1.0]
+def init_display(vsync=False, opengl=True):
+    """Create the window and GL context, then set up fixed GL state"""
+    if not opengl:
+        # The null renderer draws nothing, but events and key state still need a window
+        screen = pygame.display.set_mode((320, 240))
+        pygame.display.set_caption("Enhanced 3D Platformer (null renderer)")
+        return screen
+    flags = DOUBLEBUF | OPENGL | RESIZABLE
+    try:
+        screen = pygame.display.set_mode((display_width, display_height), flags, vsync=1 if vsync else 0)
+    except (pygame.error, TypeError) as e:
+        print(f"VSync not available ({e}), continuing without it")
+        screen = pygame.display.set_mode((display_width, display_height), flags)
+    pygame.display.set_caption("Enhanced 3D Platformer")
+    setup_gl()
+    return screen
 
-glLightfv(GL_LIGHT0, GL_POSITION, light_position)
-glLightfv(GL_LIGHT0, GL_AMBIENT, light_ambient)
-glLightfv(GL_LIGHT0, GL_DIFFUSE, light_diffuse)
+def setup_gl():
+    """Fixed GL state for the game; also used by offscreen.py with its own context"""
+    # OpenGL setup
+    glEnable(GL_DEPTH_TEST)
+    set_perspective(display_width, display_height)
+    glClearColor(0.5, 0.8, 1.0, 1.0)
+    
+    # Enable lighting
+    glEnable(GL_LIGHTING)
+    glEnable(GL_LIGHT0)
+    glEnable(GL_COLOR_MATERIAL)
+    glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
+    
+    # Set up light
+    light_position = [5.0, 10.0, 5.0, 1.0]
+    light_ambient = [0.3, 0.3, 0.3, 1.0]
+    light_diffuse = [0.8, 0.8, 0.8, 1.0]
+    
+    glLightfv(GL_LIGHT0, GL_POSITION, light_position)
+    glLightfv(GL_LIGHT0, GL_AMBIENT, light_ambient)
+    glLightfv(GL_LIGHT0, GL_DIFFUSE, light_diffuse)
 
 # Colors
 RED = (0.8, 0.2, 0.2)
@@ -42,23 +84,32 @@ BLUE = (0.2, 0.2, 0.8)
 YELLOW = (0.9, 0.8, 0.1)
 WHITE = (0.9, 0.9, 0.9)
 DARK_GREEN = (0.1, 0.4, 0.1)
+BLACK = (0.0, 0.0, 0.0)
+
+# Clearance the camera keeps from platforms; covers the near plane's corners
+CAMERA_RADIUS = 0.12
+CAMERA_SMOOTHING = 9.75  # Per second; closes 15% of the gap per frame at 60 fps, the old fixed factor
 
 # Simple and reliable sound system
 class SoundManager:
-    def __init__(self):
-        try:
-            pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-            self.enabled = True
-            
+    def __init__(self, buffer=DEFAULT_BUFFER, voices=DEFAULT_VOICES, stats=None):
+        # Pooled channels, priorities, retrigger limits and panning (see audio_engine.py)
+        self.engine = AudioEngine(voices, frequency=22050, buffer=buffer, stats=stats)
+        self.enabled = self.engine.enabled
+        self.jump_sound = self.coin_sound = self.death_sound = None
+        if self.enabled:
             # Create simple sound effects using basic sine waves
             self.jump_sound = self.create_simple_beep(440, 0.1)
             self.coin_sound = self.create_simple_beep(880, 0.15) 
             self.death_sound = self.create_simple_beep(220, 0.3)
             
-            print("Sound system initialized")
-        except Exception as e:
-            self.enabled = False
-            print(f"Sound disabled: {e}")
+            # A held jump button asks every frame; coin chains come in bursts
+            self.engine.register("jump", self.jump_sound, priority=1, min_interval=0.12)
+            self.engine.register("coin", self.coin_sound, priority=2, min_interval=0.04)
+            self.engine.register("death", self.death_sound, priority=3, min_interval=0.5)
+            
+            print(f"Sound system initialized ({len(self.engine.channels)} voices, "
+                  f"{self.engine.latency_ms:.0f} ms buffer)")
     
     def create_simple_beep(self, frequency, duration):
         if not self.enabled:
@@ -66,7 +117,7 @@ class SoundManager:
         try:
             import numpy as np
             
-            sample_rate = 22050
+            sample_rate = self.engine.frequency  # What the mixer opened with
             frames = int(duration * sample_rate)
             
             # Generate time array
@@ -92,7 +143,7 @@ class SoundManager:
             # Fallback if numpy not available - create very basic sound
             try:
                 import array
-                sample_rate = 22050
+                sample_rate = self.engine.frequency
                 frames = int(duration * sample_rate)
                 
                 arr = array.array('h')
@@ -110,29 +161,19 @@ class SoundManager:
         except:
             return None
     
-    def play_jump(self):
-        if self.enabled and self.jump_sound:
-            try:
-                self.jump_sound.play()
-                print("Jump sound played")
-            except Exception as e:
-                print(f"Jump sound failed: {e}")
+    def play_jump(self, position=None):
+        self.engine.play("jump", position)
     
-    def play_coin(self):
-        if self.enabled and self.coin_sound:
-            try:
-                self.coin_sound.play()
-                print("Coin sound played")
-            except Exception as e:
-                print(f"Coin sound failed: {e}")
+    def play_coin(self, position=None):
+        self.engine.play("coin", position)
     
     def play_death(self):
-        if self.enabled and self.death_sound:
-            try:
-                self.death_sound.play()
-                print("Death sound played")
-            except Exception as e:
-                print(f"Death sound failed: {e}")
+        self.engine.play("death")
+    
+    def update(self, camera, target):
+        """Start this tick's sounds, heard from the camera"""
+        self.engine.set_listener(camera, target)
+        self.engine.update()
 
 # Particle system
 class Particle:
@@ -151,44 +192,42 @@ class Particle:
         self.life -= dt
         return self.life > 0
     
-    def draw(self):
-        alpha = self.life / self.max_life
-        glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
-        glColor4f(self.color[0], self.color[1], self.color[2], alpha)
-        
-        size = 0.03
-        glBegin(GL_QUADS)
-        glVertex3f(-size, -size, 0)
-        glVertex3f(size, -size, 0)
-        glVertex3f(size, size, 0)
-        glVertex3f(-size, size, 0)
-        glEnd()
-        glPopMatrix()
+    def state(self):
+        return (self.x, self.y, self.z, self.color[0], self.color[1], self.color[2],
+                self.life / self.max_life)
 
 class ParticleSystem:
     def __init__(self):
         self.particles = []
+        self.emit_scale = 1.0  # Set by the quality governor
+        self.cap = None
+    
+    def set_budget(self, emit_scale, cap):
+        self.emit_scale = emit_scale
+        self.cap = cap
+        self.trim()
+    
+    def trim(self):
+        # Drop the oldest particles first; they are the most faded
+        if self.cap is not None and len(self.particles) > self.cap:
+            del self.particles[:len(self.particles) - self.cap]
     
     def emit(self, x, y, z, color, count=8):
+        if self.emit_scale != 1.0:
+            count = int(count * self.emit_scale + 0.5)
         for _ in range(count):
             vel_x = (random.random() - 0.5) * 1.5
             vel_y = random.random() * 1.0 + 0.3
             vel_z = (random.random() - 0.5) * 1.5
             life = random.uniform(0.3, 0.8)
             self.particles.append(Particle(x, y, z, vel_x, vel_y, vel_z, color, life))
+        self.trim()
     
     def update(self, dt):
         self.particles = [p for p in self.particles if p.update(dt)]
     
-    def draw(self):
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glDisable(GL_LIGHTING)
-        for particle in self.particles:
-            particle.draw()
-        glEnable(GL_LIGHTING)
-        glDisable(GL_BLEND)
+    def snapshot(self):
+        return tuple(particle.state() for particle in self.particles)
 
 # Save system
 class SaveSystem:
@@ -219,55 +258,6 @@ class SaveSystem:
             return True
         return False
 
-def draw_cube(size, color):
-    glColor3f(*color)
-    
-    vertices = [
-        [size, size, -size], [size, -size, -size], [-size, -size, -size], [-size, size, -size],
-        [size, size, size], [size, -size, size], [-size, -size, size], [-size, size, size]
-    ]
-    
-    faces = [
-        ([0, 1, 2, 3], [0, 0, -1]), ([4, 7, 6, 5], [0, 0, 1]),
-        ([7, 3, 2, 6], [-1, 0, 0]), ([1, 0, 4, 5], [1, 0, 0]),
-        ([0, 3, 7, 4], [0, 1, 0]), ([1, 5, 6, 2], [0, -1, 0])
-    ]
-    
-    glBegin(GL_QUADS)
-    for face_vertices, normal in faces:
-        glNormal3f(*normal)
-        for vertex_index in face_vertices:
-            glVertex3f(*vertices[vertex_index])
-    glEnd()
-    
-    # Wireframe outline
-    glColor3f(0.0, 0.0, 0.0)
-    glLineWidth(1.5)
-    edges = [
-        (0, 1), (1, 2), (2, 3), (3, 0),
-        (4, 5), (5, 6), (6, 7), (7, 4),
-        (0, 4), (1, 5), (2, 6), (3, 7)
-    ]
-    glBegin(GL_LINES)
-    for edge in edges:
-        for vertex_index in edge:
-            glVertex3f(*vertices[vertex_index])
-    glEnd()
-
-def draw_platform(x, y, z, width, height, depth, color=GREEN):
-    glPushMatrix()
-    glTranslatef(x, y, z)
-    glScalef(width, height, depth)
-    draw_cube(0.5, color)
-    glPopMatrix()
-
-def draw_coin(x, y, z, rotation):
-    glPushMatrix()
-    glTranslatef(x, y + math.sin(rotation * 0.1) * 0.1, z)
-    glRotatef(rotation, 0, 1, 0)
-    draw_cube(0.15, YELLOW)
-    glPopMatrix()
-
 class Player:
     def __init__(self):
         self.reset()
@@ -292,11 +282,20 @@ class Player:
         self.x, self.y, self.z = 0.0, 1.0, 0.0
         self.vel_x = self.vel_y = self.vel_z = 0.0
         self.on_ground = False
+        self.ground = None  # Index of the platform stood on
         self.jump_buffer_timer = 0
         
-    def update(self, platforms, dt, sound_manager, particles):
+    def update(self, platforms, dt, sound_manager, particles, grid=None, movers=None, hazards=None):
         self.was_on_ground = self.on_ground
         
+        # Ride moving platforms by carrying their motion over the last tick
+        if self.on_ground and movers:
+            carry = movers.velocity_of(self.ground)
+            if carry is not None:
+                self.x += carry[0]
+                self.y += carry[1]
+                self.z += carry[2]
+        
         # Update coyote timer
         if self.coyote_timer > 0:
             self.coyote_timer -= dt
@@ -315,7 +314,7 @@ class Player:
         self.z += self.vel_z
         
         # Check collisions
-        self.check_collisions(platforms, sound_manager, particles)
+        self.check_collisions(platforms, sound_manager, particles, grid)
         
         # Coyote time
         if self.was_on_ground and not self.on_ground:
@@ -337,17 +336,24 @@ class Player:
             if self.squash < 1.0:
                 self.squash = 1.0
                 
-        # Reset if fallen
-        if self.y < -10:
+        # Reset if fallen or hit
+        if self.y < -10 or (hazards and hazards.touches(self.x, self.y, self.z, self.size)):
             self.reset()
             return True  # took damage
         return False
         
-    def check_collisions(self, platforms, sound_manager, particles):
+    def check_collisions(self, platforms, sound_manager, particles, grid=None):
         self.on_ground = False
+        self.ground = None
         
-        for platform in platforms:
-            px, py, pz, pw, ph, pd = platform[:6]
+        if grid is not None:
+            # Broadphase: only platforms sharing a grid cell with the player
+            candidates = sorted(grid.query_point(self.x, self.z, self.size))
+        else:
+            candidates = range(len(platforms))
+        
+        for i in candidates:
+            px, py, pz, pw, ph, pd = platforms[i][:6]
             
             # AABB collision
             if (abs(self.x - px) < pw/2 + self.size and
@@ -364,12 +370,21 @@ class Player:
                 self.y = py + ph/2 + self.size
                 self.vel_y = 0
                 self.on_ground = True
+                self.ground = i
                 self.coyote_timer = 0
                 break
         
     def move(self, direction):
         self.vel_x += direction[0] * self.acceleration
         self.vel_z += direction[1] * self.acceleration
+    
+    def control(self, move_x, move_z, jump, sound_manager, particles):
+        """One tick of input: jump if asked, then accelerate along the normalized direction"""
+        if jump:
+            self.jump(sound_manager, particles)
+        if move_x != 0 or move_z != 0:
+            length = math.sqrt(move_x**2 + move_z**2)
+            self.move((move_x / length, move_z / length))
         
     def jump(self, sound_manager, particles):
         # Only jump if buffer timer has expired (prevents rapid jumping when holding space)
@@ -378,27 +393,47 @@ class Player:
             self.on_ground = False
             self.coyote_timer = 0
             self.jump_buffer_timer = self.jump_buffer_time  # Reset buffer timer
-            sound_manager.play_jump()
+            sound_manager.play_jump((self.x, self.y, self.z))
             particles.emit(self.x, self.y - self.size, self.z, (0.8, 0.8, 0.8), 4)
             
-    def draw(self):
-        glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
-        
-        # Squash effect
-        scale_y = 1.0 / self.squash
-        scale_xz = self.squash
-        glScalef(scale_xz, scale_y, scale_xz)
-        
-        draw_cube(self.size, RED)
-        glPopMatrix()
+    def pose(self):
+        return PlayerPose(self.x, self.y, self.z, self.squash, self.on_ground, self.size)
 
 class Game:
-    def __init__(self):
-        self.sound_manager = SoundManager()
+    def __init__(self, pacing="capped", target_fps=60, sim_rate=None, max_ghosts=20, renderer="batched",
+                 quality="auto", render_scale=1.0, pack=None, memory=False, preview=None,
+                 audio_buffer=DEFAULT_BUFFER, voices=DEFAULT_VOICES, music=True, host=None, connect=None,
+                 net_loss=0.0, net_latency=0.0):
+        self.stats = Instrumentation()  # F3 prints a periodic report
+        self.sound_manager = SoundManager(audio_buffer, voices, self.stats)
+        # Synthesized on its own thread, on the mixer channel after the effect voices
+        self.music = MusicEngine(channel=voices, stats=self.stats) if music else None
         self.particles = ParticleSystem()
         self.save_system = SaveSystem()
         
+        # Memory by subsystem on F10; with memory=True also tracemalloc leak checks per level
+        self.memory = MemoryMonitor(self, stats=self.stats)
+        if memory:
+            self.memory.start()
+        
+        # All drawing goes through the renderer; the game only builds a Scene
+        self.renderer = create_renderer(renderer, display_width, display_height, self.stats)
+        self.present = pygame.display.flip  # Offscreen rendering swaps in glFinish
+        self.render_scale = render_scale  # A fraction, or "auto" to follow the quality tier
+        if render_scale != "auto":
+            self.renderer.set_render_scale(render_scale)
+        
+        # Input is sampled once per frame into an immutable snapshot
+        self.input = InputSampler()
+        self.last_input = None
+        self.applied_input_time = None
+        
+        # Held while game state changes; with --sim-thread the simulation
+        # thread and event handling take turns on it
+        self.lock = threading.RLock()
+        self._coins_source = None
+        self._coins_frozen = ()
+        
         # Initialize joystick support
         pygame.joystick.init()
         self.joystick = None
@@ -410,10 +445,47 @@ class Game:
         self.lives = 3
         self.level = 1
         
+        # Optional level pack (see level_pack.py): level N is its Nth entry
+        self.pack = LevelPack(pack) if pack else None
+        if self.pack:
+            print(f"Level pack {pack}: {len(self.pack)} levels")
+        
+        # Live preview (see live_preview.py): every level is the 2D editor's, updated as it is edited
+        self.preview = PreviewReader(preview) if preview else None
+        self.preview_level = None  # Last version taken from the editor
+        if self.preview:
+            print(f"Live preview of '{preview}' (F5 in level_editor_2d.py publishes it)")
+        
         # Objects
         self.player = Player()
+        self.world = None  # ChunkStreamer when a chunked world level is loaded
+        
+        # Level of detail for platforms (L toggles)
+        self.lod_settings = LODSettings.load()
+        self.view_settings = self.lod_settings  # lod_settings with the quality tier's draw distance
+        self.lod_enabled = True
+        self.lod = None
+        
+        # Quality tier: particles, shadow, outlines, draw distance and HUD detail
+        self.quality = QualityGovernor(quality, target_fps, stats=self.stats)
+        self.apply_quality()
+        
+        # Time-trial ghosts: completed runs are recorded and the fastest replay (G toggles)
+        self.max_ghosts = max_ghosts
+        self.ghosts_enabled = True
+        self.ghosts = None
+        self.recorder = GhostRecorder()
+        self.level_ticks = 0
+        
+        self.net = None
         self.load_level(1)
         
+        # Local network multiplayer (see netcode.py): host this game, or join one and follow its host
+        if host is not None:
+            self.net = NetHost(self, host, loss=net_loss, latency=net_latency, stats=self.stats)
+        elif connect:
+            self.net = NetClient(self, connect, loss=net_loss, latency=net_latency, stats=self.stats)
+        
         # Camera
         self.camera_x, self.camera_y, self.camera_z = 0, 3, 6
         
@@ -422,19 +494,55 @@ class Game:
         self.camera_pitch = -20.0  # Vertical rotation (up/down) - start slightly looking down
         self.camera_distance = 6.0 # Distance from player
         self.camera_sensitivity = 100.0  # How fast camera rotates
+        self.camera_latch_time = time.perf_counter()
         
         # Timing
-        self.clock = pygame.time.Clock()
-        self.last_time = pygame.time.get_ticks()
+        self.pacer = FramePacer(pacing, target_fps, stats=self.stats)
+        # Physics moves a fixed amount per tick, so ticks run at 60 Hz whatever the frame rate
+        self.stepper = FixedStep()
+        self.previous_pose = None  # Player pose before the last step, for blending the drawn pose
+        self.work_done = self.pacer.last_frame  # When this frame's drawing was submitted, before presenting
         self.coin_rotation = 0
         
+        # Optional fixed-rate simulation thread; the main loop then only renders snapshots
+        self.sim = SimulationThread(self, sim_rate) if sim_rate else None
+        
+        # Sampling profiler for live sessions (F9 or SIGUSR1)
+        self.profiler = SamplingProfiler(self.profiled_threads, self.profile_tags)
+        
         print("Enhanced 3D Platformer")
+        print(f"Frame pacing: {self.pacer.describe()}, renderer: {self.renderer.name}, "
+              f"quality: {self.quality.describe()}, render scale: {self.render_scale}")
+        if self.sim:
+            print(f"Simulation thread: {self.sim.rate} Hz")
         print("Game: WASD - Move, SPACE/SHIFT - Jump, ESC - Pause, R - Restart")
         print("Controller: Left stick/D-pad - Move, Right stick - Camera, A/B/X/Y - Jump, Start - Pause")
         print("Custom Levels: 6-0 - Load custom level from slots 1-5")
-        print("Info: C - Show controller details, V - Reset camera")
+        print("Info: C - Show controller details, V - Reset camera, L - Toggle level of detail, G - Toggle ghosts, F3 - Performance report, F4 - Network report, F9 - Profile capture, F10 - Memory report")
         print("Game Started! Use WASD to move, SPACE or SHIFT to jump")
         
+    def apply_quality(self):
+        """Push the governor's current tier into the particles, LOD and fog"""
+        tier = self.quality.current
+        self.particles.set_budget(tier.particle_scale, tier.particle_cap)
+        self.view_settings = scaled_lod_settings(self.lod_settings, tier.draw_distance_scale)
+        if self.lod:
+            self.lod.settings = self.view_settings
+        self.renderer.set_fog(self.view_settings, self.lod_enabled)
+        if self.render_scale == "auto":
+            self.renderer.set_render_scale(tier.render_scale)
+        
+    def profiled_threads(self):
+        threads = {threading.main_thread().ident: "MainThread"}
+        if self.sim and self.sim.thread.ident:
+            threads[self.sim.thread.ident] = "SimulationThread"
+        if self.music and self.music.thread.ident:
+            threads[self.music.thread.ident] = "MusicThread"
+        return threads
+    
+    def profile_tags(self):
+        return (f"level_{self.level}", self.game_state)
+    
     def setup_controller(self):
         """Initialize and detect game controller"""
         try:
@@ -461,6 +569,7 @@ class Game:
                 
                 self.joystick = pygame.joystick.Joystick(best_controller)
                 self.joystick.init()
+                self.input.set_joystick(self.joystick)
                 controller_name = self.joystick.get_name()
                 
                 print(f"🎮 Controller detected: {controller_name}")
@@ -488,6 +597,7 @@ class Game:
                 return True
                 
             else:
+                self.input.set_joystick(None)
                 print("No controller detected. Keyboard controls available.")
                 print("🎮 To use a controller:")
                 print("  1. Connect your 8bitdo Ultimate 2")
@@ -498,13 +608,24 @@ class Game:
         except Exception as e:
             print(f"Controller setup failed: {e}")
             self.joystick = None
+            self.input.set_joystick(None)
             return False
     
     def load_level(self, level_num):
+        self.memory.level_unloading()
         self.level = level_num
+        self.level_source = f"level_{level_num}"  # Custom levels replace it with where they were read from
+        
+        if self.world:
+            self.world.stop()
+            self.world = None
         
         # Try to load custom level first
+        self.moving_platforms = []
+        self.hazard_specs = []
+        self.instances = None
         if self.load_custom_level(level_num):
+            self.level_ready()
             return
         
         # Fall back to built-in levels
@@ -525,48 +646,52 @@ class Game:
                 [2, 1.7, 2], [0, 2.1, 3], [-2, 2.5, 2]
             ]
         elif level_num == 2:
-            # Precision jumping
-            self.platforms = [
-                [0, -0.5, 0, 4, 0.5, 4],
-                [1, -0.2, -3, 1, 0.2, 1],
-                [3, 0.1, -2, 1, 0.2, 1],
-                [4, 0.5, 0, 1, 0.2, 1],
-                [3, 0.9, 2, 1, 0.2, 1],
-                [1, 1.3, 3, 1, 0.2, 1],
-                [-1, 1.7, 3, 1, 0.2, 1],
-                [-3, 2.1, 2, 1, 0.2, 1],
-                [-4, 2.5, 0, 1, 0.2, 1],
-                [-3, 2.9, -2, 1, 0.2, 1],
-                [-1, 3.3, -3, 2, 0.2, 2],
-            ]
-            self.platform_colors = [DARK_GREEN] + [BLUE] * 10
-            self.coins = [
-                [1, 0.5, -3], [3, 0.8, -2], [4, 1.2, 0], [3, 1.6, 2],
-                [1, 2.0, 3], [-1, 2.4, 3], [-3, 2.8, 2], [-4, 3.2, 0],
-                [-3, 3.6, -2], [-1, 4.0, -3]
-            ]
+            # Precision jumping; the two flights of steps are one prefab
+            self.apply_level_data({
+                "platforms": [
+                    [0, -0.5, 0, 4, 0.5, 4],
+                    [1, -0.2, -3, 1, 0.2, 1],
+                    [1, 1.3, 3, 1, 0.2, 1],
+                    [-1, 1.7, 3, 1, 0.2, 1],
+                    [-1, 3.3, -3, 2, 0.2, 2],
+                ],
+                "platform_colors": [DARK_GREEN] + [BLUE] * 4,
+                "coins": [[1, 0.5, -3], [1, 2.0, 3], [-1, 2.4, 3], [-1, 4.0, -3]],
+                "prefabs": {
+                    "steps": {
+                        "platforms": [[3, 0, -2, 1, 0.2, 1], [4, 0.4, 0, 1, 0.2, 1], [3, 0.8, 2, 1, 0.2, 1]],
+                        "platform_colors": [BLUE] * 3,
+                        "coins": [[3, 0.7, -2], [4, 1.1, 0], [3, 1.5, 2]],
+                    },
+                },
+                "instances": [
+                    {"prefab": "steps", "position": [0, 0.1, 0]},
+                    {"prefab": "steps", "position": [0, 2.1, 0], "rotation": 2},
+                ],
+            })
         elif level_num == 3:
-            # Spiral tower
-            self.platforms = [
-                [0, -0.5, 0, 3, 0.5, 3],      # Base
-                [2, 0.0, 0, 1, 0.2, 1],       # Start spiral
-                [2, 0.4, -2, 1, 0.2, 1],
-                [0, 0.8, -3, 1, 0.2, 1],
-                [-2, 1.2, -2, 1, 0.2, 1],
-                [-3, 1.6, 0, 1, 0.2, 1],
-                [-2, 2.0, 2, 1, 0.2, 1],
-                [0, 2.4, 3, 1, 0.2, 1],
-                [2, 2.8, 2, 1, 0.2, 1],
-                [3, 3.2, 0, 1, 0.2, 1],
-                [2, 3.6, -1, 1, 0.2, 1],
-                [0, 4.0, -2, 2, 0.2, 2],     # Top platform
-            ]
-            self.platform_colors = [DARK_GREEN] + [RED] * 11
-            self.coins = [
-                [2, 0.7, 0], [2, 1.1, -2], [0, 1.5, -3], [-2, 1.9, -2],
-                [-3, 2.3, 0], [-2, 2.7, 2], [0, 3.1, 3], [2, 3.5, 2],
-                [3, 3.9, 0], [2, 4.3, -1], [0, 4.7, -2]
-            ]
+            # Spiral tower: each quarter turn is the same two platforms, turned and raised
+            self.apply_level_data({
+                "platforms": [
+                    [0, -0.5, 0, 3, 0.5, 3],      # Base
+                    [2, 0.0, 0, 1, 0.2, 1],       # Start spiral
+                    [2, 3.6, -1, 1, 0.2, 1],
+                    [0, 4.0, -2, 2, 0.2, 2],      # Top platform
+                ],
+                "platform_colors": [DARK_GREEN] + [RED] * 3,
+                "coins": [[2, 0.7, 0], [2, 4.3, -1], [0, 4.7, -2]],
+                "prefabs": {
+                    "spiral_turn": {
+                        "platforms": [[2, 0, -2, 1, 0.2, 1], [0, 0.4, -3, 1, 0.2, 1]],
+                        "platform_colors": [RED] * 2,
+                        "coins": [[2, 0.7, -2], [0, 1.1, -3]],
+                    },
+                },
+                "instances": [
+                    {"prefab": "spiral_turn", "position": [0, 0.4 + 0.8 * turn, 0], "rotation": turn}
+                    for turn in range(4)
+                ],
+            })
         elif level_num == 4:
             # Long jumps and gaps
             self.platforms = [
@@ -590,7 +715,7 @@ class Game:
                 [0, 3.9, 6], [4, 4.3, 4], [7, 4.7, 1]
             ]
         elif level_num == 5:
-            # Moving maze (static for now, but complex layout)
+            # Moving maze
             self.platforms = [
                 [0, -0.5, 0, 2, 0.5, 2],      # Start
                 [3, 0.0, 0, 1, 0.2, 3],       # Wall
@@ -615,37 +740,102 @@ class Game:
                 [5, 3.9, 1], [3, 4.3, 3], [0, 4.7, 5], [-3, 5.1, 3],
                 [-5, 5.5, 0], [-2, 5.9, -2]
             ]
+            self.moving_platforms = [
+                {"index": 2, "path": [[0, 0, 0], [-1.5, 0, 0]], "speed": 0.8, "phase": 0.0},
+                {"index": 6, "path": [[0, 0, 0], [0, 0.6, 0]], "speed": 0.4, "phase": 0.25},
+                {"index": 9, "path": [[0, 0, 0], [0, 0, -1.5]], "speed": 0.6, "phase": 0.5},
+            ]
+            self.hazard_specs = [
+                {"type": "enemy", "position": [3, 0.35, -1.2], "path": [[0, 0, 0], [0, 0, 2.4]], "speed": 1.2},
+                {"type": "spinner", "position": [-4, 1.45, 5], "size": [1.4, 0.2, 0.2]},
+            ]
         
         self.player.reset()
+        self.level_ready()
+    
+    def level_ready(self):
+        """Everything derived from a freshly loaded level"""
+        self.rebuild_level_index()
+        # Ghosts belong to this exact layout: an edited level or another pack's level N gets its own runs
+        self.ghost_key = level_key(self.level_source, np.hstack([self.lod.center, self.lod.half]))
+        self.start_ghost_race()
+        if self.music:
+            self.music.set_theme(self.level)
+        if self.net:
+            self.net.level_loaded()
+        self.memory.level_loaded(self.level)
+    
+    def start_ghost_race(self):
+        """Restart the run clock and recording, and load this level's fastest ghosts"""
+        self.level_ticks = 0
+        self.recorder.reset()
+        # Recorded runs belong to the level files, not to a level being edited
+        racing = self.max_ghosts and not self.preview
+        self.ghosts = GhostSet.for_level(self.ghost_key, self.max_ghosts, self.player.size) if racing else None
+        if self.ghosts and self.ghosts.count:
+            print(f"👻 Racing {self.ghosts.count} ghosts")
+    
+    def rebuild_level_index(self):
+        """Rebuild what is derived from the level: movers, hazards, collision grid, LOD and BVH"""
+        self.movers = MovingPlatforms(self.platforms, self.moving_platforms)
+        self.hazards = HazardSet(self.hazard_specs)
+        self.collision_grid = SpatialGrid()
+        for i, platform in enumerate(self.platforms):
+            x, _, z, w, _, d = platform[:6]
+            self.collision_grid.insert(i, x - w/2, z - d/2, x + w/2, z + d/2)
+        instances = self.instances
+        if instances is not None:
+            instances = instances.without(self.movers.indices, len(self.platforms))
+        self.lod = PlatformLOD(self.platforms, self.platform_colors, self.view_settings, self.movers.indices,
+                               instances)
+        # Ray and box queries (camera occlusion, shadow); reuses the LOD's arrays
+        self.bvh = PlatformBVH(np.hstack([self.lod.center, self.lod.half * 2]), self.movers.indices)
+        # Vertex arrays per material for everything that never moves
+        static = ~self.lod.instanced
+        static[self.movers.indices] = False
+        self.platform_batches = PlatformBatches(self.lod.center, self.lod.half, self.platform_colors, static)
+        self.quality.settle()  # Don't count the load hitch against the quality tier
         
+    @property
+    def level_count(self):
+        return max(5, len(self.pack)) if self.pack else 5
+    
     def load_custom_level(self, level_num):
-        """Try to load a custom level from JSON file. Returns True if successful."""
+        """Try to load a custom level from the preview, the pack or a JSON file. Returns True if successful."""
+        if self.preview:
+            level_data = self.preview.poll()
+            if level_data is None and self.preview_level is not None:
+                level_data = self.preview_level  # Unchanged since it was last applied
+            if level_data is not None:
+                self.apply_preview(level_data)
+                print(f"✓ Loaded preview level: {len(self.platforms)} platforms, {len(self.coins)} coins")
+                return True
+        
+        if self.pack and level_num <= len(self.pack):
+            try:
+                self.apply_level_data(self.pack.read(level_num - 1))
+                self.level_source = f"pack:{self.pack.entry(level_num - 1)['name']}"
+                print(f"✓ Loaded pack level {level_num} ({self.pack.entry(level_num - 1)['title']}): "
+                      f"{len(self.platforms)} platforms, {len(self.coins)} coins")
+                return True
+            except Exception as e:
+                print(f"Failed to load pack level {level_num}: {e}")
+        
         filename = f"my_level_{level_num}.json"
         
+        # Chunked worlds (see level_streaming.py) take priority
+        world_dir = f"my_world_{level_num}"
+        if is_world(world_dir):
+            return self.load_world(world_dir)
+        
         try:
             if not os.path.exists(filename):
                 return False
                 
             with open(filename, 'r') as f:
                 level_data = json.load(f)
-            
-            # Load platforms
-            self.platforms = level_data.get("platforms", [])
-            
-            # Load platform colors
-            platform_colors_data = level_data.get("platform_colors", [])
-            self.platform_colors = []
-            
-            for color_data in platform_colors_data:
-                # Convert from 0-1 range to RGB tuple
-                if len(color_data) >= 3:
-                    color = (color_data[0], color_data[1], color_data[2])
-                    self.platform_colors.append(color)
-                else:
-                    self.platform_colors.append(GREEN)  # Default color
-            
-            # Load coins
-            self.coins = level_data.get("coins", [])
+            self.apply_level_data(level_data)
+            self.level_source = filename
             
             print(f"✓ Loaded custom level {level_num}: {len(self.platforms)} platforms, {len(self.coins)} coins")
             return True
@@ -653,11 +843,89 @@ class Game:
         except Exception as e:
             print(f"Failed to load custom level {level_num}: {e}")
             return False
+    
+    def apply_level_data(self, level_data):
+        """Take platforms, colors, coins, movers and hazards from a level dict (my_level_N.json layout)"""
+        # Prefab instances become plain platforms; the table lets renderers draw them whole
+        level_data, self.instances = expand_level(level_data)
+        
+        # Load platforms
+        self.platforms = level_data.get("platforms", [])
+        
+        # Load platform colors
+        platform_colors_data = level_data.get("platform_colors", [])
+        self.platform_colors = []
+        
+        for color_data in platform_colors_data:
+            # Convert from 0-1 range to RGB tuple
+            if len(color_data) >= 3:
+                color = (color_data[0], color_data[1], color_data[2])
+                self.platform_colors.append(color)
+            else:
+                self.platform_colors.append(GREEN)  # Default color
+        
+        # Load coins
+        self.coins = level_data.get("coins", [])
+        self.moving_platforms = level_data.get("moving_platforms", [])
+        self.hazard_specs = level_data.get("hazards", [])
 
+    def load_world(self, world_dir):
+        """Start streaming a chunked world. Returns True if successful."""
+        try:
+            self.world = ChunkStreamer(world_dir)
+            self.player.reset()
+            self.world.update(self.player.x, self.player.z)
+            self.sync_world()
+            self.level_source = world_dir
+            print(f"✓ Loaded world {world_dir}: {len(self.world.index)} chunks, {self.world.total_coins} coins")
+            return True
+        except Exception as e:
+            print(f"Failed to load world {world_dir}: {e}")
+            self.world = None
+            return False
+    
+    def sync_preview(self):
+        """Take the editor's latest version of the level; the player stays where it is"""
+        level_data = self.preview.poll()
+        if level_data is None:
+            return
+        first = self.preview_level is None
+        self.apply_preview(level_data)
+        if first:
+            self.player.reset()
+            self.level_ready()
+        else:
+            self.rebuild_level_index()
+        if self.game_state == "level_complete":
+            self.game_state = "playing"
+        print(f"🔄 Preview: {len(self.platforms)} platforms, {len(self.coins)} coins")
+    
+    def apply_preview(self, level_data):
+        """Play removes coins and replaces moving rows, so the kept version gets list copies"""
+        self.preview_level = level_data
+        self.apply_level_data(dict(level_data, platforms=list(level_data["platforms"]),
+                                   coins=list(level_data["coins"])))
+    
+    def sync_world(self):
+        """Point platforms and coins at the chunks currently around the player"""
+        self.platforms, self.platform_colors, self.coins = self.world.active_level()
+        self.moving_platforms = []
+        self.hazard_specs = []
+        self.instances = None
+        self.rebuild_level_index()
+    
+    def coins_remaining(self):
+        if self.world:
+            return self.world.coins_remaining
+        return len(self.coins)
+    
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 return False
+            elif event.type == pygame.VIDEORESIZE:
+                # SDL resizes the GL surface itself; only the viewport and targets follow
+                self.renderer.resize(max(event.w, 1), max(event.h, 1))
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     if self.game_state == "playing":
@@ -669,6 +937,21 @@ class Game:
                 elif event.key == pygame.K_c:
                     # Display controller information
                     self.display_controller_info()
+                elif event.key == pygame.K_F3:
+                    self.stats.toggle_reporting()
+                elif event.key == pygame.K_F4:
+                    print(self.net.report() if self.net else "Not networked (--host or --connect)")
+                elif event.key == pygame.K_F9:
+                    self.profiler.toggle()
+                elif event.key == pygame.K_F10:
+                    self.memory.report()
+                elif event.key == pygame.K_g:
+                    self.ghosts_enabled = not self.ghosts_enabled
+                    print(f"Ghosts: {'ON' if self.ghosts_enabled else 'OFF'}")
+                elif event.key == pygame.K_l:
+                    self.lod_enabled = not self.lod_enabled
+                    self.renderer.set_fog(self.view_settings, self.lod_enabled)
+                    print(f"Level of detail: {'ON' if self.lod_enabled else 'OFF'}")
                 elif event.key == pygame.K_v:
                     # Reset camera to default position
                     self.camera_yaw = 0.0
@@ -722,7 +1005,7 @@ class Game:
                                 self.load_level(self.level - 1)
                                 print(f"Switched to level {self.level}")
                         elif event.button == 7:  # R1/RB - next level  
-                            if self.level < 5:
+                            if self.level < self.level_count:
                                 self.load_level(self.level + 1)
                                 print(f"Switched to level {self.level}")
                     
@@ -739,99 +1022,85 @@ class Game:
             elif event.type == pygame.JOYDEVICEREMOVED:
                 print("🎮 Controller disconnected!")
                 self.joystick = None
+                self.input.set_joystick(None)
         
-        # Movement and jump - continuous input checking for both keyboard and controller
-        if self.game_state == "playing":
-            # Keyboard input
-            keys = pygame.key.get_pressed()
-            move_dir = [0, 0]
-            
-            if keys[pygame.K_w] or keys[pygame.K_UP]:
-                move_dir[1] -= 1
-            if keys[pygame.K_s] or keys[pygame.K_DOWN]:
-                move_dir[1] += 1
-            if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-                move_dir[0] -= 1
-            if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-                move_dir[0] += 1
-            
-            # Controller input
-            if self.joystick:
-                try:
-                    # Left analog stick input (movement)
-                    if self.joystick.get_numaxes() >= 2:
-                        stick_x = self.joystick.get_axis(0)  # Left stick X
-                        stick_y = self.joystick.get_axis(1)  # Left stick Y
-                        
-                        # Apply deadzone
-                        deadzone = 0.15
-                        if abs(stick_x) > deadzone:
-                            move_dir[0] += stick_x
-                        if abs(stick_y) > deadzone:
-                            move_dir[1] += stick_y
-                    
-                    # D-pad input (movement)
-                    if self.joystick.get_numhats() >= 1:
-                        hat_x, hat_y = self.joystick.get_hat(0)
-                        move_dir[0] += hat_x
-                        move_dir[1] -= hat_y  # Invert Y for intuitive movement
-                    
-                    # Face buttons for jumping (continuous check for held buttons)
-                    if (self.joystick.get_button(0) or  # A
-                        self.joystick.get_button(1) or  # B  
-                        self.joystick.get_button(2) or  # X
-                        self.joystick.get_button(3)):   # Y
-                        self.player.jump(self.sound_manager, self.particles)
-                        
-                except Exception as e:
-                    print(f"Controller input error: {e}")
-            
-            # Keyboard jump input
-            space_pressed = (keys[pygame.K_SPACE] or 
-                           keys[pygame.K_LSHIFT] or keys[pygame.K_RSHIFT])
-            
-            if space_pressed:
-                self.player.jump(self.sound_manager, self.particles)
-            
-            # Normalize movement direction
-            if move_dir[0] != 0 or move_dir[1] != 0:
-                length = math.sqrt(move_dir[0]**2 + move_dir[1]**2)
-                move_dir[0] /= length
-                move_dir[1] /= length
-                self.player.move(move_dir)
-        
+        # Movement and jump - one snapshot of keyboard and controller per frame
+        self.last_input = self.input.sample(pygame.key.get_pressed())
         return True
     
+    def apply_input(self, snapshot):
+        """Turn an input snapshot into player movement (once per update)"""
+        self.applied_input_time = snapshot.time
+        if self.game_state == "playing":
+            if self.net and not self.net.authoritative:
+                snapshot = quantize_input(snapshot)  # Predict with exactly what the host will get
+            self.player.control(snapshot.move_x, snapshot.move_z, snapshot.jump, self.sound_manager, self.particles)
+    
+    def build_snapshot(self, tick=0, copy=False):
+        """Everything render() needs. With copy=True nothing in it is shared with live state."""
+        if copy:
+            # Coins only ever get removed or replaced, so an unchanged list keeps its frozen copy
+            if self._coins_source is not self.coins or len(self._coins_frozen) != len(self.coins):
+                self._coins_source = self.coins
+                self._coins_frozen = tuple(tuple(coin) for coin in self.coins)
+            coins = self._coins_frozen
+            # Moving platforms replace their rows each tick, so a shallow copy is enough
+            platforms = list(self.platforms) if self.movers else self.platforms
+        else:
+            coins = self.coins
+            platforms = self.platforms
+        return FrameSnapshot(
+            tick=tick,
+            time=time.perf_counter(),
+            input_time=self.applied_input_time,
+            game_state=self.game_state,
+            player=self.player.pose(),
+            platforms=platforms,
+            platform_colors=self.platform_colors,
+            lod=self.lod,
+            bvh=self.bvh,
+            batches=self.platform_batches,
+            coins=coins,
+            coin_rotation=self.coin_rotation,
+            ghosts=self.ghosts,
+            hazards=self.hazards.frame() if self.hazards else None,
+            peers=tuple(self.net.peers()) if self.net else (),
+            level_ticks=self.level_ticks,
+            particles=self.particles.snapshot(),
+            score=self.score,
+            lives=self.lives,
+            level=self.level,
+            coins_remaining=self.coins_remaining(),
+        )
+    
     def update(self, dt):
+        if self.preview:
+            self.sync_preview()
         if self.game_state == "playing":
-            # Handle right stick camera input (moved here where dt is available)
-            if self.joystick:
-                try:
-                    if self.joystick.get_numaxes() >= 4:
-                        right_stick_x = self.joystick.get_axis(2)  # Right stick X
-                        right_stick_y = self.joystick.get_axis(3)  # Right stick Y
-                        
-                        # Apply deadzone and sensitivity
-                        camera_deadzone = 0.1
-                        if abs(right_stick_x) > camera_deadzone:
-                            self.camera_yaw += right_stick_x * self.camera_sensitivity * dt
-                            print(f"Camera yaw: {self.camera_yaw:.1f}° (stick: {right_stick_x:.2f})")
-                        if abs(right_stick_y) > camera_deadzone:
-                            self.camera_pitch += right_stick_y * self.camera_sensitivity * dt
-                            print(f"Camera pitch: {self.camera_pitch:.1f}° (stick: {right_stick_y:.2f})")
-                        
-                        # Clamp pitch to prevent camera flipping
-                        self.camera_pitch = max(-80.0, min(80.0, self.camera_pitch))
-                        
-                except Exception as e:
-                    print(f"Camera input error: {e}")
+            # Stream world chunks in and out around the player
+            if self.world and self.world.update(self.player.x, self.player.z):
+                self.sync_world()
+            
+            # Moving platforms follow the tick count, so ghosts line up with them
+            if self.movers:
+                self.movers.step(self.level_ticks, self.platforms, self.collision_grid)
+                self.lod.move(self.movers.indices, self.movers.position)
+                self.bvh.move(self.movers.indices, self.movers.position)
+            if self.hazards:
+                self.hazards.step(self.level_ticks)
             
             # Update player
-            took_damage = self.player.update(self.platforms, dt, self.sound_manager, self.particles)
+            took_damage = self.player.update(self.platforms, dt, self.sound_manager, self.particles,
+                                             self.collision_grid, self.movers, self.hazards)
+            self.recorder.record(self.player.x, self.player.y, self.player.z, self.player.squash)
+            self.level_ticks += 1
             
             if took_damage:
-                self.lives -= 1
                 self.sound_manager.play_death()
+            # A network client's lives, score and coins are whatever the host says
+            authoritative = self.net is None or self.net.authoritative
+            if took_damage and authoritative:
+                self.lives -= 1
                 print(f"Life lost! Lives remaining: {self.lives}")
                 if self.lives <= 0:
                     print(f"Game Over! Final Score: {self.score}")
@@ -847,33 +1116,59 @@ class Game:
             self.coin_rotation += 120 * dt
             
             # Check coin collection
-            for coin in self.coins[:]:
-                coin_x, coin_y, coin_z = coin
-                distance = math.sqrt((self.player.x - coin_x)**2 + 
-                                   (self.player.y - coin_y)**2 + 
-                                   (self.player.z - coin_z)**2)
-                if distance < 0.4:
-                    self.coins.remove(coin)
-                    self.score += 100
-                    self.sound_manager.play_coin()
-                    self.particles.emit(coin_x, coin_y, coin_z, YELLOW, 12)
-                    print(f"Coin collected! Score: {self.score}")
+            if authoritative:
+                self.collect_coins(self.player)
             
             # Check level completion
-            if len(self.coins) == 0:
+            if authoritative and self.coins_remaining() == 0:
                 level_bonus = 500 * self.level
                 self.score += level_bonus
                 print(f"Level {self.level} Complete! Bonus: {level_bonus}")
+                if not self.preview and self.recorder.save(self.ghost_key, self.max_ghosts):
+                    print(f"👻 Run saved as a ghost ({self.level_ticks / 60:.2f}s)")
                 # Auto-advance to next level
                 self.next_level()
-            
-            # Update camera
-            self.update_camera()
+        
+        # Sounds asked for during the tick start together, heard from the camera
+        self.sound_manager.update((self.camera_x, self.camera_y, self.camera_z),
+                                  (self.player.x, self.player.y, self.player.z))
+        if self.music:
+            self.music.pump()
+        if self.net:
+            self.net.update(dt)
     
-    def update_camera(self):
-        # Debug output
-        print(f"Camera angles - Yaw: {self.camera_yaw:.1f}°, Pitch: {self.camera_pitch:.1f}°")
+    def collect_coins(self, player):
+        """Take the coins `player` touches"""
+        for coin in self.coins[:]:
+            coin_x, coin_y, coin_z = coin
+            distance = math.sqrt((player.x - coin_x)**2 + 
+                               (player.y - coin_y)**2 + 
+                               (player.z - coin_z)**2)
+            if distance < 0.4:
+                self.coins.remove(coin)
+                if self.world:
+                    self.world.collect(coin)
+                self.score += 100
+                self.sound_manager.play_coin((coin_x, coin_y, coin_z))
+                self.particles.emit(coin_x, coin_y, coin_z, YELLOW, 12)
+                print(f"Coin collected! Score: {self.score}")
+    
+    def latch_camera(self, pose, bvh):
+        """Late-latch the right stick just before drawing so the view uses the freshest input"""
+        if self.joystick:
+            pygame.event.pump()
+        stick_x, stick_y, now = self.input.sample_camera()
+        dt = min(now - self.camera_latch_time, 1/30.0)
+        self.camera_latch_time = now
         
+        self.camera_yaw += stick_x * self.camera_sensitivity * dt
+        self.camera_pitch += stick_y * self.camera_sensitivity * dt
+        # Clamp pitch to prevent camera flipping
+        self.camera_pitch = max(-80.0, min(80.0, self.camera_pitch))
+        
+        self.update_camera(pose, dt, bvh)
+    
+    def update_camera(self, pose, dt, bvh):
         # Calculate camera position based on rotation angles
         # Convert degrees to radians
         yaw_rad = math.radians(self.camera_yaw)
@@ -888,165 +1183,113 @@ class Game:
         camera_offset_y = self.camera_distance * math.sin(pitch_rad)
         
         # Position camera relative to player
-        target_camera_x = self.player.x + camera_offset_x
-        target_camera_y = self.player.y + camera_offset_y + 2.0  # Offset up from player center
-        target_camera_z = self.player.z + camera_offset_z
-        
-        # Debug output
-        print(f"Target camera pos: ({target_camera_x:.1f}, {target_camera_y:.1f}, {target_camera_z:.1f})")
+        target_camera_x = pose.x + camera_offset_x
+        target_camera_y = pose.y + camera_offset_y + 2.0  # Offset up from player center
+        target_camera_z = pose.z + camera_offset_z
         
-        # Smooth camera movement (optional - can be made instant for more responsive feel)
-        smooth_factor = 0.15
+        # Smooth camera movement, by elapsed time so the lag is the same at any frame rate
+        smooth_factor = 1.0 - math.exp(-CAMERA_SMOOTHING * dt)
         self.camera_x += (target_camera_x - self.camera_x) * smooth_factor
         self.camera_y += (target_camera_y - self.camera_y) * smooth_factor
         self.camera_z += (target_camera_z - self.camera_z) * smooth_factor
         
-        print(f"Actual camera pos: ({self.camera_x:.1f}, {self.camera_y:.1f}, {self.camera_z:.1f})")
+        # Pull in in front of platforms between the player and the camera; the
+        # smoothing above then eases back out once the view is clear
+        offset = (self.camera_x - pose.x, self.camera_y - pose.y, self.camera_z - pose.z)
+        distance = math.sqrt(offset[0]**2 + offset[1]**2 + offset[2]**2)
+        hit = bvh.sweep_sphere((pose.x, pose.y, pose.z), offset, CAMERA_RADIUS, distance)
+        if hit:
+            pull = hit[0] / distance
+            self.camera_x = pose.x + offset[0] * pull
+            self.camera_y = pose.y + offset[1] * pull
+            self.camera_z = pose.z + offset[2] * pull
     
-    def render(self):
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glLoadIdentity()
-        
-        if self.game_state in ["playing", "paused"]:
-            self.render_game()
-            if self.game_state == "paused":
-                self.render_pause()
-        elif self.game_state == "level_complete":
-            self.render_game()  # Show game while transitioning
-        
-        pygame.display.flip()
-    
-    def render_game(self):
-        # Set camera
-        gluLookAt(
-            self.camera_x, self.camera_y, self.camera_z,
-            self.player.x, self.player.y, self.player.z,
-            0, 1, 0
-        )
-        
-        # Draw platforms
-        for i, platform in enumerate(self.platforms):
-            draw_platform(*platform, self.platform_colors[i])
+    def render(self, snapshot):
+        """Draw one FrameSnapshot; reads no live game state besides the camera"""
+        # The snapshot shares the LOD and BVH with the simulation, which moves
+        # platforms in them in place; hold the lock while reading, not while drawing
+        with self.lock:
+            if snapshot.game_state == "playing":
+                self.latch_camera(snapshot.player, snapshot.bvh)
+            
+            scene = None
+            if snapshot.game_state in ["playing", "paused", "level_complete"]:
+                scene = self.build_scene(snapshot)  # level_complete shows the game while transitioning
+        self.renderer.render(scene)
+        # With vsync, flip() blocks until the next refresh; that wait isn't work
+        self.work_done = time.perf_counter()
+        if self.renderer.presents:
+            self.present()
         
-        # Draw coins
-        for coin in self.coins:
-            draw_coin(coin[0], coin[1], coin[2], self.coin_rotation)
+        # Input-to-photon proxy: how old the inputs were when the frame was presented
+        if snapshot.game_state == "playing":
+            flip_time = time.perf_counter()
+            if snapshot.input_time:
+                self.stats.record("input_to_flip_ms", (flip_time - snapshot.input_time) * 1000.0)
+            self.stats.record("camera_to_flip_ms", (flip_time - self.camera_latch_time) * 1000.0)
+            self.stats.record("snapshot_age_ms", (flip_time - snapshot.time) * 1000.0)
+    
+    def build_scene(self, snapshot):
+        """Describe what should be on screen this frame for the renderer"""
+        player = snapshot.player
+        platforms, platform_colors = snapshot.platforms, snapshot.platform_colors
+        quality = self.quality.current
         
-        # Draw player
-        self.player.draw()
+        # Platforms, thinned out by level of detail; prefab instances are picked whole
+        lod = snapshot.lod
+        table = lod.instances if lod else None
+        static = None
+        if self.lod_enabled and lod:
+            outlined, faces_only, impostors = lod.select(self.camera_x, self.camera_y, self.camera_z)
+            # Static platforms are drawn from the level's vertex arrays; what's left moves
+            static, outlined, faces_only = snapshot.batches.select(outlined, faces_only, quality.outlines)
+            draws = [(platforms[i], platform_colors[i], quality.outlines) for i in outlined]
+            draws += [(platforms[i], platform_colors[i], False) for i in faces_only]
+            draws += [(box, color, False) for box, color in impostors]
+            instance_outlined, instance_faces = lod.select_instances(self.camera_x, self.camera_y, self.camera_z)
+        else:
+            loose = range(len(platforms))
+            if lod:
+                static = snapshot.batches.select_all(quality.outlines)
+                loose = np.flatnonzero((snapshot.batches.row < 0) & ~lod.instanced).tolist()
+            draws = [(platforms[i], platform_colors[i], quality.outlines) for i in loose]
+            instance_outlined, instance_faces = (list(range(len(table))) if table else []), []
+        instances = []
+        if table is not None:
+            position, rotation = table.position.tolist(), table.rotation.tolist()
+            instances = [(table.prefab[i], position[i], rotation[i], table.color[i], quality.outlines)
+                         for i in instance_outlined]
+            instances += [(table.prefab[i], position[i], rotation[i], table.color[i], False)
+                          for i in instance_faces]
         
-        # Draw shadow
-        draw_shadow(self.player.x, self.player.y, self.player.z, self.platforms, self.player.on_ground)
+        hazards = snapshot.hazards
+        if self.lod_enabled:
+            hazards = visible_hazards(hazards, (self.camera_x, self.camera_y, self.camera_z),
+                                      (player.x, player.y, player.z), self.view_settings.draw_distance)
         
-        # Draw particles
-        self.particles.draw()
+        shadow = None
+        if quality.shadow_segments:
+            shadow = shadow_params(player.x, player.y, player.z, snapshot.bvh, player.on_ground)
         
-        # Draw HUD
-        self.render_hud()
-    
-    def render_hud(self):
-        # Switch to 2D
-        glMatrixMode(GL_PROJECTION)
-        glPushMatrix()
-        glLoadIdentity()
-        glOrtho(0, display_width, 0, display_height, -1, 1)
-        glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-        glLoadIdentity()
-        
-        glDisable(GL_DEPTH_TEST)
-        glDisable(GL_LIGHTING)
-        
-        # Score bar (white)
-        glColor3f(1, 1, 1)
-        score_width = min(200, self.score // 10)
-        glBegin(GL_QUADS)
-        glVertex2f(10, display_height - 40)
-        glVertex2f(10 + score_width, display_height - 40)
-        glVertex2f(10 + score_width, display_height - 30)
-        glVertex2f(10, display_height - 30)
-        glEnd()
-        
-        # Lives (red squares)
-        glColor3f(1, 0, 0)
-        for i in range(self.lives):
-            x = 230 + i * 25
-            glBegin(GL_QUADS)
-            glVertex2f(x, display_height - 40)
-            glVertex2f(x + 20, display_height - 40)
-            glVertex2f(x + 20, display_height - 20)
-            glVertex2f(x, display_height - 20)
-            glEnd()
-        
-        # Coins remaining (yellow circles)
-        glColor3f(1, 1, 0)
-        for i in range(min(len(self.coins), 10)):
-            x = 350 + i * 15
-            glBegin(GL_POLYGON)
-            for angle in range(0, 360, 30):
-                rad = math.radians(angle)
-                glVertex2f(x + 6 + 5 * math.cos(rad), display_height - 30 + 5 * math.sin(rad))
-            glEnd()
-        
-        # Level indicator (blue bar)
-        glColor3f(0, 0, 1)
-        glBegin(GL_QUADS)
-        glVertex2f(display_width - 80, display_height - 40)
-        glVertex2f(display_width - 80 + self.level * 30, display_height - 40)
-        glVertex2f(display_width - 80 + self.level * 30, display_height - 30)
-        glVertex2f(display_width - 80, display_height - 30)
-        glEnd()
-        
-        # Restore 3D
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_LIGHTING)
-        glPopMatrix()
-        glMatrixMode(GL_PROJECTION)
-        glPopMatrix()
-        glMatrixMode(GL_MODELVIEW)
-    
-    def render_pause(self):
-        # Pause overlay
-        glMatrixMode(GL_PROJECTION)
-        glPushMatrix()
-        glLoadIdentity()
-        glOrtho(0, display_width, 0, display_height, -1, 1)
-        glMatrixMode(GL_MODELVIEW)
-        glPushMatrix()
-        glLoadIdentity()
-        
-        glDisable(GL_DEPTH_TEST)
-        glDisable(GL_LIGHTING)
-        
-        # Semi-transparent overlay
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glColor4f(0, 0, 0, 0.5)
-        glBegin(GL_QUADS)
-        glVertex2f(0, 0)
-        glVertex2f(display_width, 0)
-        glVertex2f(display_width, display_height)
-        glVertex2f(0, display_height)
-        glEnd()
-        glDisable(GL_BLEND)
-        
-        # Pause text
-        glColor3f(1, 1, 1)
-        for i in range(6):
-            x = display_width//2 - 60 + i * 20
-            glBegin(GL_QUADS)
-            glVertex2f(x, display_height//2)
-            glVertex2f(x + 15, display_height//2)
-            glVertex2f(x + 15, display_height//2 + 30)
-            glVertex2f(x, display_height//2 + 30)
-            glEnd()
-        
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_LIGHTING)
-        glPopMatrix()
-        glMatrixMode(GL_PROJECTION)
-        glPopMatrix()
-        glMatrixMode(GL_MODELVIEW)
+        return Scene(
+            camera=(self.camera_x, self.camera_y, self.camera_z),
+            target=(player.x, player.y, player.z),
+            platforms=draws,
+            static=static,
+            instances=instances,
+            coins=snapshot.coins,
+            coin_rotation=snapshot.coin_rotation,
+            player=player,
+            peers=snapshot.peers,
+            hazards=hazards,
+            ghosts=snapshot.ghosts if self.ghosts_enabled else None,
+            ghost_tick=snapshot.level_ticks,
+            shadow=shadow,
+            particles=snapshot.particles,
+            hud=(snapshot.score, snapshot.lives, snapshot.coins_remaining, snapshot.level),
+            paused=snapshot.game_state == "paused",
+            quality=quality,
+        )
     
     def display_controller_info(self):
         """Display detailed controller information for debugging"""
@@ -1120,13 +1363,13 @@ class Game:
         print(f"Level {self.level} restarted")
     
     def next_level(self):
-        if self.level < 5:
+        if self.level < self.level_count:
             self.level += 1
             self.load_level(self.level)
             self.game_state = "playing"
             print(f"Starting Level {self.level}")
         else:
-            print("🎉 CONGRATULATIONS! You completed ALL 5 levels! 🎉")
+            print(f"🎉 CONGRATULATIONS! You completed ALL {self.level_count} levels! 🎉")
             print(f"Final Score: {self.score}")
             self.save_system.update_high_score(self.score)
             # Restart from level 1 for replay
@@ -1137,43 +1380,81 @@ class Game:
     
     def run(self):
         running = True
+        if self.sim:
+            self.sim.start()
+        if self.music:
+            self.music.start()
+        if self.profiler.install_signal():
+            print(f"Profile capture: F9 or kill -USR1 {os.getpid()}")
+        started = time.perf_counter()
+        frames = 0
         
         while running:
-            current_time = pygame.time.get_ticks()
-            dt = (current_time - self.last_time) / 1000.0
-            self.last_time = current_time
-            dt = min(dt, 1/30.0)  # Cap delta time
-            
-            running = self.handle_events()
-            self.update(dt)
-            self.render()
-            
-            self.clock.tick(60)
+            running = self.frame()
+            frames += 1
         
+        if self.sim:
+            self.sim.stop()
+        if self.music:
+            self.music.stop()
+        if self.net:
+            self.net.close()
+        self.profiler.stop()  # Keep a capture that was still running
+        if not self.renderer.presents:
+            elapsed = time.perf_counter() - started
+            print(f"{frames} frames in {elapsed:.1f}s: {frames / max(elapsed, 1e-9):.0f} frames/s without rendering")
         pygame.quit()
+    
+    def frame(self):
+        """One pass of the main loop: events, simulation, drawing and pacing. Returns False to quit."""
+        dt = self.pacer.begin_frame()
+        
+        with self.lock:
+            running = self.handle_events()
+        if self.sim:
+            # The simulation thread picks this up on its next tick
+            self.sim.submit_input(self.last_input)
+            snapshot = self.sim.buffer.latest()
+        else:
+            with self.stats.timer("update_ms"):
+                self.simulate(dt)
+            snapshot = self.build_snapshot()
+            # Draw the player where it is between the last two steps, so faster displays still see smooth motion
+            snapshot = snapshot._replace(player=blend_poses(self.previous_pose, snapshot.player,
+                                                            self.stepper.alpha))
+        with self.stats.timer("render_ms"):
+            self.render(snapshot)
+        
+        # The governor judges the frame's work, not the time spent waiting in flip() or for the next frame
+        if self.game_state == "playing" and self.quality.observe((self.work_done - self.pacer.last_frame) * 1000.0):
+            with self.lock:
+                self.apply_quality()
+        self.pacer.end_frame(paused=self.game_state == "paused")
+        self.stats.end_frame()
+        return running
+    
+    def simulate(self, dt):
+        """Run the fixed 60 Hz steps that `dt` seconds of frame time have paid for"""
+        for _ in range(self.stepper.advance(dt)):
+            self.previous_pose = self.player.pose()
+            self.apply_input(self.last_input)
+            self.update(self.stepper.step)
 
-def draw_shadow(player_x, player_y, player_z, platforms, player_on_ground, shadow_size=0.3):
+def shadow_params(player_x, player_y, player_z, bvh, player_on_ground, shadow_size=0.3):
+    """Where to draw the blob shadow: (x, y, z, size, opacity), or None for no shadow"""
     # Only draw shadow when player is in the air
     if player_on_ground:
-        return
+        return None
     
-    # Find the highest platform below the player
-    ground_y = -10  # Default very low ground
-    for platform in platforms:
-        px, py, pz, pw, ph, pd = platform[:6]
-        
-        # Check if player is above this platform (within x,z bounds)
-        if (abs(player_x - px) < pw/2 + 0.5 and 
-            abs(player_z - pz) < pd/2 + 0.5 and 
-            py + ph/2 < player_y):  # Platform is below player
-            
-            # This platform is below the player, update ground level
-            ground_y = max(ground_y, py + ph/2)
+    # Find the highest platform below the player (within half a unit of its x,z bounds)
+    ground_y = bvh.highest_below(player_x, player_y, player_z, margin=0.5)
+    if ground_y is None or ground_y < -10:
+        ground_y = -10  # Default very low ground
     
     # Calculate shadow opacity based on height above ground
     height_above_ground = player_y - ground_y
     if height_above_ground < 0.1:  # Too close to ground
-        return
+        return None
         
     max_height = 3.0
     opacity = max(0.3, min(0.8, 1.0 - (height_above_ground / max_height)))
@@ -1182,37 +1463,55 @@ def draw_shadow(player_x, player_y, player_z, platforms, player_on_ground, shado
     shadow_scale = min(1.5, 1.0 + height_above_ground * 0.2)
     actual_shadow_size = shadow_size * shadow_scale
     
-    glPushMatrix()
-    glTranslatef(player_x, ground_y + 0.01, player_z)  # Slightly above the ground/platform
-    
-    # Disable lighting for shadow
-    glDisable(GL_LIGHTING)
-    glEnable(GL_BLEND)
-    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-    
-    # Dark gray shadow with opacity
-    glColor4f(0.1, 0.1, 0.1, opacity)
-    
-    # Draw shadow as a simple circle made of triangles
-    glBegin(GL_TRIANGLE_FAN)
-    glVertex3f(0, 0, 0)  # Center
-    segments = 12
-    for i in range(segments + 1):
-        angle = (i / segments) * 2 * math.pi
-        x = actual_shadow_size * math.cos(angle)
-        z = actual_shadow_size * math.sin(angle)
-        glVertex3f(x, 0, z)
-    glEnd()
-    
-    # Re-enable lighting and disable blend
-    glDisable(GL_BLEND)
-    glEnable(GL_LIGHTING)
-    glPopMatrix()
+    # Slightly above the ground/platform
+    return (player_x, ground_y + 0.01, player_z, actual_shadow_size, opacity)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Enhanced 3D Platformer")
+    parser.add_argument("--pacing", choices=PACING_MODES, default="capped",
+                        help="vsync, capped (hybrid sleep+spin) or uncapped for benchmarks")
+    parser.add_argument("--fps", type=int, default=60, help="Frame cap in capped mode")
+    parser.add_argument("--sim-thread", action="store_true",
+                        help="Run the simulation on its own thread; the main loop only renders")
+    parser.add_argument("--sim-rate", type=int, default=60, help="Simulation ticks per second with --sim-thread")
+    parser.add_argument("--ghosts", type=int, default=20, help="How many of the fastest recorded runs to race (0 disables)")
+    parser.add_argument("--renderer", choices=tuple(RENDERERS), default="batched",
+                        help="batched (state-sorted queue), immediate, or null to measure game logic alone")
+    parser.add_argument("--quality", choices=QUALITY_MODES, default="auto",
+                        help="auto adapts the detail to hold the frame rate; or fix a tier")
+    parser.add_argument("--width", type=int, default=display_width, help="Initial window width")
+    parser.add_argument("--height", type=int, default=display_height, help="Initial window height")
+    parser.add_argument("--memory", action="store_true",
+                        help="Trace allocations and flag levels that grow across load cycles (slower)")
+    parser.add_argument("--preview", nargs="?", const=PREVIEW_NAME,
+                        help="Play the level open in the 2D editor, following its edits live")
+    parser.add_argument("--pack", help="Level pack to play (see level_pack.py); level N is its Nth entry")
+    parser.add_argument("--render-scale", type=parse_render_scale, default=1.0,
+                        help="3D resolution as a fraction of the window (0.25-1.0), or auto to follow the quality tier")
+    parser.add_argument("--audio-buffer", type=int, default=DEFAULT_BUFFER,
+                        help="Mixer buffer in samples; smaller means lower sound latency and more CPU")
+    parser.add_argument("--voices", type=int, default=DEFAULT_VOICES, help="Sound effects that can play at once")
+    parser.add_argument("--no-music", action="store_true", help="Leave out the background music")
+    parser.add_argument("--host", type=int, nargs="?", const=DEFAULT_PORT, metavar="PORT",
+                        help="Host a network game on this UDP port (see netcode.py)")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="Join a network game")
+    parser.add_argument("--net-loss", type=float, default=0.0,
+                        help="Simulate losing this fraction of outgoing packets (0-1)")
+    parser.add_argument("--net-latency", type=float, default=0.0, help="Simulate this much one-way delay, in ms")
+    return parser.parse_args()
 
 # Run the game
 if __name__ == "__main__":
+    args = parse_args()
+    display_width, display_height = args.width, args.height
     try:
-        game = Game()
+        init_display(vsync=args.pacing == "vsync", opengl=args.renderer != "null")
+        game = Game(pacing=args.pacing, target_fps=args.fps,
+                    sim_rate=args.sim_rate if args.sim_thread else None, max_ghosts=args.ghosts,
+                    renderer=args.renderer, quality=args.quality, render_scale=args.render_scale, pack=args.pack,
+                    memory=args.memory, preview=args.preview, audio_buffer=args.audio_buffer, voices=args.voices,
+                    music=not args.no_music, host=args.host, connect=args.connect,
+                    net_loss=args.net_loss, net_latency=args.net_latency / 1000.0)
         game.run()
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,284 @@
+"""
+Pooled sound effect mixing for the 3D Platformer.
+
+SoundManager used to call Sound.play() for every request. Holding a jump
+button re-triggers the jump sound every frame, and a chain of coins fires
+bursts of the coin sound. Each of those took a mixer channel of its own.
+AudioEngine puts a budget on that:
+
+    channel pool    a fixed number of pygame.mixer.Channels, owned by the
+                    engine. When all are busy, a new sound takes the voice
+                    with the lowest priority, the oldest among equals, but
+                    only if that voice's priority is not higher than its own
+    retrigger       each sound has a minimum interval between starts, so
+                    requests arriving faster than that are dropped
+    spatial         sounds with a position are attenuated by distance from
+                    the listener (the camera) and panned left/right by
+                    equal power. Requests queue up during a tick, and
+                    update() works out the gains of all queued and playing
+                    positional voices in one numpy pass
+    latency         the mixer buffer size is a parameter (--audio-buffer);
+                    smaller buffers cut latency at some CPU cost. pygame.init()
+                    has already opened the mixer at its defaults by then, and
+                    the buffer is only read when the mixer opens, so the
+                    engine closes and reopens it
+
+Voices are tracked by their own start and end times rather than by asking
+SDL, so the engine behaves the same with the dummy audio driver. To stress
+it without a sound device:
+
+    python audio_engine.py stress --seconds 10 --voices 8
+"""
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+DEFAULT_VOICES = 8
+DEFAULT_BUFFER = 512
+REFERENCE_DISTANCE = 4.0   # Full volume up to here
+MAX_DISTANCE = 40.0        # Silent from here on
+AUDIBLE_GAIN = 0.02        # Quieter requests aren't worth a voice
+
+
+class AudioEngine:
+    def __init__(self, voices=DEFAULT_VOICES, frequency=22050, buffer=DEFAULT_BUFFER, stats=None,
+                 clock=time.perf_counter):
+        import pygame
+        self.pygame = pygame
+        self.stats = stats
+        self.clock = clock
+        self.enabled = False
+        try:
+            if pygame.mixer.get_init():
+                pygame.mixer.quit()  # Opened by pygame.init() at the default buffer; init() again is a no-op
+            pygame.mixer.init(frequency=frequency, size=-16, channels=2, buffer=buffer)
+            # Channels beyond the pool stay free for music and anything else
+            pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), voices))
+            self.channels = [pygame.mixer.Channel(i) for i in range(voices)]
+            self.enabled = True
+        except Exception as e:
+            print(f"Sound disabled: {e}")
+            self.channels = []
+        self.buffer = 1 << max(buffer - 1, 0).bit_length()  # pygame rounds up to a power of two
+        # SDL may open the device at another rate; sounds have to be made at the one it got
+        init = pygame.mixer.get_init()
+        self.frequency = init[0] if init else frequency
+
+        # Sounds, by id
+        self.names = {}
+        self.sounds = []
+        self.priority = np.zeros(0, dtype=np.int64)
+        self.min_interval = np.zeros(0)
+        self.volume = np.zeros(0)
+        self.length = np.zeros(0)
+        self.last_start = np.zeros(0)
+
+        # Voices, one per pooled channel
+        n = len(self.channels)
+        self.voice_sound = np.full(n, -1, dtype=np.int64)
+        self.voice_priority = np.zeros(n, dtype=np.int64)
+        self.voice_start = np.zeros(n)
+        self.voice_end = np.zeros(n)
+        self.voice_position = np.zeros((n, 3))
+        self.voice_positional = np.zeros(n, dtype=bool)
+
+        self.pending = []  # (sound id, position or None, time) since the last update()
+        self.listener = np.zeros(3)
+        self.right = np.array([1.0, 0.0, 0.0])
+        self.counts = {"played": 0, "throttled": 0, "stolen": 0, "dropped": 0, "inaudible": 0}
+
+    @property
+    def latency_ms(self):
+        """Delay added by one mixer buffer, at the rate the mixer is actually running"""
+        init = self.pygame.mixer.get_init()
+        return self.buffer / init[0] * 1000.0 if init else 0.0
+
+    def register(self, name, sound, priority=0, min_interval=0.05, volume=1.0):
+        """Add a pygame Sound under `name`. Higher priority steals voices from lower."""
+        if sound is None:
+            return
+        self.names[name] = len(self.sounds)
+        self.sounds.append(sound)
+        self.priority = np.append(self.priority, priority)
+        self.min_interval = np.append(self.min_interval, min_interval)
+        self.volume = np.append(self.volume, volume)
+        self.length = np.append(self.length, sound.get_length())
+        self.last_start = np.append(self.last_start, -np.inf)
+
+    def play(self, name, position=None):
+        """Ask for a sound; it starts on the next update(). position=None plays it centered at full volume."""
+        sound = self.names.get(name)
+        if sound is None or not self.enabled:
+            return
+        now = self.clock()
+        if now - self.last_start[sound] < self.min_interval[sound]:
+            self._count("throttled")
+            return
+        self.last_start[sound] = now  # Throttles the rest of this burst too
+        self.pending.append((sound, position, now))
+
+    def set_listener(self, position, target):
+        """The camera position and the point it looks at; pan follows the camera's right vector"""
+        self.listener = np.asarray(position, dtype=np.float64)
+        forward = np.asarray(target, dtype=np.float64) - self.listener
+        right = np.array([-forward[2], 0.0, forward[0]])  # forward x up, in the ground plane
+        length = math.hypot(right[0], right[2])
+        if length > 1e-9:
+            self.right = right / length
+
+    def gains(self, positions):
+        """(left, right) gains for [n, 3] positions relative to the listener"""
+        offset = positions - self.listener
+        distance = np.sqrt((offset * offset).sum(axis=1))
+        gain = REFERENCE_DISTANCE / np.maximum(distance, REFERENCE_DISTANCE)
+        # Fade the inverse-distance curve out to nothing at MAX_DISTANCE
+        gain *= np.clip((MAX_DISTANCE - distance) / (MAX_DISTANCE - REFERENCE_DISTANCE), 0.0, 1.0)
+        pan = np.where(distance > 1e-9, (offset @ self.right) / np.maximum(distance, 1e-9), 0.0)
+        angle = (pan + 1.0) * (math.pi / 4)  # Equal power: -1 is all left, +1 all right
+        return gain * np.cos(angle) * math.sqrt(2), gain * np.sin(angle) * math.sqrt(2)
+
+    def update(self):
+        """Start queued sounds and re-pan playing ones; call once per tick"""
+        if not self.enabled:
+            return
+        now = self.clock()
+        self.voice_sound[self.voice_end <= now] = -1
+
+        # One pass for every positional voice, queued or playing
+        pending, self.pending = self.pending, []
+        positions = [position for _, position, _ in pending if position is not None]
+        playing = np.flatnonzero((self.voice_sound >= 0) & self.voice_positional)
+        if positions or len(playing):
+            left, right = self.gains(np.vstack([np.asarray(positions, dtype=np.float64).reshape(-1, 3),
+                                                self.voice_position[playing]]))
+            for k, voice in enumerate(playing.tolist(), start=len(positions)):
+                volume = self.volume[self.voice_sound[voice]]
+                self.channels[voice].set_volume(left[k] * volume, right[k] * volume)
+
+        # Highest priority first, so a burst can't steal from its own more important requests
+        k = 0
+        starts = []
+        for sound, position, requested in pending:
+            if position is None:
+                starts.append((sound, None, 1.0, 1.0, requested))
+            else:
+                starts.append((sound, position, left[k], right[k], requested))
+                k += 1
+        starts.sort(key=lambda start: -self.priority[start[0]])
+        for sound, position, gain_left, gain_right, requested in starts:
+            if max(gain_left, gain_right) < AUDIBLE_GAIN:
+                self._count("inaudible")
+                continue
+            voice = self._voice_for(sound, now)
+            if voice is None:
+                self._count("dropped")
+                continue
+            volume = self.volume[sound]
+            channel = self.channels[voice]
+            channel.play(self.sounds[sound])
+            channel.set_volume(gain_left * volume, gain_right * volume)
+            self.voice_sound[voice] = sound
+            self.voice_priority[voice] = self.priority[sound]
+            self.voice_start[voice] = now
+            self.voice_end[voice] = now + self.length[sound]
+            self.voice_positional[voice] = position is not None
+            if position is not None:
+                self.voice_position[voice] = position
+            self._count("played")
+            if self.stats:
+                self.stats.record("sound_queue_ms", (now - requested) * 1000.0)
+
+    def _voice_for(self, sound, now):
+        """A free voice, or the one to steal for `sound`, or None"""
+        free = np.flatnonzero(self.voice_sound < 0)
+        if len(free):
+            return int(free[0])
+        candidates = np.flatnonzero(self.voice_priority <= self.priority[sound])
+        if not len(candidates):
+            return None
+        order = np.lexsort((self.voice_start[candidates], self.voice_priority[candidates]))
+        voice = int(candidates[order[0]])
+        self.channels[voice].stop()
+        self._count("stolen")
+        return voice
+
+    @property
+    def active_voices(self):
+        return int((self.voice_sound >= 0).sum())
+
+    def _count(self, name):
+        self.counts[name] += 1
+        if self.stats:
+            self.stats.count(f"sound_{name}")
+
+    def stop(self):
+        for channel in self.channels:
+            channel.stop()
+        self.voice_sound[:] = -1
+        self.pending = []
+
+
+def stress(args):
+    """A held jump button, coin chains and footsteps from all around, for `seconds` of 60 Hz ticks"""
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+    pygame.init()
+
+    tick = [0]
+    engine = AudioEngine(voices=args.voices, buffer=args.buffer, clock=lambda: tick[0] / 60.0)
+    rate = engine.frequency
+    for name, frequency, duration, priority, interval in (("jump", 440, 0.1, 1, args.interval),
+                                                          ("coin", 880, 0.15, 2, args.interval / 2),
+                                                          ("death", 220, 0.3, 3, 0.5),
+                                                          ("step", 140, 0.05, 0, 0.0)):
+        t = np.arange(int(duration * rate)) / rate
+        wave = (np.sin(frequency * 2 * np.pi * t) * np.linspace(1, 0, len(t)) * 0.3 * 32767).astype(np.int16)
+        engine.register(name, pygame.sndarray.make_sound(np.column_stack([wave, wave])), priority, interval)
+
+    rng = np.random.default_rng(1)
+    engine.set_listener((0, 3, 6), (0, 1, 0))
+    elapsed = 0.0
+    ticks = int(args.seconds * 60)
+    for tick[0] in range(ticks):
+        engine.play("jump", (0, 1, 0))                      # Held button: every tick
+        if tick[0] % 90 < 20:
+            for _ in range(3):                              # Coin chains
+                engine.play("coin", rng.uniform(-10, 10, 3))
+        for _ in range(args.steps):                         # Ambient spam from everywhere
+            engine.play("step", rng.uniform(-60, 60, 3))
+        if tick[0] % 600 == 599:
+            engine.play("death")
+        start = time.perf_counter()
+        engine.update()
+        elapsed += time.perf_counter() - start
+
+    counts = engine.counts
+    requested = sum(counts.values())
+    print(f"{ticks} ticks, {requested} requests, {args.voices} voices, buffer {args.buffer} "
+          f"({engine.latency_ms:.1f} ms)")
+    for name, count in counts.items():
+        print(f"   {name:<10} {count:>7}")
+    print(f"   update()   {elapsed / ticks * 1000:7.3f} ms per tick")
+    pygame.quit()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sound effect mixing for the 3D Platformer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("stress", help="Spam the engine with requests (dummy audio driver unless SDL_AUDIODRIVER is set)")
+    s.add_argument("--seconds", type=float, default=10.0)
+    s.add_argument("--voices", type=int, default=DEFAULT_VOICES)
+    s.add_argument("--buffer", type=int, default=DEFAULT_BUFFER)
+    s.add_argument("--interval", type=float, default=0.08, help="Minimum retrigger interval of the jump sound")
+    s.add_argument("--steps", type=int, default=4, help="Positional requests per tick from all around")
+    args = parser.parse_args()
+    raise SystemExit(stress(args))
+
+
+if __name__ == "__main__":
+    main()
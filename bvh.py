@@ -0,0 +1,228 @@
+"""
+Bounding-volume hierarchy over platform boxes.
+
+PlatformBVH answers "what does this ray hit" and "what overlaps this box" in
+time logarithmic in the number of platforms. It is built once per level load:
+
+    1. static platforms are sorted along a Morton (Z-order) curve of their
+       centers, so neighbours in the list are neighbours in space
+    2. consecutive runs of LEAF_SIZE platforms become leaves
+    3. leaves are paired up into a complete binary tree stored as a heap
+       (children of node k are 2k+1 and 2k+2), with bounds reduced in numpy
+
+Everything is arrays, so building a 100k-platform level takes about 0.1 s
+on one slow core once the boxes are in an array. Queries walk the tree one
+level at a time for a whole batch of rays or boxes at once: each level is a
+handful of numpy operations on the (query, node) pairs still alive. The single-query methods are batches of one.
+
+Moving platforms stay out of the tree. move() updates their boxes every tick,
+and every query checks them directly; levels have few of them.
+
+    bvh.raycast(origin, direction, max_distance)        -> (distance, index) or None
+    bvh.sweep_sphere(origin, direction, radius, max_distance)
+    bvh.query_box(lo, hi)                               -> platform indices
+    bvh.raycast_many / sweep_many / query_boxes         batched versions
+"""
+
+import numpy as np
+
+LEAF_SIZE = 8
+MORTON_BITS = 10  # Per axis, so codes fit in 30 bits
+
+
+def _spread_bits(v):
+    """Insert two zero bits between each of the low 10 bits of v"""
+    v = v.astype(np.uint64)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x030000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x0300F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x030C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x09249249)
+    return v
+
+
+def morton_codes(points):
+    """Z-order codes of [n, 3] points, quantized over their own bounds"""
+    lo = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lo, 1e-9)
+    q = ((points - lo) / extent * ((1 << MORTON_BITS) - 1)).astype(np.uint64)
+    return _spread_bits(q[:, 0]) << np.uint64(2) | _spread_bits(q[:, 1]) << np.uint64(1) | _spread_bits(q[:, 2])
+
+
+def _ray_slabs(origin, inv, lo, hi):
+    """Entry and exit distances of rays through boxes, all arrays of matching rows"""
+    t1 = (lo - origin) * inv
+    t2 = (hi - origin) * inv
+    return np.minimum(t1, t2).max(axis=1), np.maximum(t1, t2).min(axis=1)
+
+
+def _directions(directions):
+    """Unit directions and their reciprocals; axis components of 0 become tiny instead"""
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    length = np.sqrt((directions * directions).sum(axis=1))
+    unit = directions / np.where(length > 0, length, 1.0)[:, None]
+    safe = np.where(np.abs(unit) < 1e-12, np.copysign(1e-12, unit), unit)
+    return unit, 1.0 / safe, length
+
+
+class PlatformBVH:
+    def __init__(self, platforms, moving=()):
+        """platforms: level rows, or an [n, 6] array of (x, y, z, w, h, d) that is used as is"""
+        n = len(platforms)
+        if isinstance(platforms, np.ndarray):
+            p = platforms[:, :6]
+        else:
+            p = np.array([platform[:6] for platform in platforms], dtype=np.float64).reshape(n, 6)
+        # One extra row at infinity: padding slots point at it and never hit anything
+        self.lo = np.vstack([p[:, :3] - p[:, 3:6] / 2, np.full((1, 3), np.inf)])
+        self.hi = np.vstack([p[:, :3] + p[:, 3:6] / 2, np.full((1, 3), np.inf)])
+        self.half = p[:, 3:6] / 2
+        self.count = n
+
+        self.moving = np.array(sorted(set(int(i) for i in moving)), dtype=np.int64)
+        static = np.ones(n, dtype=bool)
+        static[self.moving] = False
+        static_ids = np.flatnonzero(static)
+        if len(static_ids):
+            centers = (self.lo[static_ids] + self.hi[static_ids]) / 2
+            static_ids = static_ids[np.argsort(morton_codes(centers), kind="stable")]
+
+        # Complete tree: the leaf count is padded to a power of two
+        leaves = max(1, -(-len(static_ids) // LEAF_SIZE))
+        self.depth = (leaves - 1).bit_length()
+        leaves = 1 << self.depth
+        self.items = np.full(leaves * LEAF_SIZE, n, dtype=np.int64)
+        self.items[:len(static_ids)] = static_ids
+
+        real = (self.items < n)[:, None]
+        item_lo = self.lo[self.items]
+        item_hi = np.where(real, self.hi[self.items], -np.inf)
+        levels_lo = [item_lo.reshape(leaves, LEAF_SIZE, 3).min(axis=1)]
+        levels_hi = [item_hi.reshape(leaves, LEAF_SIZE, 3).max(axis=1)]
+        while len(levels_lo[-1]) > 1:
+            levels_lo.append(levels_lo[-1].reshape(-1, 2, 3).min(axis=1))
+            levels_hi.append(levels_hi[-1].reshape(-1, 2, 3).max(axis=1))
+        self.node_lo = np.concatenate(levels_lo[::-1])
+        self.node_hi = np.concatenate(levels_hi[::-1])
+        # Empty subtrees become boxes at infinity, like the padding rows
+        empty = np.isinf(self.node_hi).any(axis=1)
+        self.node_hi[empty] = np.inf
+        self.first_leaf = leaves - 1
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.lo, self.hi, self.half, self.items, self.node_lo, self.node_hi,
+                                      self.moving))
+
+    def move(self, indices, centers):
+        """New centers for moving platforms (MovingPlatforms.indices and .position)"""
+        if not len(indices):
+            return
+        rows = np.asarray(indices, dtype=np.int64)
+        self.lo[rows] = centers - self.half[rows]
+        self.hi[rows] = centers + self.half[rows]
+
+    # Traversal
+
+    def _candidates(self, count, node_test, item_test):
+        """(query row, platform index) pairs passing item_test, found through the tree plus the movers.
+
+        node_test(rows, lo, hi) and item_test(rows, lo, hi) return a mask over the pairs.
+        """
+        rows = np.arange(count)
+        nodes = np.zeros(count, dtype=np.int64)
+        for level in range(self.depth + 1):
+            keep = node_test(rows, self.node_lo[nodes], self.node_hi[nodes])
+            rows, nodes = rows[keep], nodes[keep]
+            if not len(rows):
+                break
+            if level < self.depth:
+                rows = np.repeat(rows, 2)
+                nodes = (2 * nodes[:, None] + np.array([1, 2])).reshape(-1)
+
+        slots = ((nodes - self.first_leaf) * LEAF_SIZE)[:, None] + np.arange(LEAF_SIZE)
+        rows = np.repeat(rows, LEAF_SIZE)
+        ids = self.items[slots.reshape(-1)]
+        if len(self.moving):
+            rows = np.concatenate([rows, np.repeat(np.arange(count), len(self.moving))])
+            ids = np.concatenate([ids, np.tile(self.moving, count)])
+        keep = item_test(rows, self.lo[ids], self.hi[ids])
+        return rows[keep], ids[keep]
+
+    # Rays and sphere sweeps
+
+    def sweep_many(self, origins, directions, radius, max_distance=np.inf):
+        """First hit of spheres of `radius` moving from each origin along each direction.
+
+        Boxes are grown by the radius: exact against faces, a little early near
+        edges and corners. Boxes the sphere starts inside are ignored, so a sweep
+        from a point touching a wall can still move away from it. Returns
+        (distance, index) arrays; misses have distance inf and index -1.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        unit, inv, length = _directions(directions)
+        count = len(origins)
+        limit = np.broadcast_to(np.asarray(max_distance, dtype=np.float64), (count,))
+        # Finite, so boxes at infinity (padding) never count; a zero direction goes nowhere
+        limit = np.where(length > 0, np.minimum(limit, np.finfo(np.float64).max), -1.0)
+
+        def node_test(rows, lo, hi):
+            enter, leave = _ray_slabs(origins[rows], inv[rows], lo - radius, hi + radius)
+            return (enter <= leave) & (leave >= 0) & (enter <= limit[rows])
+
+        hit_enter = []
+
+        def item_test(rows, lo, hi):
+            enter, leave = _ray_slabs(origins[rows], inv[rows], lo - radius, hi + radius)
+            keep = (enter <= leave) & (enter >= 0) & (enter <= limit[rows])
+            hit_enter.append(enter[keep])
+            return keep
+
+        rows, ids = self._candidates(count, node_test, item_test)
+        distance = np.full(count, np.inf)
+        index = np.full(count, -1, dtype=np.int64)
+        if len(rows):
+            enter = hit_enter[0]
+            order = np.lexsort((enter, rows))
+            first = order[np.unique(rows[order], return_index=True)[1]]
+            distance[rows[first]] = enter[first]
+            index[rows[first]] = ids[first]
+        return distance, index
+
+    def raycast_many(self, origins, directions, max_distance=np.inf):
+        return self.sweep_many(origins, directions, 0.0, max_distance)
+
+    def sweep_sphere(self, origin, direction, radius, max_distance=np.inf):
+        """(distance, platform index) of the first hit, or None"""
+        distance, index = self.sweep_many([origin], [direction], radius, max_distance)
+        if index[0] < 0:
+            return None
+        return float(distance[0]), int(index[0])
+
+    def raycast(self, origin, direction, max_distance=np.inf):
+        return self.sweep_sphere(origin, direction, 0.0, max_distance)
+
+    # Box overlap
+
+    def query_boxes(self, lo, hi):
+        """(box row, platform index) for every platform overlapping each box (open intervals)"""
+        lo = np.asarray(lo, dtype=np.float64).reshape(-1, 3)
+        hi = np.asarray(hi, dtype=np.float64).reshape(-1, 3)
+
+        def overlap(rows, box_lo, box_hi):
+            return ((box_lo < hi[rows]) & (lo[rows] < box_hi)).all(axis=1)
+
+        return self._candidates(len(lo), overlap, overlap)
+
+    def query_box(self, lo, hi):
+        """Indices of platforms overlapping the box from lo to hi, ascending"""
+        return np.sort(self.query_boxes(lo, hi)[1])
+
+    def highest_below(self, x, y, z, margin=0.0):
+        """Top of the highest platform under (x, z), widened by margin, whose top is below y; or None"""
+        ids = self.query_box((x - margin, -np.inf, z - margin), (x + margin, y, z + margin))
+        tops = self.hi[ids, 1]
+        tops = tops[tops < y]
+        return float(tops.max()) if len(tops) else None
@@ -0,0 +1,116 @@
+"""
+Frame pacing for the 3D Platformer.
+
+Frame times are measured with time.perf_counter instead of the millisecond
+pygame tick counter. Modes:
+
+    vsync      pygame.display.flip() blocks on the display refresh
+    capped     wait for a fixed frame rate: sleep most of the way, then spin
+               for the last moment, since sleep() often overshoots
+    uncapped   no waiting at all, for benchmarking
+
+In every mode except uncapped, a paused game drops to a low frame rate to
+save power.
+
+Whatever the frame rate, the game simulates in fixed 60 Hz steps. FixedStep
+turns each frame's elapsed time into a whole number of steps. The leftover
+fraction of a step is used to blend the drawn player pose between the last
+two steps, so motion is smooth at 144 Hz and the same speed at 30.
+"""
+
+import time
+
+PACING_MODES = ("vsync", "capped", "uncapped")
+SIM_RATE = 60
+
+
+class FramePacer:
+    def __init__(self, mode="capped", target_fps=60, paused_fps=15, stats=None):
+        if mode not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode '{mode}', expected one of {PACING_MODES}")
+        self.mode = mode
+        self.target_fps = target_fps
+        self.paused_fps = paused_fps
+        self.stats = stats
+
+        # How much sleep() tends to oversleep; the spin covers this margin
+        self.spin_margin = 0.002
+        self.last_frame = time.perf_counter()
+        self.deadline = self.last_frame
+
+    def begin_frame(self):
+        """Seconds since the previous frame began"""
+        now = time.perf_counter()
+        dt = now - self.last_frame
+        self.last_frame = now
+        if self.stats:
+            self.stats.record("frame_ms", dt * 1000.0)
+        return dt
+
+    def end_frame(self, paused=False):
+        """Wait until the next frame should start"""
+        if self.mode == "uncapped":
+            return
+        if paused:
+            self._wait_until(self.last_frame + 1.0 / self.paused_fps, spin=False)
+            self.deadline = time.perf_counter()
+            return
+        if self.mode == "vsync":
+            return
+
+        # Fixed deadlines keep the average rate exact; if we fall more than a
+        # frame behind, start over instead of rushing to catch up
+        period = 1.0 / self.target_fps
+        self.deadline += period
+        now = time.perf_counter()
+        if self.deadline < now - period:
+            self.deadline = now
+        self._wait_until(self.deadline, spin=True)
+
+    def _wait_until(self, target, spin):
+        remaining = target - time.perf_counter()
+        if remaining <= 0:
+            return
+        sleep_for = remaining - self.spin_margin if spin else remaining
+        if sleep_for > 0:
+            before = time.perf_counter()
+            time.sleep(sleep_for)
+            overshoot = time.perf_counter() - before - sleep_for
+            # Track the oversleep slowly, bounded so a hiccup can't make us spin for long
+            self.spin_margin = min(0.004, max(0.0005, self.spin_margin * 0.9 + overshoot * 1.5 * 0.1))
+        if spin:
+            while time.perf_counter() < target:
+                pass
+
+    def describe(self):
+        if self.mode == "capped":
+            return f"capped at {self.target_fps} fps"
+        return self.mode
+
+
+class FixedStep:
+    """Accumulates frame time and pays it out as fixed simulation steps"""
+
+    def __init__(self, rate=SIM_RATE, max_steps=5):
+        self.step = 1.0 / rate
+        self.max_steps = max_steps  # A long stall (level load, breakpoint) is dropped, not fast-forwarded
+        self.accumulator = 0.0
+
+    def advance(self, dt):
+        """How many steps to simulate for a frame that took `dt` seconds"""
+        self.accumulator += dt
+        # The epsilon keeps rounding in sums of 1/144 from dropping a step that is due
+        steps = int(self.accumulator / self.step + 1e-9)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = self.step * steps
+        self.accumulator = max(0.0, self.accumulator - self.step * steps)
+        return steps
+
+    @property
+    def alpha(self):
+        """How far into the next step the frame is, 0-1"""
+        return min(self.accumulator / self.step, 1.0)
+
+    def reset(self):
+        self.accumulator = 0.0
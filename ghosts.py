@@ -0,0 +1,211 @@
+"""
+Time-trial ghosts for the 3D Platformer.
+
+Every completed run is recorded as a compact pose track: position and squash,
+stored as float32 every `stride` simulation ticks (player physics runs once
+per tick). Tracks are saved under ghosts/<level key>/ and the fastest runs
+replay as ghosts the next time that level is played. The key names where the
+level came from (built-in number, JSON file, pack entry, world) plus a hash of
+its platforms, so editing a level or swapping packs starts a fresh set of runs
+instead of racing ghosts through walls. Only the fastest runs are kept.
+
+GhostSet holds all loaded tracks in one [ghosts, samples, 4] array, so
+sampling every ghost at a tick is a couple of slices and a lerp, and
+submit_ghosts queues them all as a single glDrawArrays call. Ghosts are
+never simulated; they only replay.
+
+    python ghosts.py list
+    python ghosts.py bench --ghosts 500
+"""
+
+import argparse
+import glob
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+from OpenGL.GL import *
+
+from render_queue import GHOST
+
+GHOST_DIR = "ghosts"
+GHOST_COLOR = (0.6, 0.8, 1.0, 0.35)
+
+# The 6 faces of a cube from -1 to 1, 4 corners each, in GL_QUADS order
+CUBE_QUADS = np.array([
+    [-1, -1, 1], [1, -1, 1], [1, 1, 1], [-1, 1, 1],        # Front
+    [-1, -1, -1], [-1, 1, -1], [1, 1, -1], [1, -1, -1],    # Back
+    [-1, 1, -1], [-1, 1, 1], [1, 1, 1], [1, 1, -1],        # Top
+    [-1, -1, -1], [1, -1, -1], [1, -1, 1], [-1, -1, 1],    # Bottom
+    [1, -1, -1], [1, 1, -1], [1, 1, 1], [1, -1, 1],        # Right
+    [-1, -1, -1], [-1, -1, 1], [-1, 1, 1], [-1, 1, -1],    # Left
+], dtype=np.float32)
+
+# Outward normal of each corner above
+CUBE_NORMALS = np.repeat(np.array([
+    [0, 0, 1], [0, 0, -1], [0, 1, 0], [0, -1, 0], [1, 0, 0], [-1, 0, 0],
+], dtype=np.float32), 4, axis=0)
+
+
+def level_key(source, boxes):
+    """Ghost directory name for a level: its source (e.g. "level_2", "my_level_3.json", "pack:cliffs")
+    plus a hash of its platform boxes as loaded"""
+    digest = hashlib.sha1(np.ascontiguousarray(boxes, dtype=np.float64).tobytes()).hexdigest()[:12]
+    return f"{re.sub(r'[^A-Za-z0-9.-]+', '_', source)}-{digest}"
+
+
+def ghost_dir(key):
+    return os.path.join(GHOST_DIR, key)
+
+
+class GhostRecorder:
+    def __init__(self, stride=2):
+        self.stride = stride
+        self.reset()
+
+    def reset(self):
+        self.samples = []
+        self.ticks = 0
+
+    def record(self, x, y, z, squash):
+        """Call once per simulation tick"""
+        if self.ticks % self.stride == 0:
+            self.samples.append((x, y, z, squash))
+        self.ticks += 1
+
+    def save(self, key, limit=None):
+        """Write the run so far to ghosts/<key>/ and keep only the fastest `limit` runs there.
+        Returns the filename, or None if the run was not fast enough to keep."""
+        if not self.samples:
+            return None
+        directory = ghost_dir(key)
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, f"run_{self.ticks:06d}_{int(time.time())}.npz")
+        np.savez_compressed(filename, track=np.array(self.samples, dtype=np.float32),
+                            stride=self.stride, ticks=self.ticks)
+        if limit:
+            # Names sort by tick count, then by when the run was saved
+            for slower in sorted(glob.glob(os.path.join(directory, "run_*.npz")))[limit:]:
+                os.remove(slower)
+        return filename if os.path.exists(filename) else None
+
+
+def load_tracks(key, limit=20):
+    """Up to `limit` of the fastest recorded runs for a level key, as (track, stride) pairs"""
+    runs = []
+    for filename in glob.glob(os.path.join(ghost_dir(key), "run_*.npz")):
+        try:
+            with np.load(filename) as data:
+                runs.append((int(data["ticks"]), data["track"], int(data["stride"])))
+        except Exception as e:
+            print(f"Skipping ghost {filename}: {e}")
+    runs.sort(key=lambda run: run[0])
+    return [(track, stride) for _, track, stride in runs[:limit]]
+
+
+class GhostSet:
+    def __init__(self, tracks, stride=2, size=0.25):
+        """`tracks` are [samples, 4] arrays recorded with the same stride"""
+        self.stride = stride
+        self.size = size
+        self.count = len(tracks)
+        length = max((len(t) for t in tracks), default=1)
+        self.lengths = np.array([len(t) for t in tracks], dtype=np.int64)
+
+        # Pad every track with its final pose so sampling needs no per-ghost indexing
+        self.tracks = np.zeros((self.count, length, 4), dtype=np.float32)
+        for i, track in enumerate(tracks):
+            self.tracks[i, :len(track)] = track
+            self.tracks[i, len(track):] = track[-1]
+
+    @classmethod
+    def for_level(cls, key, limit=20, size=0.25):
+        tracks = load_tracks(key, limit)
+        strides = {stride for _, stride in tracks}
+        if len(strides) > 1:
+            # Keep the most common stride rather than resampling
+            common = max(strides, key=lambda s: sum(1 for _, st in tracks if st == s))
+            tracks = [(t, s) for t, s in tracks if s == common]
+        stride = tracks[0][1] if tracks else 2
+        return cls([t for t, _ in tracks], stride, size)
+
+    def sample(self, tick):
+        """Poses at `tick` as a [visible, 4] array; ghosts whose run has ended are left out"""
+        if self.count == 0:
+            return self.tracks[:, 0]
+        f = tick / self.stride
+        last = self.tracks.shape[1] - 1
+        i0 = min(int(f), last)
+        i1 = min(i0 + 1, last)
+        a = np.float32(min(max(f - i0, 0.0), 1.0))
+        poses = self.tracks[:, i0] * (1 - a) + self.tracks[:, i1] * a
+        return poses[f <= self.lengths - 1]
+
+    def vertices(self, poses):
+        """[ghosts * 24, 3] float32 quad corners for `poses`, squash applied"""
+        squash = poses[:, 3:4]
+        scale = np.concatenate([squash, 1.0 / squash, squash], axis=1) * self.size
+        verts = poses[:, None, :3] + CUBE_QUADS[None] * scale[:, None, :]
+        return np.ascontiguousarray(verts.reshape(-1, 3), dtype=np.float32)
+
+
+def submit_ghosts(queue, ghosts, tick, color=GHOST_COLOR):
+    """Queue every visible ghost as one batched draw (blended, no depth writes)"""
+    if ghosts is None or ghosts.count == 0:
+        return
+    poses = ghosts.sample(tick)
+    if len(poses) == 0:
+        return
+    queue.submit(GHOST, quad_array_geometry, ghosts.vertices(poses), color=color)
+
+
+def quad_array_geometry(verts):
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, verts)
+    glDrawArrays(GL_QUADS, 0, len(verts))
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+
+def synthetic_tracks(count, ticks, stride=2, seed=0):
+    """Random-walk runs for benchmarking"""
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for _ in range(count):
+        n = int(rng.integers(ticks // 2, ticks)) // stride + 1
+        steps = rng.normal(0, 0.05, size=(n, 3)).cumsum(axis=0)
+        squash = 1.0 + np.abs(rng.normal(0, 0.1, size=(n, 1)))
+        tracks.append(np.concatenate([steps, squash], axis=1).astype(np.float32))
+    return tracks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghost run tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="Show recorded runs per level")
+    bench = sub.add_parser("bench", help="Time sampling and vertex building for many ghosts")
+    bench.add_argument("--ghosts", type=int, default=500)
+    bench.add_argument("--seconds", type=float, default=60.0, help="Length of each synthetic run")
+    bench.add_argument("--frames", type=int, default=600)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for directory in sorted(glob.glob(os.path.join(GHOST_DIR, "*", ""))):
+            runs = sorted(glob.glob(os.path.join(directory, "run_*.npz")))
+            best = min((int(os.path.basename(r).split("_")[1]) for r in runs), default=None)
+            print(f"{os.path.basename(os.path.dirname(directory))}: {len(runs)} runs"
+                  + (f", best {best / 60:.2f}s" if best is not None else ""))
+        return
+
+    ticks = int(args.seconds * 60)
+    ghosts = GhostSet(synthetic_tracks(args.ghosts, ticks))
+    start = time.perf_counter()
+    for frame in range(args.frames):
+        ghosts.vertices(ghosts.sample(frame * ticks / args.frames))
+    per_frame = (time.perf_counter() - start) * 1000.0 / args.frames
+    print(f"{args.ghosts} ghosts: {per_frame:.3f} ms per frame to sample and build vertices")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Hazards for the 3D Platformer: patrolling enemies and spinning blades.
+
+A level file can list them next to its platforms:
+
+    "hazards": [
+        {"type": "enemy", "position": [x, y, z], "path": [[0, 0, 0], [3, 0, 0]], "speed": 1.5},
+        {"type": "spinner", "position": [x, y, z], "size": [3, 0.2, 0.2], "spin": 90}
+    ]
+
+Every hazard is a box (`size` is width, height and depth, as for platforms)
+turned about the y axis. `path`, `speed` and `phase` work as for moving
+platforms: a closed loop of offsets from `position`, walked in units per
+second. Enemies face the way they walk. Spinners turn `spin` degrees per
+second, counter-clockwise seen from above, starting at `angle`. Anything left
+out comes from the type:
+
+    enemy     0.5 cube, speed 1.5
+    spinner   3 x 0.2 x 0.2 bar, spin 90
+
+Touching a hazard costs a life, the same as falling off the level.
+
+HazardSet keeps every hazard in arrays. step() moves and turns all of them in
+one numpy pass per tick, and positions depend only on the tick, like moving
+platforms, so ghosts, replays and network prediction agree. The broadphase is
+a SpatialGrid over each hazard's reach: its whole path widened by its turning
+radius. That never changes, so it is built once per level and the player is
+only tested against the few hazards that can reach its cell. Visible hazards
+of one type are drawn as one vertex array with one glDrawArrays call.
+
+    python hazards.py bench --hazards 5000
+    python hazards.py scatter --hazards 5000 --output my_level_6.json
+"""
+
+import argparse
+import json
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+from OpenGL.GL import *
+
+from ghosts import CUBE_NORMALS, CUBE_QUADS
+from moving_platforms import TICKS_PER_SECOND, PathLoops
+from render_queue import OPAQUE
+from spatial_grid import SpatialGrid
+
+ENEMY, SPINNER = 0, 1
+TYPES = {"enemy": ENEMY, "spinner": SPINNER}
+DEFAULTS = {
+    ENEMY: {"size": [0.5, 0.5, 0.5], "speed": 1.5, "spin": 0.0},
+    SPINNER: {"size": [3.0, 0.2, 0.2], "speed": 1.0, "spin": 90.0},
+}
+COLORS = {ENEMY: (0.6, 0.1, 0.7), SPINNER: (0.9, 0.4, 0.1)}
+
+# Corner k of a hazard turned by a, with half size (hx, hy, hz) at (x, y, z), is
+#     x + qx (hx cos a) + qz (hz sin a),  y + qy hy,  z + qz (hz cos a) - qx (hx sin a)
+# for the unit cube corner q. Row i of the basis is what coefficient i adds to each vertex component.
+_VERTEX_BASIS = np.zeros((8, len(CUBE_QUADS), 3), dtype=np.float32)
+_VERTEX_BASIS[0, :, 0] = CUBE_QUADS[:, 0]
+_VERTEX_BASIS[1, :, 0] = CUBE_QUADS[:, 2]
+_VERTEX_BASIS[2, :, 2] = CUBE_QUADS[:, 2]
+_VERTEX_BASIS[3, :, 2] = -CUBE_QUADS[:, 0]
+_VERTEX_BASIS[4, :, 1] = CUBE_QUADS[:, 1]
+_VERTEX_BASIS[5:, :, :] = np.eye(3, dtype=np.float32)[:, None, :]
+_VERTEX_BASIS = _VERTEX_BASIS.reshape(8, -1)
+# Normals only turn: coefficients cos a, sin a and 1
+_NORMAL_BASIS = np.zeros((3, len(CUBE_NORMALS), 3), dtype=np.float32)
+_NORMAL_BASIS[0, :, 0] = CUBE_NORMALS[:, 0]
+_NORMAL_BASIS[0, :, 2] = CUBE_NORMALS[:, 2]
+_NORMAL_BASIS[1, :, 0] = CUBE_NORMALS[:, 2]
+_NORMAL_BASIS[1, :, 2] = -CUBE_NORMALS[:, 0]
+_NORMAL_BASIS[2, :, 1] = CUBE_NORMALS[:, 1]
+_NORMAL_BASIS = _NORMAL_BASIS.reshape(3, -1)
+
+# Hazards as drawn at one tick; step() replaces the arrays, so a frame can outlive it
+HazardFrame = namedtuple("HazardFrame", "kind half position angle")
+
+
+def parse_specs(specs):
+    """Keep the valid entries of a level's "hazards" list, with defaults filled in"""
+    valid = []
+    for spec in specs or []:
+        try:
+            kind = TYPES[spec.get("type", "enemy")]
+            defaults = DEFAULTS[kind]
+            position = [float(v) for v in spec["position"][:3]]
+            path = [[float(v) for v in point[:3]] for point in spec.get("path", [[0, 0, 0]])]
+            size = spec.get("size", defaults["size"])
+            size = [abs(float(size))] * 3 if isinstance(size, (int, float)) else [abs(float(v)) for v in size[:3]]
+            speed = float(spec.get("speed", defaults["speed"]))
+            phase = float(spec.get("phase", 0.0)) % 1.0
+            spin = float(spec.get("spin", defaults["spin"]))
+            angle = float(spec.get("angle", 0.0))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            print(f"Skipping hazard {spec}: {e!r}")
+            continue
+        if len(position) < 3 or len(size) < 3 or not path or any(len(point) < 3 for point in path):
+            print(f"Skipping hazard {spec}: position, size and path points need x, y and z")
+            continue
+        valid.append({"kind": kind, "position": position, "path": path, "size": size,
+                      "speed": speed, "phase": phase, "spin": spin, "angle": angle})
+    return valid
+
+
+class HazardSet:
+    def __init__(self, specs, cell_size=2.0):
+        specs = parse_specs(specs)
+        self.count = len(specs)
+        self.kind = np.array([spec["kind"] for spec in specs], dtype=np.int8)
+        self.base = np.array([spec["position"] for spec in specs], dtype=np.float64).reshape(-1, 3)
+        self.half = np.array([spec["size"] for spec in specs], dtype=np.float64).reshape(-1, 3) / 2
+
+        self.loops = PathLoops([spec["path"] for spec in specs])
+        self.speed = np.array([spec["speed"] for spec in specs]) / TICKS_PER_SECOND
+        self.phase = np.array([spec["phase"] for spec in specs])
+        self.spin = np.radians([spec["spin"] for spec in specs]) / TICKS_PER_SECOND  # Radians per tick
+        self.start_angle = np.radians([spec["angle"] for spec in specs])
+        # Enemies that walk face their path; spinners and standing enemies keep their own angle
+        self.faces_path = (self.kind == ENEMY) & (self.loops.length > 0)
+
+        # Broadphase: the whole area each hazard can sweep, corners included
+        radius = np.hypot(self.half[:, 0], self.half[:, 2])
+        lo = self.base + self.loops.path.min(axis=1)
+        hi = self.base + self.loops.path.max(axis=1)
+        self.reach_lo = lo - np.stack([radius, self.half[:, 1], radius], axis=1)
+        self.reach_hi = hi + np.stack([radius, self.half[:, 1], radius], axis=1)
+        self.grid = SpatialGrid(cell_size)
+        for k, (x0, z0, x1, z1) in enumerate(np.stack([self.reach_lo[:, 0], self.reach_lo[:, 2],
+                                                       self.reach_hi[:, 0], self.reach_hi[:, 2]], axis=1).tolist()):
+            self.grid.insert(k, x0, z0, x1, z1)
+
+        self.position = self.base
+        self.angle = self.start_angle
+        self.step(0)
+
+    def __bool__(self):
+        return self.count > 0
+
+    def step(self, tick):
+        """Move and turn every hazard to `tick`"""
+        if not self.count:
+            return
+        offset, direction = self.loops.sample(self.loops.distance(self.phase, self.speed, tick))
+        # New arrays rather than in-place writes, so frames taken earlier stay as they were
+        self.position = self.base + offset
+        heading = np.arctan2(-direction[:, 2], direction[:, 0])  # Turns the local x axis onto the path
+        self.angle = np.where(self.faces_path, heading, self.start_angle + self.spin * tick)
+
+    def touches(self, x, y, z, size):
+        """True if a cube of half size `size` at (x, y, z) overlaps any hazard"""
+        ids = self.grid.query_point(x, z, size)
+        if not ids:
+            return False
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        offset = np.array([x, y, z]) - self.position[ids]
+        # Into each hazard's own frame, where it is an axis-aligned box
+        c, s = np.cos(self.angle[ids]), np.sin(self.angle[ids])
+        local_x = offset[:, 0] * c - offset[:, 2] * s
+        local_z = offset[:, 0] * s + offset[:, 2] * c
+        half = self.half[ids] + size
+        hit = ((np.abs(local_x) < half[:, 0]) & (np.abs(offset[:, 1]) < half[:, 1])
+               & (np.abs(local_z) < half[:, 2]))
+        return bool(hit.any())
+
+    def frame(self):
+        """Every hazard as it is now"""
+        return HazardFrame(self.kind, self.half, self.position, self.angle)
+
+    @property
+    def nbytes(self):
+        arrays = (self.kind, self.base, self.half, self.speed, self.phase, self.spin, self.start_angle,
+                  self.faces_path, self.reach_lo, self.reach_hi)
+        return sum(a.nbytes for a in arrays) + self.loops.nbytes
+
+
+def visible_hazards(frame, camera, target, distance, margin=2.0):
+    """The part of `frame` within `distance` of the camera and in front of it, in the ground plane"""
+    if frame is None or not len(frame.kind):
+        return frame
+    dx = frame.position[:, 0] - camera[0]
+    dz = frame.position[:, 2] - camera[2]
+    fx, fz = target[0] - camera[0], target[2] - camera[2]
+    length = math.hypot(fx, fz) or 1.0
+    # Hazards behind the camera can't be on screen; `margin` keeps the ones reaching past its side
+    ahead = (dx * fx + dz * fz) / length > -margin
+    keep = np.flatnonzero((dx * dx + dz * dz <= distance * distance) & ahead)
+    return HazardFrame(frame.kind[keep], frame.half[keep], frame.position[keep], frame.angle[keep])
+
+
+def hazard_batches(frame):
+    """(vertices, normals, color) per hazard type, [hazards * 24, 3] float32 each"""
+    batches = []
+    if frame is None:
+        return batches
+    for kind, color in COLORS.items():
+        ids = np.flatnonzero(frame.kind == kind)
+        if not len(ids):
+            continue
+        c, s = np.cos(frame.angle[ids]), np.sin(frame.angle[ids])
+        hx, hy, hz = frame.half[ids].T
+        x, y, z = frame.position[ids].T
+        # One matrix product per batch builds every corner, already in vertex-array layout
+        coefficients = np.stack([c * hx, s * hz, c * hz, s * hx, hy, x, y, z], axis=1).astype(np.float32)
+        verts = (coefficients @ _VERTEX_BASIS).reshape(-1, 3)
+        normals = (np.stack([c, s, np.ones_like(c)], axis=1).astype(np.float32) @ _NORMAL_BASIS).reshape(-1, 3)
+        batches.append((verts, normals, color))
+    return batches
+
+
+def submit_hazards(queue, frame):
+    """Queue the hazards in `frame` as one lit draw per type"""
+    for verts, normals, color in hazard_batches(frame):
+        queue.submit(OPAQUE, hazard_geometry, verts, normals, color=color)
+
+
+def hazard_geometry(verts, normals):
+    # Closed boxes wound counter-clockwise, so back faces can go; that halves the fill on thousands of them
+    glEnable(GL_CULL_FACE)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, verts)
+    glNormalPointer(GL_FLOAT, 0, normals)
+    glDrawArrays(GL_QUADS, 0, len(verts))
+    glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glDisable(GL_CULL_FACE)
+
+
+def scattered_specs(count, radius=60.0, clear=4.0, seed=0):
+    """`count` random enemies and spinners within `radius` of the origin, none within `clear` of it"""
+    rng = np.random.default_rng(seed)
+    specs = []
+    while len(specs) < count:
+        x, z = rng.uniform(-radius, radius, 2)
+        if math.hypot(x, z) < clear + 3 or math.hypot(x, z) > radius:
+            continue
+        if rng.random() < 0.5:
+            leg = rng.uniform(-3, 3, 2)
+            specs.append({"type": "enemy", "position": [float(x), 0.25, float(z)],
+                          "path": [[0, 0, 0], [float(leg[0]), 0, float(leg[1])]],
+                          "speed": float(rng.uniform(0.5, 2.0)), "phase": float(rng.random())})
+        else:
+            specs.append({"type": "spinner", "position": [float(x), 0.3, float(z)],
+                          "spin": float(rng.uniform(-180, 180)), "angle": float(rng.uniform(0, 360))})
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hazard tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Time stepping, collision tests and vertex building for many hazards")
+    bench.add_argument("--hazards", type=int, default=5000)
+    bench.add_argument("--ticks", type=int, default=600)
+    bench.add_argument("--distance", type=float, default=45.0, help="Draw distance for the visible set")
+    scatter = sub.add_parser("scatter", help="Write a flat test level with many hazards")
+    scatter.add_argument("--hazards", type=int, default=5000)
+    scatter.add_argument("--radius", type=float, default=60.0)
+    scatter.add_argument("--output", default="my_level_6.json")
+    args = parser.parse_args()
+
+    if args.command == "scatter":
+        size = 2 * args.radius + 4
+        level_data = {"platforms": [[0, -0.5, 0, size, 0.5, size]], "platform_colors": [[0.2, 0.4, 0.2]],
+                      "coins": [[args.radius - 1, 0.5, 0]], "hazards": scattered_specs(args.hazards, args.radius)}
+        with open(args.output, 'w') as f:
+            json.dump(level_data, f)
+        print(f"Wrote {args.output}: {args.hazards} hazards")
+        return
+
+    hazards = HazardSet(scattered_specs(args.hazards))
+    rng = np.random.default_rng(1)
+    walk = rng.uniform(-60, 60, (args.ticks, 2))
+    timings = {"step": 0.0, "touches": 0.0, "vertices": 0.0}
+    hits = 0
+    for tick in range(args.ticks):
+        start = time.perf_counter()
+        hazards.step(tick)
+        now = time.perf_counter()
+        timings["step"] += now - start
+        start = now
+        hits += hazards.touches(walk[tick, 0], 0.25, walk[tick, 1], 0.25)
+        now = time.perf_counter()
+        timings["touches"] += now - start
+        start = now
+        hazard_batches(visible_hazards(hazards.frame(), (0.0, 3.0, 6.0), (0.0, 0.0, 0.0), args.distance))
+        timings["vertices"] += time.perf_counter() - start
+    print(f"{hazards.count} hazards, {args.ticks} ticks, {hits} hits, "
+          f"{hazards.nbytes / 1024:.0f} KiB of arrays, {len(hazards.grid.cells)} grid cells")
+    for name, seconds in timings.items():
+        print(f"   {name:<10} {seconds * 1000.0 / args.ticks:7.3f} ms per tick")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Per-frame input snapshots for the 3D Platformer.
+
+InputSampler reads keyboard and controller state once per frame into an
+immutable InputSnapshot, with deadzones already applied. Controller
+capabilities (axis/hat/button counts) are read once when the controller is
+set up instead of on every poll. The right stick can be sampled again on its
+own just before rendering (see Game.latch_camera) so the camera uses the
+freshest reading available.
+"""
+
+import time
+from collections import namedtuple
+
+import pygame
+
+InputSnapshot = namedtuple("InputSnapshot", "time move_x move_z jump camera_x camera_y")
+
+DeviceCaps = namedtuple("DeviceCaps", "axes hats buttons")
+NO_DEVICE = DeviceCaps(0, 0, 0)
+
+UP_KEYS = (pygame.K_w, pygame.K_UP)
+DOWN_KEYS = (pygame.K_s, pygame.K_DOWN)
+LEFT_KEYS = (pygame.K_a, pygame.K_LEFT)
+RIGHT_KEYS = (pygame.K_d, pygame.K_RIGHT)
+JUMP_KEYS = (pygame.K_SPACE, pygame.K_LSHIFT, pygame.K_RSHIFT)
+JUMP_BUTTONS = (0, 1, 2, 3)  # A, B, X, Y
+
+
+class InputSampler:
+    def __init__(self, move_deadzone=0.15, camera_deadzone=0.1):
+        self.move_deadzone = move_deadzone
+        self.camera_deadzone = camera_deadzone
+        self.joystick = None
+        self.caps = NO_DEVICE
+
+    def set_joystick(self, joystick):
+        """Cache what the controller has; call again on connect/disconnect"""
+        self.joystick = joystick
+        self.caps = NO_DEVICE
+        if joystick is None:
+            return
+        try:
+            self.caps = DeviceCaps(joystick.get_numaxes(), joystick.get_numhats(),
+                                   joystick.get_numbuttons())
+        except pygame.error as e:
+            print(f"Controller capability query failed: {e}")
+            self.joystick = None
+
+    def _deadzone(self, value, deadzone):
+        return value if abs(value) > deadzone else 0.0
+
+    def sample(self, keys):
+        """Build this frame's snapshot from pygame.key.get_pressed() and the controller"""
+        move_x = move_z = 0.0
+        if any(keys[k] for k in UP_KEYS):
+            move_z -= 1
+        if any(keys[k] for k in DOWN_KEYS):
+            move_z += 1
+        if any(keys[k] for k in LEFT_KEYS):
+            move_x -= 1
+        if any(keys[k] for k in RIGHT_KEYS):
+            move_x += 1
+        jump = any(keys[k] for k in JUMP_KEYS)
+
+        camera_x = camera_y = 0.0
+        joystick = self.joystick
+        if joystick is not None:
+            caps = self.caps
+            try:
+                if caps.axes >= 2:
+                    move_x += self._deadzone(joystick.get_axis(0), self.move_deadzone)
+                    move_z += self._deadzone(joystick.get_axis(1), self.move_deadzone)
+                if caps.axes >= 4:
+                    camera_x = self._deadzone(joystick.get_axis(2), self.camera_deadzone)
+                    camera_y = self._deadzone(joystick.get_axis(3), self.camera_deadzone)
+                if caps.hats >= 1:
+                    hat_x, hat_y = joystick.get_hat(0)
+                    move_x += hat_x
+                    move_z -= hat_y  # Invert Y for intuitive movement
+                if not jump:
+                    jump = any(joystick.get_button(b) for b in JUMP_BUTTONS if b < caps.buttons)
+            except pygame.error as e:
+                print(f"Controller input error: {e}")
+
+        return InputSnapshot(time.perf_counter(), move_x, move_z, jump, camera_x, camera_y)
+
+    def sample_camera(self):
+        """Right stick only, with deadzone. Returns (x, y, time)."""
+        now = time.perf_counter()
+        if self.joystick is None or self.caps.axes < 4:
+            return 0.0, 0.0, now
+        try:
+            return (self._deadzone(self.joystick.get_axis(2), self.camera_deadzone),
+                    self._deadzone(self.joystick.get_axis(3), self.camera_deadzone),
+                    now)
+        except pygame.error:
+            return 0.0, 0.0, now
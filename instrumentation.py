@@ -0,0 +1,88 @@
+"""
+Lightweight runtime instrumentation for the 3D Platformer.
+
+Subsystems record timings (milliseconds) and per-frame counters by name.
+Instrumentation keeps a rolling window of each and, while reporting is
+turned on (F3 in the game), prints a summary every few seconds.
+"""
+
+import time
+from collections import deque
+
+
+class Instrumentation:
+    def __init__(self, window=300, report_interval=5.0):
+        self.window = window
+        self.report_interval = report_interval
+        self.samples = {}       # name -> deque of recent values
+        self.frame_counts = {}  # name -> count accumulated this frame
+        self.reporting = False
+        self.last_report = time.perf_counter()
+
+    def record(self, name, value):
+        series = self.samples.get(name)
+        if series is None:
+            series = self.samples[name] = deque(maxlen=self.window)
+        series.append(value)
+
+    def count(self, name, amount=1):
+        """Add to a per-frame counter; end_frame() turns it into a sample"""
+        self.frame_counts[name] = self.frame_counts.get(name, 0) + amount
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def end_frame(self):
+        for name, value in self.frame_counts.items():
+            self.record(name, value)
+        self.frame_counts = {}
+        if self.reporting and time.perf_counter() - self.last_report >= self.report_interval:
+            self.report()
+
+    def stats(self, name):
+        series = self.samples.get(name)
+        if not series:
+            return None
+        ordered = sorted(series)
+        count = len(ordered)
+        mean = sum(ordered) / count
+        return {
+            "mean": mean,
+            "p50": ordered[count // 2],
+            "p95": ordered[min(count - 1, int(count * 0.95))],
+            "max": ordered[-1],
+            "std": (sum((v - mean) ** 2 for v in ordered) / count) ** 0.5,
+            "count": count,
+        }
+
+    def latest(self, name, default=None):
+        series = self.samples.get(name)
+        return series[-1] if series else default
+
+    def report(self):
+        self.last_report = time.perf_counter()
+        print("📊 Performance (mean / p95 / max / std over last "
+              f"{self.window} samples):")
+        for name in sorted(self.samples):
+            s = self.stats(name)
+            if s:
+                print(f"   {name:<24} {s['mean']:8.2f} {s['p95']:8.2f} {s['max']:8.2f} {s['std']:8.2f}")
+
+    def toggle_reporting(self):
+        self.reporting = not self.reporting
+        self.last_report = time.perf_counter()
+        print(f"Performance report: {'ON' if self.reporting else 'OFF'}")
+
+
+class _Timer:
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instrumentation.record(self.name, (time.perf_counter() - self.start) * 1000.0)
+        return False
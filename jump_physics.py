@@ -0,0 +1,118 @@
+"""
+Jump physics helpers for the 3D Platformer level tools.
+
+The game integrates the player once per frame (see Player.update and
+Player.check_collisions in 3d-platform-clauder4.py). The tools in this repo
+(generator, analyzer) run without a window, so this module repeats that
+integration to answer "how far can the player get" questions.
+"""
+
+import numpy as np
+
+# Values from Player.__init__
+PLAYER_SIZE = 0.25
+ACCELERATION = 0.006
+MAX_SPEED = 0.1
+FRICTION = 0.88
+JUMP_VELOCITY = 0.22
+GRAVITY = 0.008
+
+# Player.check_collisions only lands the player when the feet end a frame
+# less than this far below the platform top
+LANDING_WINDOW = 0.2
+
+# Game.update collects a coin when the player center is this close
+COIN_RADIUS = 0.4
+
+# Longest fall we simulate (frames)
+MAX_AIR_FRAMES = 400
+
+
+class JumpPhysics:
+    def __init__(self, jump_velocity=JUMP_VELOCITY, gravity=GRAVITY,
+                 max_speed=MAX_SPEED, friction=FRICTION,
+                 acceleration=ACCELERATION, size=PLAYER_SIZE):
+        self.jump_velocity = jump_velocity
+        self.gravity = gravity
+        self.max_speed = max_speed
+        self.friction = friction
+        self.acceleration = acceleration
+        self.size = size
+
+        self.run_speed = self.terminal_run_speed()
+
+        # Height above the take-off point after n frames, for a jump and for
+        # walking off a ledge
+        frames = np.arange(MAX_AIR_FRAMES + 1, dtype=np.float64)
+        fall = gravity * frames * (frames + 1) / 2
+        self._arcs = [jump_velocity * frames - fall, -fall]
+        self._speeds = [jump_velocity - gravity * frames, -gravity * frames]
+        self.apex = float(self._arcs[0].max())
+
+    @classmethod
+    def from_player(cls, player):
+        """Build from a live Player instance so tweaked constants carry over"""
+        return cls(player.jump_velocity, player.gravity, player.max_speed,
+                   player.friction, player.acceleration, player.size)
+
+    def terminal_run_speed(self):
+        """Distance covered per frame with the stick held down"""
+        vel = 0.0
+        step = 0.0
+        for _ in range(1000):
+            # Game.handle_events -> Player.move, then Player.update
+            step = vel + self.acceleration
+            vel = min(step * self.friction, self.max_speed)
+        return step
+
+    def landing_frames(self, dy):
+        """Frame at which a jump/fall lands on a platform dy above take-off.
+
+        Returns an array of frame counts (0 where the landing is impossible)
+        with shape dy.shape + (2,): index 0 is a jump, 1 is walking off.
+        """
+        dy = np.asarray(dy, dtype=np.float64)
+        result = np.zeros(dy.shape + (2,), dtype=np.int64)
+        for k, (arc, speed) in enumerate(zip(self._arcs, self._speeds)):
+            # Only falling frames can land
+            first = int(np.argmax(speed <= 0))
+            falling = arc[first:]
+            # First falling frame at or below the platform top
+            n = np.searchsorted(-falling, -(dy + 1e-9), side="left")
+            valid = n < len(falling)
+            n = np.minimum(n, len(falling) - 1)
+            # The feet must end that frame inside the landing window
+            valid &= falling[n] > dy - LANDING_WINDOW
+            valid &= dy <= self.apex if k == 0 else dy <= 0
+            result[..., k] = np.where(valid, n + first, 0)
+        return result
+
+    def reach(self, dy):
+        """Longest horizontal gap the player can clear onto a surface dy above.
+
+        The gap is measured between footprints grown by the player size, which
+        is the region check_collisions treats as "standing on". Negative means
+        unreachable.
+        """
+        frames = self.landing_frames(dy).max(axis=-1)
+        return np.where(frames > 0, frames * self.run_speed, -1.0)
+
+    def coin_reach(self, dy):
+        """Horizontal distance at which a coin dy above the standing center can be collected"""
+        dy = np.asarray(dy, dtype=np.float64)
+        best = np.full(dy.shape, -1.0)
+        for arc in self._arcs:
+            # Last frame still within coin range of that height
+            above = arc[None, :] >= (dy.reshape(-1, 1) - COIN_RADIUS)
+            last = MAX_AIR_FRAMES - np.argmax(above[:, ::-1], axis=1)
+            ok = above.any(axis=1)
+            dist = np.where(ok, last * self.run_speed + COIN_RADIUS, -1.0)
+            best = np.maximum(best, dist.reshape(dy.shape))
+        return best
+
+
+def rect_gaps(ax, az, aw, ad, bx, bz, bw, bd, size=PLAYER_SIZE):
+    """Distance between XZ footprints grown by the player size (0 if they touch)"""
+    gx = np.abs(np.asarray(ax) - bx) - (np.asarray(aw) + bw) / 2 - 2 * size
+    gz = np.abs(np.asarray(az) - bz) - (np.asarray(ad) + bd) / 2 - 2 * size
+    return np.hypot(np.maximum(gx, 0), np.maximum(gz, 0))
@@ -0,0 +1,320 @@
+"""
+Level Reachability Analyzer for 3D Platformer
+
+A level can only be finished when every coin is collected (Game.update moves
+on when len(self.coins) == 0), so one unreachable coin makes it impossible.
+This tool builds a "can jump from platform A to platform B" graph from the
+Player physics constants and reports unreachable coins and platforms, along
+with the shortest jump path to each coin.
+
+Usage:
+    python level_analyzer.py my_level_1.json
+    python level_analyzer.py levels/ --workers 8     # exits 1 if any level fails
+    python level_analyzer.py my_level_2.json --path 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+from jump_physics import JumpPhysics, PLAYER_SIZE, COIN_RADIUS
+from prefabs import expand_level
+from spatial_grid import overlap_pairs
+
+# Player.reset puts the player here
+SPAWN = (0.0, 1.0, 0.0)
+
+
+class LevelAnalysis:
+    def __init__(self, name, platforms, coins, physics=None):
+        self.name = name
+        self.physics = physics or JumpPhysics()
+        self.platforms = np.array([p[:6] for p in platforms], dtype=np.float64).reshape(-1, 6)
+        self.coins = np.array([c[:3] for c in coins], dtype=np.float64).reshape(-1, 3)
+
+        self.start = None
+        self.edges = None
+        self.jumps = None        # Jumps needed to reach each platform (-1 = never)
+        self.parent = None       # BFS tree for path reconstruction
+        self.coin_platform = None  # Nearest (in jumps) platform a coin is collected from
+        self.coin_jumps = None
+
+    @classmethod
+    def from_file(cls, filename, physics=None):
+        with open(filename, 'r') as f:
+            level_data, _ = expand_level(json.load(f))
+        return cls(filename, level_data.get("platforms", []), level_data.get("coins", []), physics)
+
+    def run(self):
+        self.start = self.find_start()
+        self.edges = self.build_jump_graph()
+        self.jumps, self.parent = self.shortest_jumps(self.start)
+        self.coin_platform, self.coin_jumps = self.match_coins()
+        return self
+
+    def find_start(self):
+        """Platform the player lands on after spawning (None if they fall forever)"""
+        p = self.platforms
+        if len(p) == 0:
+            return None
+        x, y, z = SPAWN
+        top = p[:, 1] + p[:, 4] / 2
+        under = ((np.abs(x - p[:, 0]) < p[:, 3] / 2 + PLAYER_SIZE) &
+                 (np.abs(z - p[:, 2]) < p[:, 5] / 2 + PLAYER_SIZE) &
+                 (top <= y - PLAYER_SIZE))
+        if not under.any():
+            return None
+        candidates = np.flatnonzero(under)
+        return int(candidates[np.argmax(top[candidates])])
+
+    def build_jump_graph(self):
+        """Directed edges (src, dst) between platforms, one jump or fall apart.
+
+        Candidate pairs come from a uniform grid over footprints grown by the
+        farthest possible jump, so we never test platforms that are far apart.
+        """
+        p = self.platforms
+        n = len(p)
+        if n == 0:
+            return np.zeros((0, 2), dtype=np.int64)
+
+        max_reach = float(self.physics.reach(np.linspace(-20, self.physics.apex, 512)).max())
+        grow = max_reach / 2 + PLAYER_SIZE
+        x, y, z, w, h, d = p.T
+        top = y + h / 2
+        boxes = np.stack([x - w / 2 - grow, x + w / 2 + grow,
+                          np.full(n, -np.inf), np.full(n, np.inf),
+                          z - d / 2 - grow, z + d / 2 + grow], axis=1)
+        cell = float(max(w.max(), d.max())) + 2 * grow
+        src, dst = overlap_pairs(boxes, boxes, cell)
+        keep = src != dst
+        src, dst = src[keep], dst[keep]
+
+        gx = np.abs(x[src] - x[dst]) - (w[src] + w[dst]) / 2 - 2 * PLAYER_SIZE
+        gz = np.abs(z[src] - z[dst]) - (d[src] + d[dst]) / 2 - 2 * PLAYER_SIZE
+        gap = np.hypot(np.maximum(gx, 0), np.maximum(gz, 0))
+        reach = self.physics.reach(top[dst] - top[src])
+        ok = (reach >= 0) & (gap <= reach + 1e-6)
+        return np.stack([src[ok], dst[ok]], axis=1)
+
+    def shortest_jumps(self, start):
+        """Level-synchronous BFS over the jump graph"""
+        n = len(self.platforms)
+        jumps = np.full(n, -1, dtype=np.int64)
+        parent = np.full(n, -1, dtype=np.int64)
+        if start is None:
+            return jumps, parent
+
+        order = np.argsort(self.edges[:, 0], kind="stable")
+        src = self.edges[order, 0]
+        dst = self.edges[order, 1]
+        indptr = np.searchsorted(src, np.arange(n + 1))
+
+        jumps[start] = 0
+        frontier = np.array([start])
+        depth = 0
+        while len(frontier):
+            depth += 1
+            lo = indptr[frontier]
+            counts = indptr[frontier + 1] - lo
+            total = int(counts.sum())
+            if total == 0:
+                break
+            from_node = np.repeat(frontier, counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            to_node = dst[starts + np.arange(total)]
+            new = jumps[to_node] < 0
+            to_node, from_node = to_node[new], from_node[new]
+            to_node, first = np.unique(to_node, return_index=True)
+            jumps[to_node] = depth
+            parent[to_node] = from_node[first]
+            frontier = to_node
+        return jumps, parent
+
+    def match_coins(self):
+        """For each coin, the reachable platform it can be grabbed from in the fewest jumps"""
+        p, c = self.platforms, self.coins
+        coin_platform = np.full(len(c), -1, dtype=np.int64)
+        coin_jumps = np.full(len(c), -1, dtype=np.int64)
+        if len(c) == 0 or len(p) == 0:
+            return coin_platform, coin_jumps
+
+        # coin_reach is smooth in dy, so tabulate it once and interpolate
+        table_dy = np.linspace(-25.0, self.physics.apex + COIN_RADIUS, 1024)
+        table = self.physics.coin_reach(table_dy)
+        max_reach = float(table.max())
+
+        x, y, z, w, h, d = p.T
+        top = y + h / 2
+        plat_boxes = np.stack([x - w / 2 - PLAYER_SIZE, x + w / 2 + PLAYER_SIZE,
+                               np.full(len(p), -np.inf), np.full(len(p), np.inf),
+                               z - d / 2 - PLAYER_SIZE, z + d / 2 + PLAYER_SIZE], axis=1)
+        coin_boxes = np.stack([c[:, 0] - max_reach, c[:, 0] + max_reach,
+                               np.full(len(c), -np.inf), np.full(len(c), np.inf),
+                               c[:, 2] - max_reach, c[:, 2] + max_reach], axis=1)
+        cell = float(max(w.max(), d.max())) + 2 * PLAYER_SIZE + 2 * max_reach
+        ci, pi = overlap_pairs(coin_boxes, plat_boxes, cell)
+
+        reachable = self.jumps[pi] >= 0
+        ci, pi = ci[reachable], pi[reachable]
+        dy = c[ci, 1] - (top[pi] + PLAYER_SIZE)
+        gx = np.maximum(np.abs(c[ci, 0] - x[pi]) - w[pi] / 2 - PLAYER_SIZE, 0)
+        gz = np.maximum(np.abs(c[ci, 2] - z[pi]) - d[pi] / 2 - PLAYER_SIZE, 0)
+        limit = np.interp(dy, table_dy, table, left=table[0], right=-1.0)
+        ok = np.hypot(gx, gz) <= limit
+        ci, pi = ci[ok], pi[ok]
+
+        # Keep the fewest-jumps platform per coin
+        order = np.lexsort((self.jumps[pi], ci))
+        ci, pi = ci[order], pi[order]
+        ci, first = np.unique(ci, return_index=True)
+        coin_platform[ci] = pi[first]
+        coin_jumps[ci] = self.jumps[pi[first]]
+        return coin_platform, coin_jumps
+
+    def path_to(self, platform):
+        """Platform indices from the start to `platform`, or [] if unreachable"""
+        if platform is None or platform < 0 or self.jumps[platform] < 0:
+            return []
+        path = [int(platform)]
+        while self.parent[path[-1]] >= 0:
+            path.append(int(self.parent[path[-1]]))
+        return path[::-1]
+
+    @property
+    def unreachable_platforms(self):
+        return np.flatnonzero(self.jumps < 0).tolist()
+
+    @property
+    def unreachable_coins(self):
+        return np.flatnonzero(self.coin_platform < 0).tolist()
+
+    @property
+    def passed(self):
+        return self.start is not None and not self.unreachable_coins
+
+    def summary(self):
+        """Plain data for printing and for passing between worker processes"""
+        result = {
+            "name": self.name,
+            "platforms": len(self.platforms),
+            "coins": len(self.coins),
+            "edges": len(self.edges),
+            "start": self.start,
+            "passed": self.passed,
+            "unreachable_platforms": self.unreachable_platforms,
+            "unreachable_coins": self.unreachable_coins,
+            "longest_path": [],
+        }
+        if len(self.coins) and (self.coin_jumps >= 0).any():
+            hardest = int(np.argmax(self.coin_jumps))
+            result["hardest_coin"] = hardest
+            result["longest_path"] = self.path_to(self.coin_platform[hardest])
+        return result
+
+
+def analyze_file(filename):
+    """Worker entry point; never raises so one bad file can't stop a batch"""
+    start = time.perf_counter()
+    try:
+        result = LevelAnalysis.from_file(filename).run().summary()
+    except Exception as e:
+        result = {"name": filename, "passed": False, "error": str(e)}
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def find_level_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if filename.endswith('.json') and filename != 'platformer_save.json':
+                    files.append(os.path.join(path, filename))
+        else:
+            files.append(path)
+    return files
+
+
+def check_levels(files, workers=None):
+    """Analyze many levels in a process pool, yielding results as they finish"""
+    if len(files) <= 1 or workers == 1:
+        for filename in files:
+            yield analyze_file(filename)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(analyze_file, files):
+            yield result
+
+
+def print_result(result, show_all=False):
+    name = result["name"]
+    if "error" in result:
+        print(f"✗ {name}: could not analyze ({result['error']})")
+        return
+    status = "✓" if result["passed"] else "✗"
+    print(f"{status} {name}: {result['platforms']} platforms, {result['coins']} coins, "
+          f"{result['edges']} jumps ({result['seconds']:.2f}s)")
+    if result["start"] is None:
+        print("   No platform under the spawn point (0, 1, 0) - the player falls forever")
+    limit = None if show_all else 20
+    if result["unreachable_coins"]:
+        coins = result["unreachable_coins"]
+        print(f"   Unreachable coins ({len(coins)}): {coins[:limit]}{' ...' if limit and len(coins) > limit else ''}")
+    if result["unreachable_platforms"]:
+        platforms = result["unreachable_platforms"]
+        print(f"   Unreachable platforms ({len(platforms)}): {platforms[:limit]}{' ...' if limit and len(platforms) > limit else ''}")
+    if result["longest_path"]:
+        path = result["longest_path"]
+        shown = " -> ".join(str(i) for i in path[:limit]) + (" ..." if limit and len(path) > limit else "")
+        print(f"   Hardest coin {result['hardest_coin']}: {len(path) - 1} jumps via {shown}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that every coin in a level can be reached")
+    parser.add_argument("paths", nargs="+", help="Level files or directories of levels")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per CPU)")
+    parser.add_argument("--path", type=int, default=None, help="Print the jump path to this coin")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON lines")
+    parser.add_argument("--all", action="store_true", help="Don't truncate long lists")
+    args = parser.parse_args()
+
+    files = find_level_files(args.paths)
+    if not files:
+        print("No level files found")
+        return 1
+
+    if args.path is not None:
+        analysis = LevelAnalysis.from_file(files[0]).run()
+        if not 0 <= args.path < len(analysis.coins):
+            print(f"Coin {args.path} does not exist")
+            return 1
+        path = analysis.path_to(analysis.coin_platform[args.path])
+        if not path:
+            print(f"Coin {args.path} is unreachable")
+            return 1
+        print(f"Coin {args.path}: {len(path) - 1} jumps")
+        for i in path:
+            print(f"   platform {i}: {analysis.platforms[i].round(2).tolist()}")
+        return 0
+
+    failed = 0
+    for result in check_levels(files, args.workers):
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_result(result, args.all)
+        if not result["passed"]:
+            failed += 1
+
+    print(f"{len(files) - failed}/{len(files)} levels passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
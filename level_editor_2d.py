@@ -1,7 +1,15 @@
 import pygame
+import copy
 import json
 import math
 import os
+import subprocess
+import sys
+
+import numpy as np
+
+from live_preview import PreviewPublisher
+from prefabs import Prefab, expand_level, instance_spec, rotate_boxes
 
 # Initialize pygame
 pygame.init()
@@ -42,6 +50,27 @@ PLATFORM_COLORS = [
 ]
 
 COLOR_NAMES = ["Green", "Dark Green", "Blue", "Red", "White", "Yellow", "Purple", "Orange", "Cyan"]
+PALETTE = np.array(PLATFORM_COLORS, dtype=np.int64)
+GAME_COLORS = PALETTE / 255.0  # The game's 0-1 range
+
+# Selections and bulk edits
+NO_SELECTION = np.zeros(0, dtype=np.int64)
+XZ = [0, 2]                # Columns of the ground-plane position
+WIDTH_DEPTH = [3, 5]
+COIN_PICK_RADIUS = 0.3
+BAND_MIN_PIXELS = 4        # A shorter drag is a click
+DUPLICATE_OFFSET = np.array([1.0, 0.0, 1.0, 0.0, 0.0, 0.0])
+
+def nearest_palette(colors):
+    """Palette index closest to each game color (0-1 range)"""
+    editor_colors = (np.array([color[:3] for color in colors], dtype=np.float64).reshape(-1, 3) * 255).astype(np.int64)
+    dist = ((editor_colors[:, None, :] - PALETTE[None, :, :]) ** 2).sum(axis=2)
+    return dist.argmin(axis=1)
+
+def selection_position(selection, index):
+    """Where `index` is in a sorted selection array, or None if it isn't selected"""
+    k = int(np.searchsorted(selection, index))
+    return k if k < len(selection) and selection[k] == index else None
 
 class Camera:
     def __init__(self):
@@ -69,16 +98,29 @@ class LevelEditor2D:
         self.small_font = pygame.font.Font(None, 18)
         
         self.camera = Camera()
-        self.platforms = []  # [x, y, z, width, height, depth, color_index]
-        self.coins = []      # [x, y, z]
+        # Columns in arrays, so an edit applies to a whole selection in one numpy operation
+        self.platforms = np.zeros((0, 6))                  # x, y, z, width, height, depth
+        self.platform_color = np.zeros(0, dtype=np.int64)  # Index into PLATFORM_COLORS
+        self.coins = np.zeros((0, 3))                      # x, y, z
+        self.platform_instance = np.zeros(0, dtype=np.int64)  # Index into self.instances, -1 if none
+        
+        # Prefabs (see prefabs.py): name -> {"platforms", "platform_colors"} relative to the origin.
+        # Instances are {"prefab", "rotation"}; their platforms are ordinary rows tagged above.
+        self.prefabs = {}
+        self.instances = []
+        self.prefab_name = None   # Stamped by clicks in prefab mode
+        self.stamp_rotation = 0   # Quarter turns
         
-        self.selected_platform = None
-        self.selected_coin = None
-        self.mode = "platform"  # "platform" or "coin"
+        # Selections are sorted index arrays into the storage above
+        self.selected_platforms = NO_SELECTION
+        self.selected_coins = NO_SELECTION
+        self.mode = "platform"  # "platform", "coin" or "prefab"
         self.color_index = 0
         
         self.dragging = False
         self.drag_offset = (0, 0)
+        self.band_start = None  # Screen position where a box selection started
+        self.band_end = None
         
         self.snap_to_grid = True
         self.grid_snap = 0.5
@@ -87,41 +129,82 @@ class LevelEditor2D:
         self.save_slot = 1
         
         # Create a default platform
-        self.platforms = [[0, 0.25, 0, 2, 0.5, 2, 0]]
+        self.platforms = np.array([[0, 0.25, 0, 2, 0.5, 2]], dtype=np.float64)
+        self.platform_color = np.zeros(1, dtype=np.int64)
+        self.platform_instance = np.full(1, -1, dtype=np.int64)
+        
+        # Moving platforms: platform index -> {"path": offsets, "speed": ..., "phase": ...}
+        self.motion = {}
+        
+        # Hazards (see hazards.py) aren't edited here; they are kept as loaded and saved back unchanged
+        self.hazards = []
+        
+        # Live 3D preview (F5): the level is published to a game process after every edit
+        self.preview = None
+        self.preview_process = None
+        self.dirty = False
         
         print("=== 2D Level Editor ===")
-        print("Mouse: Left click - Select/Place, Right drag - Pan camera, Wheel - Zoom")
-        print("F1 - Platform mode, F2 - Coin mode")
-        print("WASD/Arrow Keys - Move selected object")
-        print("Q/E - Lower/Raise Y position")
-        print("R/T - Shrink/Grow selected platform")
+        print("Mouse: Left click - Select/Place, Left drag - Box select, Right drag - Pan camera, Wheel - Zoom")
+        print("Shift+click/drag - Add to selection, Ctrl+A - Select all")
+        print("F1 - Platform mode, F2 - Coin mode, F3 - Prefab mode (click stamps the current prefab)")
+        print("B - Make a prefab from the selection, N - Next prefab, V - Turn the stamp a quarter turn")
+        print("WASD/Arrow Keys - Move selection")
+        print("Q/E - Lower/Raise selection")
+        print("R/T - Shrink/Grow selected platforms")
         print("C - Change color, G - Toggle grid snap")
+        print("Ctrl+D - Duplicate selection, X - Mirror selection left/right, Shift+X - Mirror front/back")
+        print("M - Toggle moving platform, Ctrl+click - Add path point, Backspace - Remove last point")
+        print("[/] - Slower/Faster, P - Shift phase")
         print("S - Save, L - Load, 1-5 - Change save slot")
-        print("Delete - Remove selected, ESC - Exit")
+        print("F5 - Live 3D preview (plays the level in the game while you edit)")
+        print("Delete - Remove selection, ESC - Exit")
         print("======================")
     
     def snap_position(self, x, y):
+        """Scalars or arrays"""
         if self.snap_to_grid:
-            x = round(x / self.grid_snap) * self.grid_snap
-            y = round(y / self.grid_snap) * self.grid_snap
+            x = np.round(np.divide(x, self.grid_snap)) * self.grid_snap
+            y = np.round(np.divide(y, self.grid_snap)) * self.grid_snap
         return x, y
     
     def handle_events(self):
         for event in pygame.event.get():
+            if event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+                self.dirty = True  # Every edit starts with one of these
+            
             if event.type == pygame.QUIT:
                 return False
             
             elif event.type == pygame.KEYDOWN:
+                ctrl = event.mod & pygame.KMOD_CTRL
                 if event.key == pygame.K_ESCAPE:
                     return False
+                elif event.key == pygame.K_F5:
+                    self.start_preview()
                 elif event.key == pygame.K_F1:
                     self.mode = "platform"
-                    self.selected_coin = None
                     print("Platform mode")
                 elif event.key == pygame.K_F2:
                     self.mode = "coin"
-                    self.selected_platform = None
                     print("Coin mode")
+                elif event.key == pygame.K_F3:
+                    self.mode = "prefab"
+                    print(f"Prefab mode: {self.prefab_name or 'no prefabs yet (B makes one)'}")
+                elif event.key == pygame.K_b:
+                    self.make_prefab()
+                elif event.key == pygame.K_n:
+                    self.next_prefab()
+                elif event.key == pygame.K_v:
+                    self.stamp_rotation = (self.stamp_rotation + 1) % 4
+                    print(f"Stamp rotation: {self.stamp_rotation * 90} degrees")
+                elif event.key == pygame.K_a and ctrl:
+                    self.select(np.arange(len(self.platforms)), np.arange(len(self.coins)))
+                    print(f"Selected all: {len(self.platforms)} platforms, {len(self.coins)} coins")
+                elif event.key == pygame.K_d and ctrl:
+                    self.duplicate_selected()
+                elif event.key == pygame.K_x:
+                    self.mirror_selected(2 if event.mod & pygame.KMOD_SHIFT else 0)
                 elif event.key == pygame.K_c:
                     self.change_color()
                 elif event.key == pygame.K_g:
@@ -133,6 +216,14 @@ class LevelEditor2D:
                     self.load_level()
                 elif event.key == pygame.K_DELETE:
                     self.delete_selected()
+                elif event.key == pygame.K_m:
+                    self.toggle_motion()
+                elif event.key == pygame.K_BACKSPACE:
+                    self.remove_path_point()
+                elif event.key in (pygame.K_LEFTBRACKET, pygame.K_RIGHTBRACKET):
+                    self.change_speed(-0.25 if event.key == pygame.K_LEFTBRACKET else 0.25)
+                elif event.key == pygame.K_p:
+                    self.shift_phase()
                 elif event.key in (pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5):
                     self.save_slot = event.key - pygame.K_0
                     print(f"Save slot: {self.save_slot}")
@@ -165,10 +256,14 @@ class LevelEditor2D:
                     self.drag_offset = event.pos
             
             elif event.type == pygame.MOUSEBUTTONUP:
-                if event.button == 3:  # Right click release
+                if event.button == 1 and self.band_start is not None:
+                    self.finish_band(event.pos)
+                elif event.button == 3:  # Right click release
                     self.dragging = False
             
             elif event.type == pygame.MOUSEMOTION:
+                if self.band_start is not None:
+                    self.band_end = event.pos
                 if self.dragging:
                     # Pan camera
                     dx = event.pos[0] - self.drag_offset[0]
@@ -188,114 +283,322 @@ class LevelEditor2D:
         
         return True
     
+    # Selection
+    
+    def objects_in_box(self, xmin, zmin, xmax, zmax):
+        """Indices of platforms and coins whose footprint overlaps the box (a point when min == max)"""
+        p = self.platforms
+        half_w, half_d = p[:, 3] / 2, p[:, 5] / 2
+        platforms = ((p[:, 0] - half_w < xmax) & (xmin < p[:, 0] + half_w) &
+                     (p[:, 2] - half_d < zmax) & (zmin < p[:, 2] + half_d))
+        c = self.coins
+        coins = ((c[:, 0] - COIN_PICK_RADIUS < xmax) & (xmin < c[:, 0] + COIN_PICK_RADIUS) &
+                 (c[:, 2] - COIN_PICK_RADIUS < zmax) & (zmin < c[:, 2] + COIN_PICK_RADIUS))
+        return np.flatnonzero(platforms), np.flatnonzero(coins)
+    
+    def select(self, platforms, coins, add=False):
+        platforms = np.asarray(platforms, dtype=np.int64)
+        coins = np.asarray(coins, dtype=np.int64)
+        if add:
+            platforms = np.union1d(self.selected_platforms, platforms)
+            coins = np.union1d(self.selected_coins, coins)
+        self.selected_platforms = platforms
+        self.selected_coins = coins
+    
+    def single_platform(self):
+        """The selected platform when exactly one is selected, for the per-platform motion tools"""
+        return int(self.selected_platforms[0]) if len(self.selected_platforms) == 1 else None
+    
     def handle_left_click(self, pos):
         world_x, world_z = self.camera.screen_to_world(pos[0], pos[1])
+        mods = pygame.key.get_mods()
         
-        # Check for selection
-        selected_something = False
+        # Ctrl+click extends the selected moving platform's path
+        if mods & pygame.KMOD_CTRL and self.single_platform() in self.motion:
+            self.add_path_point(world_x, world_z)
+            return
         
-        # Check platforms
-        for i, platform in enumerate(self.platforms):
-            px, py, pz, pw, ph, pd = platform[:6]
-            if (abs(world_x - px) < pw/2 and abs(world_z - pz) < pd/2):
-                self.selected_platform = i
-                self.selected_coin = None
-                selected_something = True
-                print(f"Selected platform {i}")
-                break
-        
-        # Check coins if no platform selected
-        if not selected_something:
-            for i, coin in enumerate(self.coins):
-                cx, cy, cz = coin
-                if (abs(world_x - cx) < 0.3 and abs(world_z - cz) < 0.3):
-                    self.selected_coin = i
-                    self.selected_platform = None
-                    selected_something = True
-                    print(f"Selected coin {i}")
-                    break
+        # Platforms first, then coins, like before; Shift adds to the selection
+        platforms, coins = self.objects_in_box(world_x, world_z, world_x, world_z)
+        if len(platforms):
+            self.select(platforms[:1], NO_SELECTION, mods & pygame.KMOD_SHIFT)
+            print(f"Selected platform {platforms[0]}")
+        elif len(coins):
+            self.select(NO_SELECTION, coins[:1], mods & pygame.KMOD_SHIFT)
+            print(f"Selected coin {coins[0]}")
+        else:
+            # Empty space: dragging makes a box selection, a plain click places an object
+            self.band_start = self.band_end = pos
+    
+    def finish_band(self, pos):
+        start, self.band_start, self.band_end = self.band_start, None, None
+        if abs(pos[0] - start[0]) < BAND_MIN_PIXELS and abs(pos[1] - start[1]) < BAND_MIN_PIXELS:
+            self.place_object(*self.camera.screen_to_world(start[0], start[1]))
+            return
+        x0, z0 = self.camera.screen_to_world(start[0], start[1])
+        x1, z1 = self.camera.screen_to_world(pos[0], pos[1])
+        platforms, coins = self.objects_in_box(min(x0, x1), min(z0, z1), max(x0, x1), max(z0, z1))
+        self.select(platforms, coins, pygame.key.get_mods() & pygame.KMOD_SHIFT)
+        print(f"Selected {len(self.selected_platforms)} platforms, {len(self.selected_coins)} coins")
+    
+    def place_object(self, world_x, world_z):
+        world_x, world_z = self.snap_position(world_x, world_z)
         
-        # Place new object if nothing selected
-        if not selected_something:
-            world_x, world_z = self.snap_position(world_x, world_z)
-            
-            if self.mode == "platform":
-                self.platforms.append([world_x, 0.25, world_z, 1.0, 0.5, 1.0, self.color_index])
-                self.selected_platform = len(self.platforms) - 1
-                self.selected_coin = None
-                print(f"Placed platform at ({world_x:.1f}, {world_z:.1f})")
-            elif self.mode == "coin":
-                self.coins.append([world_x, 0.5, world_z])
-                self.selected_coin = len(self.coins) - 1
-                self.selected_platform = None
-                print(f"Placed coin at ({world_x:.1f}, {world_z:.1f})")
+        if self.mode == "platform":
+            self.platforms = np.vstack([self.platforms, [[world_x, 0.25, world_z, 1.0, 0.5, 1.0]]])
+            self.platform_color = np.append(self.platform_color, self.color_index)
+            self.platform_instance = np.append(self.platform_instance, -1)
+            self.select([len(self.platforms) - 1], NO_SELECTION)
+            print(f"Placed platform at ({world_x:.1f}, {world_z:.1f})")
+        elif self.mode == "coin":
+            self.coins = np.vstack([self.coins, [[world_x, 0.5, world_z]]])
+            self.select(NO_SELECTION, [len(self.coins) - 1])
+            print(f"Placed coin at ({world_x:.1f}, {world_z:.1f})")
+        elif self.mode == "prefab":
+            self.stamp_prefab(world_x, world_z)
+    
+    # Prefabs
+    
+    def make_prefab(self):
+        """Turn the selected platforms into a new prefab, and the selection into its first instance"""
+        p = np.setdiff1d(self.selected_platforms, list(self.motion))  # Motion belongs to one platform
+        if not len(p):
+            print("Select static platforms to make a prefab")
+            return
+        rows = self.platforms[p].copy()
+        half = rows[:, WIDTH_DEPTH] / 2
+        origin = self.snap_position(*(((rows[:, XZ] - half).min(axis=0) + (rows[:, XZ] + half).max(axis=0)) / 2))
+        rows[:, XZ] -= origin
+        number = len(self.prefabs) + 1
+        while f"prefab_{number}" in self.prefabs:
+            number += 1
+        self.prefab_name = f"prefab_{number}"
+        self.prefabs[self.prefab_name] = {"platforms": rows.tolist(),
+                                          "platform_colors": GAME_COLORS[self.platform_color[p]].tolist()}
+        self.instances.append({"prefab": self.prefab_name, "rotation": 0})
+        self.platform_instance[p] = len(self.instances) - 1
+        print(f"Made {self.prefab_name} from {len(p)} platforms; F3 and click to stamp it")
+    
+    def next_prefab(self):
+        names = list(self.prefabs)
+        if not names:
+            print("No prefabs yet (B makes one from the selection)")
+            return
+        k = names.index(self.prefab_name) + 1 if self.prefab_name in names else 0
+        self.prefab_name = names[k % len(names)]
+        print(f"Prefab: {self.prefab_name} ({len(self.prefabs[self.prefab_name]['platforms'])} platforms)")
+    
+    def stamp_prefab(self, world_x, world_z):
+        if self.prefab_name is None:
+            print("No prefabs yet (B makes one from the selection)")
+            return
+        prefab = self.prefabs[self.prefab_name]
+        rows = rotate_boxes(prefab["platforms"], self.stamp_rotation)
+        rows[:, XZ] += (world_x, world_z)
+        first = len(self.platforms)
+        self.instances.append({"prefab": self.prefab_name, "rotation": self.stamp_rotation})
+        self.platforms = np.vstack([self.platforms, rows])
+        self.platform_color = np.concatenate([self.platform_color, nearest_palette(prefab["platform_colors"])])
+        self.platform_instance = np.concatenate([self.platform_instance,
+                                                 np.full(len(rows), len(self.instances) - 1, dtype=np.int64)])
+        self.select(np.arange(first, len(self.platforms)), NO_SELECTION)
+        print(f"Stamped {self.prefab_name} at ({world_x:.1f}, {world_z:.1f})")
+    
+    def intact_instances(self):
+        """Rows that still form whole prefab instances, and the "instances" entries they save as.
+
+        Instances edited out of shape (resized, mirrored, partly deleted, unevenly
+        recolored, set moving) save as plain platforms instead.
+        """
+        owner = self.platform_instance
+        intact = np.zeros(len(owner), dtype=bool)
+        specs = []
+        order = np.argsort(owner, kind="stable")  # Rows of one instance stay in prefab order
+        ids, starts, counts = np.unique(owner[order], return_index=True, return_counts=True)
+        for instance, start, count in zip(ids.tolist(), starts.tolist(), counts.tolist()):
+            if instance < 0:
+                continue
+            rows = order[start:start + count]
+            name, rotation = self.instances[instance]["prefab"], self.instances[instance]["rotation"]
+            prefab = self.prefabs[name]
+            local = rotate_boxes(prefab["platforms"], rotation)
+            if len(local) != count or any(int(i) in self.motion for i in rows):
+                continue
+            position = self.platforms[rows[0], :3] - local[0, :3]
+            local[:, :3] += position
+            if not np.allclose(self.platforms[rows], local):
+                continue
+            colors = self.platform_color[rows]
+            color = None
+            if not np.array_equal(colors, nearest_palette(prefab["platform_colors"])):
+                if (colors != colors[0]).any():
+                    continue
+                color = GAME_COLORS[colors[0]]
+            intact[rows] = True
+            specs.append(instance_spec(name, position, rotation, color))
+        return intact, specs
+    
+    # Transforms; each is a few numpy operations over the whole selection
     
     def move_selected(self, dx, dz):
-        if self.selected_platform is not None:
-            self.platforms[self.selected_platform][0] += dx
-            self.platforms[self.selected_platform][2] += dz
-            if self.snap_to_grid:
-                x, z = self.snap_position(self.platforms[self.selected_platform][0], self.platforms[self.selected_platform][2])
-                self.platforms[self.selected_platform][0] = x
-                self.platforms[self.selected_platform][2] = z
-        elif self.selected_coin is not None:
-            self.coins[self.selected_coin][0] += dx
-            self.coins[self.selected_coin][2] += dz
-            if self.snap_to_grid:
-                x, z = self.snap_position(self.coins[self.selected_coin][0], self.coins[self.selected_coin][2])
-                self.coins[self.selected_coin][0] = x
-                self.coins[self.selected_coin][2] = z
+        p, c = self.selected_platforms, self.selected_coins
+        self.platforms[np.ix_(p, XZ)] += (dx, dz)
+        self.coins[np.ix_(c, XZ)] += (dx, dz)
+        if self.snap_to_grid:
+            self.platforms[np.ix_(p, XZ)] = np.stack(self.snap_position(self.platforms[p, 0], self.platforms[p, 2]), axis=1)
+            self.coins[np.ix_(c, XZ)] = np.stack(self.snap_position(self.coins[c, 0], self.coins[c, 2]), axis=1)
     
     def move_selected_y(self, dy):
-        if self.selected_platform is not None:
-            self.platforms[self.selected_platform][1] += dy
-        elif self.selected_coin is not None:
-            self.coins[self.selected_coin][1] += dy
+        self.platforms[self.selected_platforms, 1] += dy
+        self.coins[self.selected_coins, 1] += dy
     
     def resize_selected(self, delta):
-        if self.selected_platform is not None:
-            platform = self.platforms[self.selected_platform]
-            platform[3] = max(0.5, platform[3] + delta)  # width
-            platform[5] = max(0.5, platform[5] + delta)  # depth
-            print(f"Platform size: {platform[3]:.1f} x {platform[5]:.1f}")
+        p = self.selected_platforms
+        if not len(p):
+            return
+        sizes = np.maximum(0.5, self.platforms[np.ix_(p, WIDTH_DEPTH)] + delta)
+        self.platforms[np.ix_(p, WIDTH_DEPTH)] = sizes
+        if len(p) == 1:
+            print(f"Platform size: {sizes[0, 0]:.1f} x {sizes[0, 1]:.1f}")
+        else:
+            print(f"Resized {len(p)} platforms")
     
     def change_color(self):
-        if self.selected_platform is not None:
-            platform = self.platforms[self.selected_platform]
-            platform[6] = (platform[6] + 1) % len(PLATFORM_COLORS)
-            print(f"Platform color: {COLOR_NAMES[platform[6]]}")
+        p = self.selected_platforms
+        if len(p):
+            # The whole selection takes the color after the first platform's
+            color = (int(self.platform_color[p[0]]) + 1) % len(PLATFORM_COLORS)
+            self.platform_color[p] = color
+            print(f"Platform color: {COLOR_NAMES[color]}")
         else:
             self.color_index = (self.color_index + 1) % len(PLATFORM_COLORS)
             print(f"Next color: {COLOR_NAMES[self.color_index]}")
     
+    def duplicate_selected(self):
+        """Copy the selection one unit along x and z, and select the copies"""
+        p, c = self.selected_platforms, self.selected_coins
+        if not len(p) and not len(c):
+            return
+        first_platform, first_coin = len(self.platforms), len(self.coins)
+        self.platforms = np.vstack([self.platforms, self.platforms[p] + DUPLICATE_OFFSET])
+        self.platform_color = np.concatenate([self.platform_color, self.platform_color[p]])
+        # Copied instances become new instances of the same prefab
+        owners = self.platform_instance[p]
+        copies = np.full(len(p), -1, dtype=np.int64)
+        for instance in np.unique(owners[owners >= 0]).tolist():
+            self.instances.append(dict(self.instances[instance]))
+            copies[owners == instance] = len(self.instances) - 1
+        self.platform_instance = np.concatenate([self.platform_instance, copies])
+        self.coins = np.vstack([self.coins, self.coins[c] + DUPLICATE_OFFSET[:3]])
+        for i, motion in list(self.motion.items()):
+            k = selection_position(p, i)
+            if k is not None:
+                self.motion[first_platform + k] = copy.deepcopy(motion)
+        self.select(np.arange(first_platform, len(self.platforms)), np.arange(first_coin, len(self.coins)))
+        print(f"Duplicated {len(p)} platforms, {len(c)} coins")
+    
+    def mirror_selected(self, axis):
+        """Flip the selection about its own center; axis 0 mirrors left/right, 2 front/back"""
+        p, c = self.selected_platforms, self.selected_coins
+        extents = []
+        if len(p):
+            half = self.platforms[p, axis + 3] / 2
+            extents += [(self.platforms[p, axis] - half).min(), (self.platforms[p, axis] + half).max()]
+        if len(c):
+            extents += [self.coins[c, axis].min(), self.coins[c, axis].max()]
+        if not extents:
+            return
+        twice_center = min(extents) + max(extents)
+        self.platforms[p, axis] = twice_center - self.platforms[p, axis]
+        self.coins[c, axis] = twice_center - self.coins[c, axis]
+        # Paths of moving platforms flip with them
+        for i, motion in self.motion.items():
+            if selection_position(p, i) is not None:
+                motion["path"] = [[-v if j == axis else v for j, v in enumerate(point)] for point in motion["path"]]
+        print(f"Mirrored {len(p)} platforms, {len(c)} coins {'left/right' if axis == 0 else 'front/back'}")
+    
+    def toggle_motion(self):
+        index = self.single_platform()
+        if index is None:
+            return
+        if index in self.motion:
+            del self.motion[index]
+            print("Platform is static")
+        else:
+            self.motion[index] = {"path": [[0, 0, 0], [2, 0, 0]], "speed": 1.0, "phase": 0.0}
+            print("Platform moves (Ctrl+click to add path points)")
+    
+    def add_path_point(self, world_x, world_z):
+        index = self.single_platform()
+        platform = self.platforms[index]
+        world_x, world_z = self.snap_position(world_x, world_z)
+        motion = self.motion[index]
+        motion["path"].append([float(world_x - platform[0]), 0, float(world_z - platform[2])])
+        print(f"Path points: {len(motion['path'])}")
+    
+    def remove_path_point(self):
+        motion = self.motion.get(self.single_platform())
+        if motion and len(motion["path"]) > 2:
+            motion["path"].pop()
+            print(f"Path points: {len(motion['path'])}")
+    
+    def change_speed(self, delta):
+        motion = self.motion.get(self.single_platform())
+        if motion:
+            motion["speed"] = max(0.25, motion["speed"] + delta)
+            print(f"Speed: {motion['speed']:.2f}")
+    
+    def shift_phase(self):
+        motion = self.motion.get(self.single_platform())
+        if motion:
+            motion["phase"] = (motion["phase"] + 0.25) % 1.0
+            print(f"Phase: {motion['phase']:.2f}")
+    
     def delete_selected(self):
-        if self.selected_platform is not None:
-            del self.platforms[self.selected_platform]
-            self.selected_platform = None
-            print("Deleted platform")
-        elif self.selected_coin is not None:
-            del self.coins[self.selected_coin]
-            self.selected_coin = None
-            print("Deleted coin")
+        p, c = self.selected_platforms, self.selected_coins
+        if not len(p) and not len(c):
+            return
+        if len(p):
+            self.platforms = np.delete(self.platforms, p, axis=0)
+            self.platform_color = np.delete(self.platform_color, p)
+            self.platform_instance = np.delete(self.platform_instance, p)
+            # Motion is keyed by platform index, so shift the rest down past the deleted rows
+            self.motion = {i - int(np.searchsorted(p, i)): m for i, m in self.motion.items()
+                           if selection_position(p, i) is None}
+        if len(c):
+            self.coins = np.delete(self.coins, c, axis=0)
+        self.select(NO_SELECTION, NO_SELECTION)
+        print(f"Deleted {len(p)} platforms, {len(c)} coins")
     
-    def save_level(self):
-        filename = f"{self.current_level_name}_{self.save_slot}.json"
-        
-        platforms_data = []
-        platform_colors_data = []
-        
-        for platform in self.platforms:
-            platforms_data.append(platform[:6])  # x, y, z, w, h, d
-            color_index = platform[6]
-            # Convert to game format (0-1 range)
-            game_color = tuple(c / 255.0 for c in PLATFORM_COLORS[color_index])
-            platform_colors_data.append(list(game_color))
-        
+    # Files and preview
+    
+    def moving_platforms(self, rows=None):
+        """With `rows`, the platforms being saved, indices are positions in it"""
+        return [{"index": i if rows is None else int(np.searchsorted(rows, i)),
+                 "path": m["path"], "speed": m["speed"], "phase": m["phase"]}
+                for i, m in sorted(self.motion.items())]
+    
+    def level_data(self):
+        """The level in the game's my_level_N.json layout; intact instances are saved as references"""
+        intact, specs = self.intact_instances()
+        plain = np.flatnonzero(~intact)
         level_data = {
-            "platforms": platforms_data,
-            "platform_colors": platform_colors_data,
-            "coins": self.coins
+            "platforms": self.platforms[plain].tolist(),
+            "platform_colors": GAME_COLORS[self.platform_color[plain]].tolist(),  # 0-1 range
+            "coins": self.coins.tolist()
         }
+        if specs:
+            level_data["prefabs"] = {name: self.prefabs[name] for name in sorted({s["prefab"] for s in specs})}
+            level_data["instances"] = specs
+        if self.motion:
+            level_data["moving_platforms"] = self.moving_platforms(plain)
+        if self.hazards:
+            level_data["hazards"] = self.hazards
+        return level_data
+    
+    def save_level(self):
+        filename = f"{self.current_level_name}_{self.save_slot}.json"
+        level_data = self.level_data()
         
         try:
             with open(filename, 'w') as f:
@@ -311,37 +614,72 @@ class LevelEditor2D:
             with open(filename, 'r') as f:
                 level_data = json.load(f)
             
-            self.platforms = []
-            self.coins = level_data.get("coins", [])
+            # Instances are expanded into rows and tagged; prefab coins become plain coins
+            prefabs = [Prefab(name, spec) for name, spec in level_data.get("prefabs", {}).items()]
+            self.prefabs = {prefab.name: {"platforms": prefab.platforms.tolist(),
+                                          "platform_colors": prefab.colors.tolist()} for prefab in prefabs}
+            level_data, table = expand_level(level_data)
             
             platforms_data = level_data.get("platforms", [])
-            platform_colors_data = level_data.get("platform_colors", [])
+            self.platforms = np.array([platform[:6] for platform in platforms_data],
+                                      dtype=np.float64).reshape(-1, 6)
+            self.coins = np.array(level_data.get("coins", []), dtype=np.float64).reshape(-1, 3)
             
-            for i, platform_geom in enumerate(platforms_data):
-                color_index = 0
-                if i < len(platform_colors_data):
-                    game_color = platform_colors_data[i]
-                    # Convert from game format and find closest match
-                    editor_color = tuple(int(c * 255) for c in game_color)
-                    
-                    min_dist = float('inf')
-                    for j, palette_color in enumerate(PLATFORM_COLORS):
-                        dist = sum((a - b) ** 2 for a, b in zip(editor_color, palette_color))
-                        if dist < min_dist:
-                            min_dist = dist
-                            color_index = j
-                
-                self.platforms.append(list(platform_geom) + [color_index])
+            # Convert colors from game format and find the closest palette match
+            self.platform_color = np.zeros(len(self.platforms), dtype=np.int64)
+            platform_colors_data = level_data.get("platform_colors", [])[:len(self.platforms)]
+            if platform_colors_data:
+                self.platform_color[:len(platform_colors_data)] = nearest_palette(platform_colors_data)
             
-            self.selected_platform = None
-            self.selected_coin = None
-            print(f"Loaded: {filename} ({len(self.platforms)} platforms, {len(self.coins)} coins)")
+            self.platform_instance = np.full(len(self.platforms), -1, dtype=np.int64)
+            self.instances = []
+            if table is not None:
+                self.platform_instance = table.members(len(self.platforms))
+                self.instances = [{"prefab": prefab.name, "rotation": rotation}
+                                  for prefab, rotation in zip(table.prefab, table.rotation.tolist())]
+            self.prefab_name = next(iter(self.prefabs), None)
             
+            self.motion = {}
+            for spec in level_data.get("moving_platforms", []):
+                if 0 <= spec.get("index", -1) < len(self.platforms):
+                    self.motion[spec["index"]] = {"path": spec.get("path", [[0, 0, 0], [2, 0, 0]]),
+                                                  "speed": spec.get("speed", 1.0),
+                                                  "phase": spec.get("phase", 0.0)}
+            
+            self.hazards = level_data.get("hazards", [])
+            
+            self.select(NO_SELECTION, NO_SELECTION)
+            print(f"Loaded: {filename} ({len(self.platforms)} platforms, {len(self.coins)} coins)")
+        
         except FileNotFoundError:
             print(f"File not found: {filename}")
         except Exception as e:
             print(f"Load error: {e}")
     
+    def start_preview(self):
+        """Publish the level and start a game that plays it (again, if it was closed)"""
+        if self.preview is None:
+            try:
+                self.preview = PreviewPublisher()
+            except OSError as e:
+                print(f"Preview error: {e}")
+                return
+            self.publish_preview()
+        if self.preview_process is None or self.preview_process.poll() is not None:
+            game = os.path.join(os.path.dirname(os.path.abspath(__file__)), "3d-platform-clauder4.py")
+            self.preview_process = subprocess.Popen([sys.executable, game, "--preview", self.preview.name])
+            print("Live preview started; edits show up in the game as you make them")
+    
+    def publish_preview(self):
+        extra = {}
+        if self.motion:
+            extra["moving_platforms"] = self.moving_platforms()
+        if self.hazards:
+            extra["hazards"] = self.hazards
+        self.preview.publish(self.platforms, GAME_COLORS[self.platform_color], self.coins, extra)
+    
+    # Drawing
+    
     def draw_grid(self):
         # Calculate grid bounds
         screen_bounds = [
@@ -374,52 +712,81 @@ class LevelEditor2D:
         if 0 <= origin_y <= WINDOW_HEIGHT:
             pygame.draw.line(self.screen, BLUE, (0, origin_y), (WINDOW_WIDTH, origin_y), 2)
     
+    def screen_rects(self, centers_x, centers_z, widths, depths):
+        """Screen rectangles (left, top, width, height) as int arrays, rounded like world_to_screen"""
+        scale = GRID_SIZE * self.camera.zoom
+        screen_x = ((centers_x - self.camera.x) * scale + GRID_OFFSET_X).astype(np.int64)
+        screen_y = ((centers_z - self.camera.y) * scale + GRID_OFFSET_Y).astype(np.int64)
+        screen_w = (widths * scale).astype(np.int64)
+        screen_h = (depths * scale).astype(np.int64)
+        return screen_x - screen_w // 2, screen_y - screen_h // 2, screen_w, screen_h
+    
     def draw_platforms(self):
-        for i, platform in enumerate(self.platforms):
-            x, y, z, w, h, d, color_idx = platform
-            color = PLATFORM_COLORS[color_idx]
+        p = self.platforms
+        left, top, screen_w, screen_h = self.screen_rects(p[:, 0], p[:, 2], p[:, 3], p[:, 5])
+        # Only what is on screen goes through pygame; big levels have most of it elsewhere
+        visible = np.flatnonzero((left < WINDOW_WIDTH) & (left + screen_w >= 0) &
+                                 (top < WINDOW_HEIGHT) & (top + screen_h >= 0))
+        selected = np.zeros(len(p), dtype=bool)
+        selected[self.selected_platforms] = True
+        rows = zip(left[visible].tolist(), top[visible].tolist(), screen_w[visible].tolist(),
+                   screen_h[visible].tolist(), p[visible, 1].tolist(), self.platform_color[visible].tolist(),
+                   selected[visible].tolist(), (self.platform_instance[visible] >= 0).tolist())
+        for x, y, w, h, height, color_idx, is_selected, instanced in rows:
+            rect = pygame.Rect(x, y, w, h)
+            pygame.draw.rect(self.screen, PLATFORM_COLORS[color_idx], rect)
             
-            # Convert to screen coordinates
-            screen_x, screen_y = self.camera.world_to_screen(x, z)
-            screen_w = int(w * GRID_SIZE * self.camera.zoom)
-            screen_h = int(d * GRID_SIZE * self.camera.zoom)
-            
-            # Draw platform rectangle
-            rect = pygame.Rect(screen_x - screen_w//2, screen_y - screen_h//2, screen_w, screen_h)
-            pygame.draw.rect(self.screen, color, rect)
-            
-            # Draw selection outline
-            if i == self.selected_platform:
+            # Draw selection outline; prefab instances are outlined in purple
+            if is_selected:
                 pygame.draw.rect(self.screen, YELLOW, rect, 3)
             else:
-                pygame.draw.rect(self.screen, BLACK, rect, 1)
+                pygame.draw.rect(self.screen, PURPLE if instanced else BLACK, rect, 1)
             
             # Draw Y position indicator
-            if screen_w > 20 and screen_h > 20:
-                y_text = self.small_font.render(f"Y:{y:.1f}", True, BLACK)
-                text_rect = y_text.get_rect(center=(screen_x, screen_y))
+            if w > 20 and h > 20:
+                y_text = self.small_font.render(f"Y:{height:.1f}", True, BLACK)
+                text_rect = y_text.get_rect(center=rect.center)
                 self.screen.blit(y_text, text_rect)
+        
+        # Draw the loop each moving platform follows
+        for i, motion in self.motion.items():
+            x, _, z = self.platforms[i, :3]
+            points = [self.camera.world_to_screen(x + dx, z + dz) for dx, _, dz in motion["path"]]
+            pygame.draw.lines(self.screen, ORANGE, True, points, 2)
+            for point in points[1:]:
+                pygame.draw.circle(self.screen, ORANGE, point, 4)
     
     def draw_coins(self):
-        for i, coin in enumerate(self.coins):
-            x, y, z = coin
-            
-            # Convert to screen coordinates
-            screen_x, screen_y = self.camera.world_to_screen(x, z)
-            radius = max(3, int(6 * self.camera.zoom))
-            
+        c = self.coins
+        radius = max(3, int(6 * self.camera.zoom))
+        scale = GRID_SIZE * self.camera.zoom
+        screen_x = ((c[:, 0] - self.camera.x) * scale + GRID_OFFSET_X).astype(np.int64)
+        screen_y = ((c[:, 2] - self.camera.y) * scale + GRID_OFFSET_Y).astype(np.int64)
+        visible = np.flatnonzero((screen_x > -radius) & (screen_x < WINDOW_WIDTH + radius) &
+                                 (screen_y > -radius) & (screen_y < WINDOW_HEIGHT + radius))
+        selected = np.zeros(len(c), dtype=bool)
+        selected[self.selected_coins] = True
+        for x, y, is_selected in zip(screen_x[visible].tolist(), screen_y[visible].tolist(),
+                                     selected[visible].tolist()):
             # Draw coin circle
-            pygame.draw.circle(self.screen, YELLOW, (screen_x, screen_y), radius)
+            pygame.draw.circle(self.screen, YELLOW, (x, y), radius)
             
             # Draw selection outline
-            if i == self.selected_coin:
-                pygame.draw.circle(self.screen, RED, (screen_x, screen_y), radius + 2, 2)
+            if is_selected:
+                pygame.draw.circle(self.screen, RED, (x, y), radius + 2, 2)
             else:
-                pygame.draw.circle(self.screen, BLACK, (screen_x, screen_y), radius, 1)
+                pygame.draw.circle(self.screen, BLACK, (x, y), radius, 1)
+    
+    def draw_band(self):
+        if self.band_start is None or self.band_end == self.band_start:
+            return
+        (x0, y0), (x1, y1) = self.band_start, self.band_end
+        rect = pygame.Rect(min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0))
+        pygame.draw.rect(self.screen, BLUE, rect, 1)
     
     def draw_ui(self):
         # Background panel
-        ui_rect = pygame.Rect(10, 10, 300, 150)
+        ui_rect = pygame.Rect(10, 10, 300, 230)
         pygame.draw.rect(self.screen, (0, 0, 0, 128), ui_rect)
         pygame.draw.rect(self.screen, WHITE, ui_rect, 2)
         
@@ -431,8 +798,12 @@ class LevelEditor2D:
             f"Save Slot: {self.save_slot}",
             f"Platforms: {len(self.platforms)}",
             f"Coins: {len(self.coins)}",
+            f"Moving: {len(self.motion)}",
+            f"Prefab: {self.prefab_name or '-'} ({self.stamp_rotation * 90} deg)",
             f"Grid Snap: {'ON' if self.snap_to_grid else 'OFF'}",
-            f"Zoom: {self.camera.zoom:.1f}x"
+            f"Zoom: {self.camera.zoom:.1f}x",
+            f"Preview: {'ON' if self.preview else 'OFF (F5)'}",
+            f"Selected: {len(self.selected_platforms)} platforms, {len(self.selected_coins)} coins",
         ]
         
         for text in texts:
@@ -445,6 +816,9 @@ class LevelEditor2D:
         
         while running:
             running = self.handle_events()
+            if self.preview and self.dirty:
+                self.publish_preview()  # At most once a frame, however many events came in
+            self.dirty = False
             
             # Clear screen
             self.screen.fill(WHITE)
@@ -453,12 +827,15 @@ class LevelEditor2D:
             self.draw_grid()
             self.draw_platforms()
             self.draw_coins()
+            self.draw_band()
             self.draw_ui()
             
             # Update display
             pygame.display.flip()
             self.clock.tick(60)
         
+        if self.preview:
+            self.preview.close()  # The game keeps playing the last version
         pygame.quit()
 
 if __name__ == "__main__":
@@ -0,0 +1,268 @@
+"""
+Procedural Level Generator for 3D Platformer
+
+Builds large levels from a seed. Every platform is placed inside the jump arc
+of the one before it (see jump_physics.py), so the result is playable and every
+coin can be collected. Output uses the my_level_N.json layout, so it loads in
+the game (keys 6-0) and in level_editor_2d.py.
+
+Usage:
+    python level_generator.py --seed 7 --platforms 100000 --slot 5
+    python level_generator.py --seed 3 --platforms 500 --output stress.json
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from jump_physics import JumpPhysics, PLAYER_SIZE
+from spatial_grid import overlap_pairs
+
+# Same palette as PLATFORM_COLORS in level_editor_2d.py, so colors survive a
+# round trip through the editor
+PALETTE = [
+    (50, 200, 50),    # Green
+    (25, 100, 25),    # Dark Green
+    (50, 50, 200),    # Blue
+    (200, 50, 50),    # Red
+    (230, 230, 230),  # White
+    (230, 200, 25),   # Yellow
+    (180, 50, 180),   # Purple
+    (230, 125, 25),   # Orange
+    (50, 200, 200),   # Cyan
+]
+ROW_COLORS = [0, 2, 3, 4, 5, 7, 8]
+BRANCH_COLOR = 6
+BASE_COLOR = 1
+
+# Same start platform as the built-in levels (player spawns at 0, 1, 0)
+BASE_PLATFORM = [0.0, -0.5, 0.0, 4.0, 0.5, 4.0]
+
+PLATFORM_THICKNESS = 0.3
+HEADROOM = 1.0        # Free space kept above every platform top
+ROW_SPACING = 3.6     # Distance between rows of the main path
+SAFETY = 0.75         # Fraction of the theoretical reach we ever ask for
+ROUNDING = 0.005      # Height error we tolerate from rounding on save
+
+
+def _clearance_boxes(x, top, z, w, h, d):
+    """Platform volume plus the space a player needs to stand on it"""
+    return np.stack([x - w / 2 - PLAYER_SIZE, x + w / 2 + PLAYER_SIZE,
+                     top - h, top + HEADROOM,
+                     z - d / 2 - PLAYER_SIZE, z + d / 2 + PLAYER_SIZE], axis=1)
+
+
+class LevelGenerator:
+    def __init__(self, seed=0, physics=None, difficulty=0.6, row_length=40,
+                 branch_ratio=0.25, max_height=20.0):
+        self.seed = seed
+        self.physics = physics or JumpPhysics()
+        self.difficulty = min(1.0, max(0.0, difficulty))
+        self.row_length = max(2, row_length)
+        self.branch_ratio = branch_ratio
+        self.max_height = max_height
+        self.rng = np.random.default_rng(seed)
+
+    def safe_reach(self, dy):
+        """Reach that still holds after the JSON rounds heights to 3 decimals"""
+        offsets = np.linspace(-ROUNDING, ROUNDING, 5)
+        return np.minimum.reduce([self.physics.reach(dy + e) for e in offsets])
+
+    def unstable(self, dy):
+        """Height steps on or next to a band where landing fails"""
+        nearby = np.maximum.reduce([self.physics.reach(dy + e) for e in (-0.05, 0.0, 0.05)])
+        safe = self.safe_reach(dy)
+        return (safe < 0) | (safe < 0.5 * nearby)
+
+    def generate(self, num_platforms, num_coins=None):
+        """Return a level dict with platforms, platform_colors and coins"""
+        num_platforms = max(2, int(num_platforms))
+        if num_coins is None:
+            num_coins = max(1, num_platforms // 4)
+
+        n_branch = int(num_platforms * self.branch_ratio)
+        chain = self.build_path(num_platforms - n_branch)
+        branches = self.build_branches(chain, n_branch)
+
+        x, top, z, w, h, d, color = [np.concatenate([c, b]) for c, b in zip(chain, branches)]
+        coins = self.place_coins(x, top, z, w, d, num_coins)
+
+        platforms = np.stack([x, top - h / 2, z, w, h, d], axis=1)
+        platforms[0] = BASE_PLATFORM
+        colors = np.asarray(PALETTE, dtype=np.float64)[color] / 255.0
+
+        return {
+            "platforms": np.round(platforms, 3).tolist(),
+            "platform_colors": np.round(colors, 3).tolist(),
+            "coins": np.round(coins, 3).tolist(),
+            "meta": {
+                "generator": "level_generator.py",
+                "seed": self.seed,
+                "difficulty": self.difficulty,
+            },
+        }
+
+    def build_path(self, n):
+        """Main path: a snake of rows, each platform one jump from the last"""
+        rng = self.rng
+        R = self.row_length
+        index = np.arange(n)
+        row = index // R
+        turn = (index % R == 0) & (index > 0)  # First platform of a new row
+
+        w = rng.choice([1.0, 1.5, 2.0], size=n)
+        d = rng.choice([1.0, 1.5, 2.0], size=n)
+        h = np.full(n, PLATFORM_THICKNESS)
+        # Row turns jump across in Z, so keep both ends deep and centered
+        ends = turn | np.roll(turn, -1)
+        d[ends] = 2.0
+        jitter = np.where(ends, 0.0, rng.uniform(-0.3, 0.3, size=n))
+
+        # Heights: a random walk folded into [0, max_height]. Folding keeps
+        # the size of every step and only flips some rises into drops; the
+        # gaps below are derived from the folded steps.
+        rise = rng.uniform(-0.35, 0.35 + 0.9 * self.difficulty, size=n)
+        rise[turn] = rng.uniform(-0.2, 0.2, size=int(turn.sum()))
+        rise[0] = 0.0
+        walk = np.cumsum(rise) + 0.5
+        period = 2 * self.max_height
+        walk = np.mod(walk, period)
+        top = np.where(walk > self.max_height, period - walk, walk)
+        top[0] = BASE_PLATFORM[1] + BASE_PLATFORM[4] / 2
+        w[0] = d[0] = BASE_PLATFORM[3]
+        h[0] = BASE_PLATFORM[4]
+
+        # Descent near the end of a jump is slightly faster than the landing
+        # window in Player.check_collisions, so a few narrow bands of height
+        # differences tunnel through the platform. Nudge those tops down.
+        for _ in range(20):
+            bad = np.flatnonzero(self.unstable(np.diff(top))) + 1
+            if len(bad) == 0:
+                break
+            top[bad] -= 0.03
+
+        dy = np.diff(top, prepend=top[0])
+        reach = self.safe_reach(dy) * SAFETY
+        spread = rng.uniform(0.3, 0.3 + 0.7 * self.difficulty, size=n)
+        gap = np.maximum(0.05, reach * spread)
+
+        # Along-row step between centers; turns step in Z instead
+        step = (np.roll(w, 1) + w) / 2 + 2 * PLAYER_SIZE + gap
+        step[0] = 0.0
+        step[turn] = 0.0
+        direction = np.where(row % 2 == 0, 1.0, -1.0)
+        x = np.cumsum(step * direction)
+        z = row * ROW_SPACING + jitter
+
+        color = np.asarray(ROW_COLORS)[row % len(ROW_COLORS)]
+        color[0] = BASE_COLOR
+        return x, top, z, w, h, d, color
+
+    def build_branches(self, chain, target, rounds=6):
+        """Side platforms one jump above a path platform, rejected if they
+        would intersect anything already placed"""
+        rng = self.rng
+        cx, ctop, cz, cw, ch, cd, _ = chain
+        existing = _clearance_boxes(cx, ctop, cz, cw, ch, cd)
+        cell = float(max(cw.max(), cd.max())) + 2 * PLAYER_SIZE + 0.5
+
+        accepted = [[] for _ in range(6)]
+        count = 0
+        for _ in range(rounds):
+            need = target - count
+            if need <= 0 or len(cx) < 2:
+                break
+            m = int(need * 1.5) + 8
+            parent = rng.integers(1, len(cx), size=m)
+            w = rng.choice([1.0, 1.5], size=m)
+            d = rng.choice([1.0, 1.5], size=m)
+            h = np.full(m, PLATFORM_THICKNESS)
+            dy = rng.uniform(1.4, 2.4, size=m)
+            dy = np.where(self.unstable(dy), dy - 0.03, dy)
+            gap = self.safe_reach(dy) * SAFETY * rng.uniform(0.3, 0.9, size=m)
+
+            # Step out along X or Z, either way
+            along_x = rng.random(m) < 0.5
+            sign = rng.choice([-1.0, 1.0], size=m)
+            half_parent = np.where(along_x, cw[parent], cd[parent]) / 2
+            half_child = np.where(along_x, w, d) / 2
+            offset = sign * (half_parent + half_child + 2 * PLAYER_SIZE + gap)
+            x = cx[parent] + np.where(along_x, offset, 0.0)
+            z = cz[parent] + np.where(along_x, 0.0, offset)
+            top = ctop[parent] + dy
+
+            boxes = _clearance_boxes(x, top, z, w, h, d)
+            ok = np.ones(m, dtype=bool)
+            hit, _ = overlap_pairs(boxes, existing, cell)
+            ok[hit] = False
+            # Among the candidates themselves keep the first of any pair
+            ai, bi = overlap_pairs(boxes, boxes, cell)
+            ok[ai[ai > bi]] = False
+
+            keep = np.flatnonzero(ok)[:need]
+            for column, values in zip(accepted, (x, top, z, w, h, d)):
+                column.append(values[keep])
+            existing = np.concatenate([existing, boxes[keep]])
+            count += len(keep)
+
+        columns = [np.concatenate(c) if c else np.zeros(0) for c in accepted]
+        color = np.full(len(columns[0]), BRANCH_COLOR)
+        return (*columns, color)
+
+    def place_coins(self, x, top, z, w, d, num_coins):
+        """Coins hover over random platforms, low enough to grab with a hop"""
+        rng = self.rng
+        candidates = np.arange(1, len(x))
+        if len(candidates) == 0:
+            candidates = np.arange(len(x))
+        num_coins = min(num_coins, len(candidates))
+        chosen = rng.choice(candidates, size=num_coins, replace=False)
+        chosen.sort()
+
+        cx = x[chosen] + rng.uniform(-0.25, 0.25, size=num_coins) * w[chosen]
+        cz = z[chosen] + rng.uniform(-0.25, 0.25, size=num_coins) * d[chosen]
+        cy = top[chosen] + PLAYER_SIZE + rng.uniform(0.3, 0.9, size=num_coins)
+        return np.stack([cx, cy, cz], axis=1)
+
+
+def save_level(level_data, filename, indent=None):
+    with open(filename, 'w') as f:
+        json.dump(level_data, f, indent=indent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a playable 3D platformer level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--platforms", type=int, default=200)
+    parser.add_argument("--coins", type=int, default=None)
+    parser.add_argument("--difficulty", type=float, default=0.6,
+                        help="0 = short safe gaps, 1 = gaps near the jump limit")
+    parser.add_argument("--row-length", type=int, default=40)
+    parser.add_argument("--branches", type=float, default=0.25,
+                        help="Fraction of platforms placed as side branches")
+    parser.add_argument("--slot", type=int, default=None,
+                        help="Write my_level_<slot>.json (game keys 6-0 load slots 1-5)")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--indent", type=int, default=None,
+                        help="Pretty-print like the editor does (slow for big levels)")
+    args = parser.parse_args()
+
+    filename = args.output or f"my_level_{args.slot or 1}.json"
+
+    start = time.perf_counter()
+    generator = LevelGenerator(args.seed, difficulty=args.difficulty,
+                               row_length=args.row_length, branch_ratio=args.branches)
+    level_data = generator.generate(args.platforms, args.coins)
+    generated = time.perf_counter()
+    save_level(level_data, filename, args.indent)
+    saved = time.perf_counter()
+
+    print(f"Generated {len(level_data['platforms'])} platforms, {len(level_data['coins'])} coins "
+          f"(seed {args.seed}) in {generated - start:.2f}s")
+    print(f"Saved: {filename} ({saved - generated:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
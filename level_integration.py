@@ -8,6 +8,9 @@ into your main platformer game.
 import json
 import os
 
+from level_pack import LevelPack, is_pack
+from prefabs import expand_level
+
 class LevelManager:
     def __init__(self, game_instance):
         self.game = game_instance
@@ -17,26 +20,58 @@ class LevelManager:
     def load_custom_levels(self):
         """Load all custom level files from the current directory"""
         for filename in os.listdir('.'):
-            if filename.endswith('.json') and filename != 'platformer_save.json':
+            if filename.endswith('.pak') and is_pack(filename):
+                self.add_pack(filename)
+            elif filename.endswith('.json') and filename != 'platformer_save.json':
                 try:
                     with open(filename, 'r') as f:
                         level_data = json.load(f)
                     
-                    # Validate level format
+                    # Validate level format; only the counts are kept, the file is read again on load
                     if 'platforms' in level_data and 'coins' in level_data:
                         self.custom_levels.append({
                             'filename': filename,
                             'name': filename.replace('.json', '').replace('_', ' ').title(),
-                            'data': level_data
+                            'data': None,
+                            'platforms': len(level_data['platforms']),
+                            'coins': len(level_data['coins']),
                         })
                         print(f"Loaded custom level: {filename}")
                 except Exception as e:
                     print(f"Error loading {filename}: {e}")
     
+    def add_pack(self, filename):
+        """List the levels in a pack from its table of contents; each is decoded when loaded"""
+        try:
+            pack = LevelPack(filename)
+        except Exception as e:
+            print(f"Error loading {filename}: {e}")
+            return
+        for entry in pack.entries:
+            self.custom_levels.append({
+                'filename': f"{filename}:{entry['name']}",
+                'name': entry['title'],
+                'data': None,
+                'pack': pack,
+                'platforms': entry['platforms'],
+                'coins': entry['coins'],
+            })
+        print(f"Found level pack: {filename} ({len(pack)} levels)")
+    
+    def level_data(self, level_index):
+        """Read a level's data when it is needed instead of keeping every level in memory"""
+        level = self.custom_levels[level_index]
+        if level['data'] is not None:
+            return level['data']
+        if 'pack' in level:
+            return level['pack'].read(level['filename'].rsplit(':', 1)[1])
+        with open(level['filename'], 'r') as f:
+            return json.load(f)
+    
     def load_custom_level(self, level_index):
         """Load a custom level into the game"""
         if 0 <= level_index < len(self.custom_levels):
-            level_data = self.custom_levels[level_index]['data']
+            level_data, _ = expand_level(self.level_data(level_index))
             
             # Set platforms
             self.game.platforms = level_data['platforms']
@@ -67,9 +102,7 @@ class LevelManager:
         
         print("\nAvailable Custom Levels:")
         for i, level in enumerate(self.custom_levels):
-            platforms_count = len(level['data']['platforms'])
-            coins_count = len(level['data']['coins'])
-            print(f"{i}: {level['name']} ({platforms_count} platforms, {coins_count} coins)")
+            print(f"{i}: {level['name']} ({level['platforms']} platforms, {level['coins']} coins)")
 
 def add_custom_level_support_to_game():
     """
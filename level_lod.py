@@ -0,0 +1,199 @@
+"""
+Distance-based level of detail for platforms.
+
+Every platform used to be drawn with faces plus a 12 edge outline at any
+distance. PlatformLOD sorts platforms into tiers by distance from the camera
+each frame:
+
+    near      faces + outline
+    mid       faces only
+    far       small platforms merged into one impostor box per cluster
+    culled    beyond the draw distance (hidden by fog before that)
+
+A cluster is a set of small platforms in the same grid cell that overlap or
+touch, directly or through each other. Platforms with a gap between them are
+never merged, so a far row of stepping stones doesn't become one solid slab.
+A cluster must also fill enough of its bounding box (impostor_fill), so a
+staircase touching only at its step edges stays as its own platforms.
+
+Prefab instances (see prefabs.py) are drawn whole from shared geometry, so
+their platforms are left out of the per-platform tiers and impostors.
+select_instances() picks a tier for each instance by its bounds instead.
+
+Thresholds live in LODSettings and can be overridden from lod_settings.json.
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class LODSettings:
+    def __init__(self, outline_distance=12.0, impostor_distance=22.0,
+                 draw_distance=45.0, fog_start=30.0, cluster_size=4.0,
+                 small_platform=1.6, impostor_fill=0.6):
+        self.outline_distance = outline_distance
+        self.impostor_distance = impostor_distance
+        self.draw_distance = draw_distance
+        self.fog_start = fog_start
+        self.cluster_size = cluster_size
+        self.small_platform = small_platform  # Largest width/depth merged into impostors
+        self.impostor_fill = impostor_fill  # Smallest share of its bounds a cluster must fill to merge
+
+    @classmethod
+    def load(cls, filename="lod_settings.json"):
+        """Defaults, overridden by any keys present in `filename`"""
+        settings = cls()
+        try:
+            if os.path.exists(filename):
+                with open(filename, 'r') as f:
+                    for key, value in json.load(f).items():
+                        if hasattr(settings, key):
+                            setattr(settings, key, float(value))
+                print(f"LOD settings loaded from {filename}")
+        except Exception as e:
+            print(f"Could not read {filename}: {e}")
+        return settings
+
+
+def touching_groups(cell, lo, hi, gap=1e-6):
+    """Label boxes so those in the same cell that overlap or touch, even through others, share a label"""
+    n = len(cell)
+    order = np.argsort(cell, kind="stable")
+    counts = np.bincount(cell)
+    starts = np.cumsum(counts) - counts
+    # Every pair of boxes within a cell, as positions in `order`
+    per_box = counts[cell[order]]
+    a = np.repeat(np.arange(n), per_box)
+    b = np.repeat(starts[cell[order]] - (np.cumsum(per_box) - per_box), per_box) + np.arange(len(a))
+    a, b = order[a], order[b]
+    pairs = a < b
+    a, b = a[pairs], b[pairs]
+    touch = np.all((lo[a] <= hi[b] + gap) & (lo[b] <= hi[a] + gap), axis=1)
+    a, b = a[touch], b[touch]
+
+    # Spread the smallest label along the contacts until nothing changes
+    label = np.arange(n)
+    while True:
+        smallest = np.minimum(label[a], label[b])
+        spread = label.copy()
+        np.minimum.at(spread, a, smallest)
+        np.minimum.at(spread, b, smallest)
+        spread = spread[spread]
+        if np.array_equal(spread, label):
+            return label
+        label = spread
+
+
+class PlatformLOD:
+    def __init__(self, platforms, platform_colors, settings, moving=(), instances=None):
+        self.settings = settings
+        n = len(platforms)
+        p = np.array([platform[:6] for platform in platforms], dtype=np.float64).reshape(n, 6)
+        self.center = p[:, :3]
+        self.half = p[:, 3:6] / 2
+        self.instances = instances if instances is not None and len(instances) else None
+        self.instanced = np.zeros(n, dtype=bool)
+        if self.instances is not None:
+            self.instanced = self.instances.members(n) >= 0
+
+        # Cluster small platforms on a coarse 3D grid
+        small = (np.maximum(p[:, 3], p[:, 5]) <= settings.small_platform) & (p[:, 4] <= 1.0)
+        small[list(moving)] = False  # Moving platforms can't join a fixed impostor
+        small[self.instanced] = False
+        cells = np.floor(self.center / settings.cluster_size).astype(np.int64)
+        self.cluster = np.full(n, -1, dtype=np.int64)
+        self.impostors = []
+        self.impostor_center = np.zeros((0, 3))
+        self.impostor_half = np.zeros((0, 3))
+
+        members = np.flatnonzero(small)
+        if len(members):
+            _, cell = np.unique(cells[members], axis=0, return_inverse=True)
+            box_lo = self.center[members] - self.half[members]
+            box_hi = self.center[members] + self.half[members]
+            _, group, counts = np.unique(touching_groups(cell.reshape(-1), box_lo, box_hi),
+                                         return_inverse=True, return_counts=True)
+            group = group.reshape(-1)
+            # Lone small platforms, and clusters that are mostly gaps, stay as themselves
+            group_lo = np.full((len(counts), 3), np.inf)
+            group_hi = np.full((len(counts), 3), -np.inf)
+            np.minimum.at(group_lo, group, box_lo)
+            np.maximum.at(group_hi, group, box_hi)
+            filled = np.zeros(len(counts))
+            np.add.at(filled, group, np.prod(box_hi - box_lo, axis=1))
+            solid = filled >= settings.impostor_fill * np.prod(group_hi - group_lo, axis=1)
+            merged = ((counts > 1) & solid)[group]
+            members, inverse = members[merged], group[merged]
+            _, inverse = np.unique(inverse, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            k = int(inverse.max()) + 1 if len(inverse) else 0
+
+            lo = np.full((k, 3), np.inf)
+            hi = np.full((k, 3), -np.inf)
+            np.minimum.at(lo, inverse, self.center[members] - self.half[members])
+            np.maximum.at(hi, inverse, self.center[members] + self.half[members])
+
+            colors = np.array([platform_colors[i][:3] if i < len(platform_colors) else (0.2, 0.7, 0.2)
+                               for i in members], dtype=np.float64).reshape(-1, 3)
+            area = (p[members, 3] * p[members, 5])[:, None]
+            color_sum = np.zeros((k, 3))
+            area_sum = np.zeros((k, 1))
+            np.add.at(color_sum, inverse, colors * area)
+            np.add.at(area_sum, inverse, area)
+            mean_color = color_sum / area_sum
+
+            self.cluster[members] = inverse
+            self.impostor_center = (lo + hi) / 2
+            self.impostor_half = (hi - lo) / 2
+            self.impostors = [
+                (self.impostor_center[i].tolist() + (self.impostor_half[i] * 2).tolist(), tuple(mean_color[i].tolist()))
+                for i in range(k)
+            ]
+
+    def move(self, indices, centers):
+        """Update the centers of platforms that moved this tick"""
+        self.center[indices] = centers
+
+    @staticmethod
+    def _box_distance(center, half, eye):
+        gap = np.maximum(np.abs(center - eye) - half, 0.0)
+        return np.sqrt((gap * gap).sum(axis=1))
+
+    def select(self, camera_x, camera_y, camera_z):
+        """Indices to draw with outlines, indices to draw faces only, and impostor boxes"""
+        s = self.settings
+        eye = np.array([camera_x, camera_y, camera_z])
+        dist = self._box_distance(self.center, self.half, eye)
+
+        # Clusters are replaced as a whole so they never half-merge
+        far_cluster = np.zeros(len(self.impostors), dtype=bool)
+        impostors = []
+        if self.impostors:
+            cluster_dist = self._box_distance(self.impostor_center, self.impostor_half, eye)
+            far_cluster = (cluster_dist > s.impostor_distance) & (cluster_dist <= s.draw_distance)
+            hidden = cluster_dist > s.impostor_distance
+            impostors = [self.impostors[i] for i in np.flatnonzero(far_cluster)]
+            merged = self.cluster >= 0
+            replaced = np.zeros(len(dist), dtype=bool)
+            replaced[merged] = hidden[self.cluster[merged]]
+        else:
+            replaced = np.zeros(len(dist), dtype=bool)
+
+        visible = (dist <= s.draw_distance) & ~replaced & ~self.instanced
+        outlined = visible & (dist <= s.outline_distance)
+        faces = visible & ~outlined
+        return np.flatnonzero(outlined).tolist(), np.flatnonzero(faces).tolist(), impostors
+
+    def select_instances(self, camera_x, camera_y, camera_z):
+        """Instances to draw with outlines and instances to draw faces only, by distance to their bounds"""
+        if self.instances is None:
+            return [], []
+        s = self.settings
+        table = self.instances
+        dist = self._box_distance((table.lo + table.hi) / 2, (table.hi - table.lo) / 2,
+                                  np.array([camera_x, camera_y, camera_z]))
+        outlined = dist <= s.outline_distance
+        faces = (dist <= s.draw_distance) & ~outlined
+        return np.flatnonzero(outlined).tolist(), np.flatnonzero(faces).tolist()
@@ -0,0 +1,294 @@
+"""
+Level packs for the 3D Platformer.
+
+A pack is one file holding many levels, so hundreds of them can be shipped
+and loaded without probing loose my_level_N.json files:
+
+    header   magic, version, offset and size of the table of contents
+    blobs    one zlib-compressed blob per level, back to back
+    TOC      zlib-compressed JSON: per level its name, title, offset, size,
+             uncompressed size, CRC32, codec and a few counts for tools
+
+The file is memory-mapped, so opening a pack reads only the header and TOC,
+and reading a level touches only that level's bytes.
+
+Blobs use one of two codecs. "binary" stores platforms, colors and coins as
+float64 arrays, plus any other keys (moving_platforms, ...) as JSON. It is
+exact and decodes a large level about twice as fast as JSON. Levels whose
+rows aren't the usual 6/3/3 floats fall back to "json".
+
+Usage:
+    python level_pack.py build levels.pak my_level_*.json
+    python level_pack.py build levels.pak generated_levels/      # every level JSON in it
+    python level_pack.py inspect levels.pak [--verify]
+    python level_pack.py extract levels.pak my_level_3 [-o out.json]
+
+Play a pack with `python 3d-platform-clauder4.py --pack levels.pak`; level N
+is the pack's Nth entry.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from prefabs import expand_level
+
+MAGIC = b"PLATPACK"
+VERSION = 1
+HEADER = struct.Struct("<8sIQI")        # magic, version, TOC offset, TOC size
+BINARY_HEADER = struct.Struct("<4I")    # platforms, colors, coins, extra JSON bytes
+CODECS = ("binary", "json")
+NOT_LEVELS = ("platformer_save.json", "lod_settings.json")
+
+
+def encode_level(level_data, codec="binary"):
+    """Level dict -> uncompressed blob bytes"""
+    if codec == "json":
+        return json.dumps(level_data, separators=(",", ":")).encode("utf-8")
+    if codec != "binary":
+        raise ValueError(f"Unknown codec '{codec}', expected one of {CODECS}")
+
+    platforms = level_data.get("platforms", [])
+    colors = level_data.get("platform_colors", [])
+    coins = level_data.get("coins", [])
+    if any(len(p) != 6 for p in platforms) or any(len(c) != 3 for c in colors) \
+            or any(len(c) != 3 for c in coins):
+        raise ValueError("rows aren't plain 6/3/3 floats")
+    extra = {key: value for key, value in level_data.items()
+             if key not in ("platforms", "platform_colors", "coins")}
+    extra_bytes = json.dumps(extra, separators=(",", ":")).encode("utf-8") if extra else b""
+    return b"".join((
+        BINARY_HEADER.pack(len(platforms), len(colors), len(coins), len(extra_bytes)),
+        np.asarray(platforms, dtype="<f8").tobytes(),
+        np.asarray(colors, dtype="<f8").tobytes(),
+        np.asarray(coins, dtype="<f8").tobytes(),
+        extra_bytes,
+    ))
+
+
+def decode_level(blob, codec):
+    """Uncompressed blob bytes -> level dict with plain lists, like json.load gives"""
+    if codec == "json":
+        return json.loads(bytes(blob).decode("utf-8"))
+    if codec != "binary":
+        raise ValueError(f"Unknown codec '{codec}'")
+
+    counts = BINARY_HEADER.unpack_from(blob, 0)
+    offset = BINARY_HEADER.size
+    level_data = {}
+    for key, count, width in zip(("platforms", "platform_colors", "coins"), counts, (6, 3, 3)):
+        values = np.frombuffer(blob, dtype="<f8", count=count * width, offset=offset)
+        level_data[key] = values.reshape(count, width).tolist()
+        offset += count * width * 8
+    if counts[3]:
+        level_data.update(json.loads(bytes(blob[offset:offset + counts[3]]).decode("utf-8")))
+    return level_data
+
+
+def _bounds(platforms):
+    if not platforms:
+        return None
+    p = np.asarray([platform[:6] for platform in platforms], dtype=np.float64)
+    lo = p[:, :3] - p[:, 3:6] / 2
+    hi = p[:, :3] + p[:, 3:6] / 2
+    return [round(v, 3) for v in lo.min(axis=0).tolist() + hi.max(axis=0).tolist()]
+
+
+def build_pack(filename, levels, codec="binary", level=6):
+    """Write `levels`, a list of (name, level_data) pairs, as a pack. Returns the TOC."""
+    names = [name for name, _ in levels]
+    if len(set(names)) != len(names):
+        raise ValueError("level names in a pack must be unique")
+
+    toc = []
+    tmp = filename + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0))  # Patched once the TOC is written
+        for name, level_data in levels:
+            used = codec
+            try:
+                raw = encode_level(level_data, codec)
+            except ValueError as e:
+                print(f"{name}: storing as json ({e})")
+                used, raw = "json", encode_level(level_data, "json")
+            blob = zlib.compress(raw, level)
+            played, _ = expand_level(level_data)  # Counts and bounds include prefab instances
+            platforms = played.get("platforms", [])
+            toc.append({
+                "name": name,
+                "title": level_data.get("name", name.replace("_", " ").title()),
+                "offset": f.tell(),
+                "size": len(blob),
+                "raw_size": len(raw),
+                "crc32": zlib.crc32(raw),
+                "codec": used,
+                "platforms": len(platforms),
+                "coins": len(played.get("coins", [])),
+                "moving": len(level_data.get("moving_platforms", [])),
+                "hazards": len(level_data.get("hazards", [])),
+                "instances": len(level_data.get("instances", [])),
+                "bounds": _bounds(platforms),
+            })
+            f.write(blob)
+
+        toc_offset = f.tell()
+        toc_blob = zlib.compress(json.dumps({"levels": toc}).encode("utf-8"), level)
+        f.write(toc_blob)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, toc_offset, len(toc_blob)))
+    os.replace(tmp, filename)  # Readers never see a half-written pack
+    return toc
+
+
+class LevelPack:
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, toc_offset, toc_size = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{filename} is not a level pack")
+            if version > VERSION:
+                raise ValueError(f"{filename} is pack version {version}, this game reads up to {VERSION}")
+            toc = json.loads(zlib.decompress(self.map[toc_offset:toc_offset + toc_size]))
+        except Exception:
+            self.close()
+            raise
+        self.entries = toc["levels"]
+        self.by_name = {entry["name"]: entry for entry in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @property
+    def names(self):
+        return [entry["name"] for entry in self.entries]
+
+    def entry(self, key):
+        """TOC entry by name or by position"""
+        return self.entries[key] if isinstance(key, int) else self.by_name[key]
+
+    def read(self, key, verify=True):
+        """Decode one level (by name or position) without touching the others"""
+        entry = self.entry(key)
+        start = entry["offset"]
+        with memoryview(self.map) as view:
+            raw = zlib.decompress(view[start:start + entry["size"]])
+        if verify and zlib.crc32(raw) != entry["crc32"]:
+            raise ValueError(f"{self.filename}: level '{entry['name']}' is corrupt (CRC mismatch)")
+        return decode_level(raw, entry["codec"])
+
+    def close(self):
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+            self.map = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def is_pack(filename):
+    try:
+        with open(filename, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def collect_level_files(paths):
+    """Level JSON files named on the command line; directories contribute every *.json in them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if name.endswith(".json") and name not in NOT_LEVELS)
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect level packs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Pack level JSON files into one file")
+    build.add_argument("output")
+    build.add_argument("inputs", nargs="+", help="Level JSON files or directories of them")
+    build.add_argument("--codec", choices=CODECS, default="binary")
+
+    inspect = sub.add_parser("inspect", help="List the levels in a pack")
+    inspect.add_argument("pack")
+    inspect.add_argument("--verify", action="store_true", help="Decode every level and check its CRC")
+
+    extract = sub.add_parser("extract", help="Write one level back out as JSON")
+    extract.add_argument("pack")
+    extract.add_argument("name")
+    extract.add_argument("-o", "--output", help="Defaults to <name>.json")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        levels = []
+        for filename in collect_level_files(args.inputs):
+            try:
+                with open(filename, "r") as f:
+                    level_data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {filename}: {e}")
+                continue
+            if not isinstance(level_data, dict) or "platforms" not in level_data:
+                print(f"Skipping {filename}: not a level")
+                continue
+            levels.append((os.path.splitext(os.path.basename(filename))[0], level_data))
+        toc = build_pack(args.output, levels, args.codec)
+        raw = sum(entry["raw_size"] for entry in toc)
+        print(f"Saved: {args.output} ({len(toc)} levels, {os.path.getsize(args.output) / 1024:.1f} KB, "
+              f"{raw / 1024:.1f} KB uncompressed, {time.perf_counter() - start:.2f}s)")
+
+    elif args.command == "inspect":
+        with LevelPack(args.pack) as pack:
+            print(f"{args.pack}: {len(pack)} levels, {os.path.getsize(args.pack) / 1024:.1f} KB")
+            print(f"{'#':>4} {'name':<24} {'codec':<7} {'KB':>8} {'raw KB':>8} {'platforms':>9} {'coins':>6} {'moving':>6} "
+                  f"{'hazards':>7}")
+            for i, entry in enumerate(pack.entries):
+                print(f"{i + 1:>4} {entry['name']:<24} {entry['codec']:<7} {entry['size'] / 1024:8.1f} "
+                      f"{entry['raw_size'] / 1024:8.1f} {entry['platforms']:>9} {entry['coins']:>6} {entry['moving']:>6} "
+                      f"{entry.get('hazards', 0):>7}")
+            if args.verify:
+                start = time.perf_counter()
+                for name in pack.names:
+                    pack.read(name)
+                elapsed = time.perf_counter() - start
+                print(f"All {len(pack)} levels decode and match their CRC "
+                      f"({elapsed * 1000 / max(len(pack), 1):.2f} ms per level)")
+
+    else:
+        with LevelPack(args.pack) as pack:
+            if args.name not in pack:
+                parser.error(f"no level '{args.name}' in {args.pack}")
+            level_data = pack.read(args.name)
+        output = args.output or f"{args.name}.json"
+        with open(output, "w") as f:
+            json.dump(level_data, f, indent=2)
+        print(f"Saved: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Chunked World Streaming for 3D Platformer
+
+Very large levels are split into square XZ chunks on disk. While playing,
+only the chunks around the player are kept in memory: the ones inside the
+load radius are what physics, coins and rendering see, the next ring out is
+fetched on a background thread before the player gets there, and anything
+else is evicted once the cache goes over its memory budget.
+
+A world is a directory with an index and one small level file per chunk:
+
+    my_world_3/world.json          chunk size, chunk list, coin total
+    my_world_3/chunk_0_-1.json     same layout as my_level_N.json
+
+Usage:
+    python level_streaming.py split my_level_3.json my_world_3 --chunk-size 32
+    python level_streaming.py info my_world_3
+"""
+
+import argparse
+import json
+import math
+import os
+import queue
+import threading
+import time
+
+from prefabs import expand_level
+
+WORLD_INDEX = "world.json"
+
+# Rough in-memory cost of one platform (6 floats + color tuple) and one coin
+# as Python lists, used for the memory budget
+PLATFORM_BYTES = 400
+COIN_BYTES = 180
+
+
+def chunk_key(x, z, chunk_size):
+    return (math.floor(x / chunk_size), math.floor(z / chunk_size))
+
+
+def chunk_filename(key):
+    return f"chunk_{key[0]}_{key[1]}.json"
+
+
+def split_level(level_data, world_dir, chunk_size=32.0):
+    """Write a level dict out as a chunked world. Returns the index dict."""
+    level_data, _ = expand_level(level_data)  # Chunks hold plain platforms
+    platforms = level_data.get("platforms", [])
+    colors = level_data.get("platform_colors", [])
+    coins = level_data.get("coins", [])
+    if level_data.get("moving_platforms"):
+        print("Note: moving platforms are not streamed; they stay at their resting positions")
+    if level_data.get("hazards"):
+        print("Note: hazards are not streamed; chunked worlds have none")
+
+    chunks = {}
+    for i, platform in enumerate(platforms):
+        key = chunk_key(platform[0], platform[2], chunk_size)
+        chunk = chunks.setdefault(key, {"platforms": [], "platform_colors": [], "coins": []})
+        chunk["platforms"].append(list(platform[:6]))
+        chunk["platform_colors"].append(list(colors[i]) if i < len(colors) else [0.2, 0.7, 0.2])
+    for coin in coins:
+        key = chunk_key(coin[0], coin[2], chunk_size)
+        chunk = chunks.setdefault(key, {"platforms": [], "platform_colors": [], "coins": []})
+        chunk["coins"].append(list(coin[:3]))
+
+    os.makedirs(world_dir, exist_ok=True)
+    index = {"chunk_size": chunk_size, "total_coins": len(coins), "chunks": []}
+    for key, chunk in sorted(chunks.items()):
+        filename = chunk_filename(key)
+        with open(os.path.join(world_dir, filename), 'w') as f:
+            json.dump(chunk, f)
+        index["chunks"].append({
+            "key": list(key),
+            "file": filename,
+            "platforms": len(chunk["platforms"]),
+            "coins": len(chunk["coins"]),
+        })
+
+    with open(os.path.join(world_dir, WORLD_INDEX), 'w') as f:
+        json.dump(index, f, indent=2)
+    return index
+
+
+def is_world(path):
+    return os.path.isfile(os.path.join(path, WORLD_INDEX))
+
+
+class Chunk:
+    def __init__(self, key, platforms, platform_colors, coins, coin_ids):
+        self.key = key
+        self.platforms = platforms
+        self.platform_colors = platform_colors
+        self.coins = coins
+        self.coin_ids = coin_ids  # Position of each coin in the chunk file
+        self.size = len(platforms) * PLATFORM_BYTES + len(coins) * COIN_BYTES
+
+
+class ChunkStreamer:
+    def __init__(self, world_dir, radius=1, prefetch=1, memory_budget_mb=64):
+        self.world_dir = world_dir
+        with open(os.path.join(world_dir, WORLD_INDEX), 'r') as f:
+            index = json.load(f)
+
+        self.chunk_size = index["chunk_size"]
+        self.total_coins = index.get("total_coins", 0)
+        self.index = {tuple(entry["key"]): entry for entry in index["chunks"]}
+        self.radius = radius
+        self.prefetch = prefetch
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+
+        self.resident = {}          # key -> Chunk
+        self.collected = {}         # key -> set of coin ids, survives eviction
+        self.collected_count = 0
+        self.center = None
+        self.active_keys = []
+
+        self.requested = set()
+        self.requests = queue.Queue()
+        self.loaded = queue.Queue()
+        self.running = True
+        self.loader = threading.Thread(target=self._loader_loop, name="chunk-loader", daemon=True)
+        self.loader.start()
+
+        self.stats = {"loads": 0, "sync_loads": 0, "evictions": 0}
+
+    def stop(self):
+        self.running = False
+        self.requests.put(None)
+
+    # Loading
+
+    def _read_chunk(self, key):
+        with open(os.path.join(self.world_dir, self.index[key]["file"]), 'r') as f:
+            level_data = json.load(f)
+        platforms = level_data.get("platforms", [])
+        colors = [tuple(c[:3]) for c in level_data.get("platform_colors", [])]
+        return key, platforms, colors, level_data.get("coins", [])
+
+    def _loader_loop(self):
+        while self.running:
+            key = self.requests.get()
+            if key is None:
+                break
+            try:
+                self.loaded.put(self._read_chunk(key))
+            except Exception as e:
+                print(f"Chunk {key} failed to load: {e}")
+                self.loaded.put((key, [], [], []))
+
+    def _install(self, key, platforms, colors, coins):
+        self.requested.discard(key)
+        if key in self.resident:
+            return
+        collected = self.collected.get(key, set())
+        coin_ids = [i for i in range(len(coins)) if i not in collected]
+        self.resident[key] = Chunk(key, platforms, colors, [coins[i] for i in coin_ids], coin_ids)
+        self.stats["loads"] += 1
+
+    def _request(self, key):
+        if key in self.index and key not in self.resident and key not in self.requested:
+            self.requested.add(key)
+            self.requests.put(key)
+
+    def keys_around(self, center, radius):
+        cx, cz = center
+        return [(cx + dx, cz + dz)
+                for dx in range(-radius, radius + 1)
+                for dz in range(-radius, radius + 1)
+                if (cx + dx, cz + dz) in self.index]
+
+    # Per-frame
+
+    def update(self, x, z):
+        """Track the player. Returns True when the active chunk set changed."""
+        changed = False
+        while True:
+            try:
+                self._install(*self.loaded.get_nowait())
+            except queue.Empty:
+                break
+
+        center = chunk_key(x, z, self.chunk_size)
+        needed = self.keys_around(center, self.radius)
+
+        # The player must never stand in a chunk that isn't there yet
+        for key in needed:
+            if key not in self.resident:
+                self._install(*self._read_chunk(key))
+                self.stats["sync_loads"] += 1
+
+        if center != self.center:
+            self.center = center
+            for key in self.keys_around(center, self.radius + self.prefetch):
+                self._request(key)
+            self._evict()
+
+        active = [key for key in needed if key in self.resident]
+        if active != self.active_keys:
+            self.active_keys = active
+            changed = True
+        return changed
+
+    def _evict(self):
+        keep = set(self.keys_around(self.center, self.radius))
+        used = self.memory_used()
+        if used <= self.memory_budget:
+            return
+        # Farthest chunks go first
+        cx, cz = self.center
+        candidates = sorted((key for key in self.resident if key not in keep),
+                            key=lambda k: -max(abs(k[0] - cx), abs(k[1] - cz)))
+        for key in candidates:
+            if used <= self.memory_budget:
+                break
+            used -= self.resident.pop(key).size
+            self.stats["evictions"] += 1
+
+    def memory_used(self):
+        return sum(chunk.size for chunk in self.resident.values())
+
+    # What the game sees
+
+    def active_level(self):
+        """Platforms, colors and coins of the active chunks as flat lists"""
+        platforms, colors, coins = [], [], []
+        for key in self.active_keys:
+            chunk = self.resident[key]
+            platforms.extend(chunk.platforms)
+            colors.extend(chunk.platform_colors)
+            coins.extend(chunk.coins)
+        return platforms, colors, coins
+
+    def collect(self, coin):
+        """Remember a collected coin so it stays gone after its chunk reloads"""
+        key = chunk_key(coin[0], coin[2], self.chunk_size)
+        chunk = self.resident.get(key)
+        if chunk is None:
+            return
+        for i, candidate in enumerate(chunk.coins):
+            if candidate is coin:
+                self.collected.setdefault(key, set()).add(chunk.coin_ids[i])
+                self.collected_count += 1
+                del chunk.coins[i]
+                del chunk.coin_ids[i]
+                return
+
+    @property
+    def coins_remaining(self):
+        return self.total_coins - self.collected_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split levels into streamed chunk worlds")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    split = sub.add_parser("split", help="Split a level JSON into a world directory")
+    split.add_argument("level")
+    split.add_argument("world_dir")
+    split.add_argument("--chunk-size", type=float, default=32.0)
+
+    info = sub.add_parser("info", help="Show the chunks of a world")
+    info.add_argument("world_dir")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        start = time.perf_counter()
+        with open(args.level, 'r') as f:
+            level_data = json.load(f)
+        index = split_level(level_data, args.world_dir, args.chunk_size)
+        print(f"Saved: {args.world_dir} ({len(index['chunks'])} chunks of "
+              f"{args.chunk_size:g} units, {time.perf_counter() - start:.2f}s)")
+        print("Load it in the game by naming the directory my_world_<slot>")
+    else:
+        with open(os.path.join(args.world_dir, WORLD_INDEX), 'r') as f:
+            index = json.load(f)
+        platforms = sum(c["platforms"] for c in index["chunks"])
+        print(f"{args.world_dir}: {len(index['chunks'])} chunks, chunk size {index['chunk_size']:g}")
+        print(f"   {platforms} platforms, {index.get('total_coins', 0)} coins")
+        busiest = max(index["chunks"], key=lambda c: c["platforms"], default=None)
+        if busiest:
+            print(f"   Busiest chunk {tuple(busiest['key'])}: {busiest['platforms']} platforms")
+
+
+if __name__ == "__main__":
+    main()
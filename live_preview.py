@@ -0,0 +1,213 @@
+"""
+Live preview: the 2D editor's level, played in the 3D game while it is edited.
+
+The editor publishes its platforms, colors and coins into a block of shared
+memory (multiprocessing.shared_memory). A game started with --preview maps
+the same block and picks up every edit on its next tick. No files, pipes or
+pickling are involved:
+
+    header     magic, version counter, capacities and counts (uint64)
+    platforms  float64 [capacity, 6]
+    colors     float64 [capacity, 3]
+    coins      float64 [coin capacity, 3]
+    extra      JSON bytes: moving platforms and anything else per level
+
+Both sides see the arrays as numpy views straight onto the block. The
+version counter works as a seqlock. The writer makes it odd, writes, then
+makes it even. A reader polls only the counter, so an unchanged level costs
+one 8-byte read per tick. After it copies a level out, it checks that the
+counter hasn't moved, and otherwise tries again on the next tick.
+
+When a level outgrows the block, the editor marks it retired and creates a
+bigger one under the same name. Readers then re-attach.
+
+    python level_editor_2d.py          # F5 publishes and starts the game
+    python 3d-platform-clauder4.py --preview                # or start it yourself
+"""
+
+import json
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+try:
+    from multiprocessing import resource_tracker
+except ImportError:  # Not on every platform
+    resource_tracker = None
+
+PREVIEW_NAME = "platformer_preview"
+MAGIC = int.from_bytes(b"PLATPREV", "little")
+HEADER_WORDS = 16
+SEQ, RETIRED, PLATFORM_CAP, COIN_CAP, EXTRA_CAP, PLATFORMS, COINS, EXTRA = range(1, 9)
+
+
+def _block_size(platform_cap, coin_cap, extra_cap):
+    return HEADER_WORDS * 8 + platform_cap * 9 * 8 + coin_cap * 3 * 8 + extra_cap
+
+
+class _Block:
+    """numpy views onto one shared memory block"""
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        platform_cap, coin_cap, extra_cap = (int(v) for v in self.header[[PLATFORM_CAP, COIN_CAP, EXTRA_CAP]])
+        offset = HEADER_WORDS * 8
+        self.platforms = np.ndarray((platform_cap, 6), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += platform_cap * 6 * 8
+        self.colors = np.ndarray((platform_cap, 3), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += platform_cap * 3 * 8
+        self.coins = np.ndarray((coin_cap, 3), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += coin_cap * 3 * 8
+        self.extra = np.ndarray((extra_cap,), dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    def fits(self, platforms, coins, extra):
+        return platforms <= len(self.platforms) and coins <= len(self.coins) and extra <= len(self.extra)
+
+    def close(self):
+        # Views must go before the mapping can be closed
+        self.header = self.platforms = self.colors = self.coins = self.extra = None
+        self.shm.close()
+
+
+class PreviewPublisher:
+    """Editor side: owns the block and writes whole levels into it"""
+
+    def __init__(self, name=PREVIEW_NAME, platforms=1024, coins=512, extra=64 * 1024):
+        self.name = name
+        self.block = None
+        self.publishes = 0
+        self.publish_time = 0.0
+        self._create(platforms, coins, extra)
+
+    def _create(self, platform_cap, coin_cap, extra_cap):
+        try:  # Left behind by an editor that crashed
+            stale = shared_memory.SharedMemory(name=self.name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name=self.name, create=True,
+                                         size=_block_size(platform_cap, coin_cap, extra_cap))
+        header = np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[[PLATFORM_CAP, COIN_CAP, EXTRA_CAP]] = platform_cap, coin_cap, extra_cap
+        header[0] = MAGIC
+        del header
+        self.block = _Block(shm)
+
+    def publish(self, platforms, colors, coins, extra=None):
+        """platforms [n, 6], colors [n, 3] in 0-1, coins [m, 3]; extra is a dict of other level keys"""
+        start = time.perf_counter()
+        platforms = np.asarray(platforms, dtype=np.float64).reshape(-1, 6)
+        colors = np.asarray(colors, dtype=np.float64).reshape(-1, 3)
+        coins = np.asarray(coins, dtype=np.float64).reshape(-1, 3)
+        extra_bytes = json.dumps(extra, separators=(",", ":")).encode("utf-8") if extra else b""
+
+        block = self.block
+        if not block.fits(len(platforms), len(coins), len(extra_bytes)):
+            seq = int(block.header[SEQ])
+            capacity = (max(len(platforms) * 2, len(block.platforms)), max(len(coins) * 2, len(block.coins)),
+                        max(len(extra_bytes) * 2, len(block.extra)))
+            block.header[RETIRED] = 1
+            shm = block.shm
+            block.close()
+            shm.unlink()
+            self._create(*capacity)
+            block = self.block
+            block.header[SEQ] = seq  # Readers compare versions across blocks
+
+        header = block.header
+        header[SEQ] += 1  # Odd: being written
+        header[PLATFORMS], header[COINS], header[EXTRA] = len(platforms), len(coins), len(extra_bytes)
+        block.platforms[:len(platforms)] = platforms
+        block.colors[:len(colors)] = colors
+        block.coins[:len(coins)] = coins
+        block.extra[:len(extra_bytes)] = np.frombuffer(extra_bytes, dtype=np.uint8)
+        header[SEQ] += 1  # Even: complete
+        self.publishes += 1
+        self.publish_time += time.perf_counter() - start
+
+    def close(self):
+        if self.block is None:
+            return
+        self.block.header[RETIRED] = 1
+        shm = self.block.shm
+        self.block.close()
+        shm.unlink()
+        self.block = None
+
+
+class PreviewReader:
+    """Game side: attaches to the editor's block and hands out new versions of the level"""
+
+    def __init__(self, name=PREVIEW_NAME, retry_interval=0.5):
+        self.name = name
+        self.block = None
+        self.version = None      # Counter value of the level handed out last
+        self.retry_interval = retry_interval
+        self.next_attempt = 0.0
+        self.torn_reads = 0
+
+    def _attach(self):
+        now = time.perf_counter()
+        if now < self.next_attempt:
+            return False
+        self.next_attempt = now + self.retry_interval
+        try:
+            shm = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return False
+        if resource_tracker is not None:
+            # Python < 3.13 would unlink the editor's block when this process exits
+            try:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            except Exception:
+                pass
+        header = np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=shm.buf)
+        valid = int(header[0]) == MAGIC and not header[RETIRED]
+        del header
+        if not valid:
+            shm.close()
+            return False
+        self.block = _Block(shm)
+        return True
+
+    @property
+    def connected(self):
+        return self.block is not None
+
+    def poll(self):
+        """The level as a my_level_N.json style dict if it changed since the last call, else None"""
+        if self.block is None and not self._attach():
+            return None
+        header = self.block.header
+        if header[RETIRED]:
+            self.block.close()
+            self.block = None
+            return self.poll()
+
+        before = int(header[SEQ])
+        if before == self.version or before & 1 or before == 0:
+            return None  # Unchanged, mid-write, or nothing published yet
+        block = self.block
+        platforms, coins, extra = int(header[PLATFORMS]), int(header[COINS]), int(header[EXTRA])
+        level_data = {
+            "platforms": block.platforms[:platforms].tolist(),
+            "platform_colors": block.colors[:platforms].tolist(),
+            "coins": block.coins[:coins].tolist(),
+        }
+        extra_bytes = block.extra[:extra].tobytes()
+        if int(header[SEQ]) != before:
+            self.torn_reads += 1
+            return None  # The editor wrote meanwhile; the next tick gets the newer version
+        if extra_bytes:
+            level_data.update(json.loads(extra_bytes.decode("utf-8")))
+        self.version = before
+        return level_data
+
+    def close(self):
+        if self.block is not None:
+            self.block.close()
+            self.block = None
@@ -0,0 +1,292 @@
+"""
+Memory accounting and leak detection for the 3D Platformer.
+
+Two tools:
+
+    footprints(game)   what each subsystem holds right now: level data, the
+                       level index (LOD, BVH, collision grid, movers), particles,
+                       ghosts, audio buffers, GL buffers, snapshots
+    MemoryMonitor      a tracemalloc snapshot after every level load, and the
+                       traced total when the level is left. Each time a level
+                       is loaded again, the snapshot is compared with its
+                       previous load, and growth over the threshold is
+                       flagged with the lines that allocated it
+
+In the game, --memory turns the monitor on (tracemalloc slows Python down,
+so it is off by default) and F10 prints a report at any time.
+
+Soak mode plays through the levels over and over, without a window, and checks
+that memory stays flat:
+
+    python memory_monitor.py soak --hours 2
+    python memory_monitor.py soak --cycles 20 --frames 120 --renderer batched
+
+It exits with status 1 if traced memory grew by more than --threshold-kb
+between the second cycle and the last. The first cycle is skipped because
+it warms caches.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Allocations by the monitor itself, and one-off imports, aren't leaks
+_IGNORE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def deep_size(obj):
+    """Bytes held by obj and everything reachable through containers and instance dicts"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or item is None or isinstance(item, type):
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            total += sys.getsizeof(item)  # Includes the data when the array owns it
+            continue
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif hasattr(item, "__dict__"):
+            stack.append(item.__dict__)
+    return total
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _sound_bytes(sound):
+    import pygame
+    settings = pygame.mixer.get_init()
+    if sound is None or not settings:
+        return 0
+    frequency, size, channels = settings
+    return int(sound.get_length() * frequency * channels * abs(size) // 8)
+
+
+def footprints(game):
+    """{subsystem: bytes}. Walks the live objects, so large levels take a moment."""
+    result = {
+        "level data": deep_size([game.platforms, game.platform_colors, game.coins, game.moving_platforms,
+                                 getattr(game, "hazard_specs", None), getattr(game, "instances", None)]),
+        "particles": deep_size(game.particles.particles),
+        "ghost recording": deep_size(game.recorder.samples),
+    }
+
+    index = 0
+    if game.lod is not None:
+        index += sum(getattr(game.lod, name).nbytes for name in
+                     ("center", "half", "cluster", "impostor_center", "impostor_half"))
+        index += deep_size(game.lod.impostors)
+    if game.movers:
+        index += sum(getattr(game.movers, name).nbytes for name in ("base", "size", "speed", "phase"))
+        index += game.movers.loops.nbytes
+    if getattr(game, "hazards", None):
+        index += game.hazards.nbytes + deep_size(game.hazards.grid)
+    if getattr(game, "bvh", None) is not None:
+        index += game.bvh.nbytes
+    if getattr(game, "platform_batches", None) is not None:
+        index += game.platform_batches.nbytes
+    index += deep_size(getattr(game, "collision_grid", None))
+    result["level index"] = index
+
+    ghosts = game.ghosts
+    result["ghost tracks"] = ghosts.tracks.nbytes + ghosts.lengths.nbytes if ghosts is not None else 0
+
+    sound = game.sound_manager
+    result["audio buffers"] = sum(_sound_bytes(getattr(sound, name, None))
+                                  for name in ("jump_sound", "coin_sound", "death_sound"))
+    if getattr(game, "music", None) is not None:
+        result["audio buffers"] += game.music.ring.nbytes
+
+    # GPU-side: the window's back buffer, and the scaled render target if one exists
+    renderer = game.renderer
+    gl = 0
+    if renderer.presents:
+        gl += renderer.width * renderer.height * 8  # RGBA8 color + 24/8 depth-stencil
+    target = getattr(renderer, "target", None)
+    if target is not None and target.fbo is not None:
+        gl += target.size[0] * target.size[1] * 8
+    result["GL buffers"] = gl
+
+    if game.sim:
+        result["snapshots"] = deep_size(game.sim.buffer.slots)
+    manager = getattr(game, "level_manager", None)
+    if manager is not None:
+        result["level manager"] = deep_size(manager.custom_levels)
+    return result
+
+
+def format_kb(size):
+    return f"{size / 1024:10.1f} KB"
+
+
+class MemoryMonitor:
+    def __init__(self, game, frames=8, threshold_kb=256, keep=8, stats=None):
+        self.game = game
+        self.frames = frames  # Traceback depth kept by tracemalloc
+        self.threshold = threshold_kb * 1024
+        self.keep = keep      # Levels whose load snapshot is kept (packs have hundreds)
+        self.stats = stats
+        self.loaded = {}        # level -> snapshot taken just after it loaded
+        self.loaded_bytes = {}  # level -> traced bytes at that moment
+        self.flags = []         # (level, growth bytes) each time a level came back bigger
+        self.current = None     # Level loaded last
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not self.tracing:
+            tracemalloc.start(self.frames)
+            print(f"🧠 Memory tracing on ({self.frames} frames per allocation); F10 for a report")
+
+    def stop(self):
+        if self.tracing:
+            tracemalloc.stop()
+        self.loaded.clear()
+        self.loaded_bytes.clear()
+
+    def _snapshot(self):
+        gc.collect()
+        return tracemalloc.take_snapshot().filter_traces(_IGNORE)
+
+    def level_unloading(self):
+        """Record how much the current level grew while it was played (particles, ghost recording, ...)"""
+        level = self.current
+        if not self.tracing or level not in self.loaded_bytes:
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        if self.stats:
+            self.stats.record("traced_kb", current / 1024)
+            self.stats.record("level_play_growth_kb", (current - self.loaded_bytes[level]) / 1024)
+
+    def level_loaded(self, level):
+        """Snapshot after `level` loaded and compare it with the previous time it was loaded"""
+        self.current = level
+        if not self.tracing:
+            return
+        snapshot = self._snapshot()
+        previous = self.loaded.pop(level, None)
+        self.loaded[level] = snapshot
+        self.loaded_bytes[level] = tracemalloc.get_traced_memory()[0]
+        while len(self.loaded) > self.keep:
+            oldest = next(iter(self.loaded))
+            del self.loaded[oldest]
+            del self.loaded_bytes[oldest]
+        if previous is None:
+            return
+        diff = snapshot.compare_to(previous, "lineno")
+        growth = sum(stat.size_diff for stat in diff)
+        if growth > self.threshold:
+            self.flags.append((level, growth))
+            print(f"⚠️  Level {level} holds {growth / 1024:.0f} KB more than when it was last loaded:")
+            for stat in diff[:5]:
+                if stat.size_diff <= 0:
+                    break
+                frame = stat.traceback[0]
+                print(f"   +{stat.size_diff / 1024:8.1f} KB  {os.path.basename(frame.filename)}:{frame.lineno}"
+                      f"  ({stat.count_diff:+d} blocks)")
+
+    def report(self):
+        print("🧠 Memory by subsystem:")
+        sizes = footprints(self.game)
+        for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+            print(f"   {name:<18} {format_kb(size)}")
+        rss = rss_bytes()
+        if rss is not None:
+            print(f"   {'process RSS':<18} {format_kb(rss)}")
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            print(f"   {'traced (peak)':<18} {format_kb(current)} ({peak / 1024:.1f} KB)")
+            for level, growth in self.flags[-5:]:
+                print(f"   flagged: level {level} grew {growth / 1024:.0f} KB across a cycle")
+        else:
+            print("   (run with --memory for tracemalloc totals and leak checks)")
+        return sizes
+
+
+def soak(args):
+    from offscreen import HeadlessGame
+
+    headless = HeadlessGame(320, 240, renderer=args.renderer, ghosts=args.ghosts)
+    game = headless.game
+    monitor = MemoryMonitor(game, threshold_kb=args.threshold_kb)
+    game.memory = monitor
+    monitor.start()
+
+    deadline = time.perf_counter() + args.hours * 3600 if args.hours else None
+    cycles = []  # (traced bytes, rss bytes) after each full pass through the levels
+    print(f"{'cycle':>6} {'traced':>13} {'rss':>13} {'particles':>9} {'elapsed':>8}")
+    start = time.perf_counter()
+    headless.load_level(1)
+    while True:
+        for _ in range(game.level_count):
+            headless.run_frames(args.frames)
+            game.next_level()
+        # Not get_traced_memory(): that would count the monitor's own stored snapshots
+        traced = sum(stat.size for stat in monitor._snapshot().statistics("filename"))
+        rss = rss_bytes() or 0
+        cycles.append((traced, rss))
+        print(f"{len(cycles):>6} {format_kb(traced)} {format_kb(rss)} {len(game.particles.particles):>9} "
+              f"{time.perf_counter() - start:7.0f}s", flush=True)
+        if deadline is not None:
+            if time.perf_counter() >= deadline:
+                break
+        elif len(cycles) >= args.cycles:
+            break
+
+    monitor.report()
+    headless.close()
+    if len(cycles) < 3:
+        print("Need at least 3 cycles to judge growth")
+        return 0
+    growth = cycles[-1][0] - cycles[1][0]
+    per_cycle = growth / (len(cycles) - 2)
+    print(f"Traced growth from cycle 2 to {len(cycles)}: {growth / 1024:+.1f} KB ({per_cycle / 1024:+.2f} KB per cycle)")
+    if growth > args.threshold_kb * 1024:
+        print("FAIL: memory is not flat")
+        return 1
+    print("OK: memory is flat")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory soak test for the 3D Platformer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    s = sub.add_parser("soak", help="Cycle through all levels repeatedly and watch memory")
+    s.add_argument("--hours", type=float, default=0, help="Run for this long (overrides --cycles)")
+    s.add_argument("--cycles", type=int, default=10)
+    s.add_argument("--frames", type=int, default=60, help="Frames to play on each level")
+    s.add_argument("--renderer", choices=("null", "batched", "immediate"), default="null")
+    s.add_argument("--ghosts", type=int, default=0)
+    s.add_argument("--threshold-kb", type=int, default=256)
+    args = parser.parse_args()
+    sys.exit(soak(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Moving platforms for the 3D Platformer.
+
+A level file can list platforms that follow a path:
+
+    "moving_platforms": [
+        {"index": 4, "path": [[0, 0, 0], [3, 0, 0]], "speed": 1.0, "phase": 0.0}
+    ]
+
+`index` refers to an entry in "platforms"; that entry is the platform's
+resting position. `path` is a closed loop of offsets from it (two points
+make an out-and-back), `speed` is in units per second at 60 ticks per second
+and `phase` (0-1) is how far along the loop the platform starts.
+
+Positions depend only on the simulation tick, so replays and ghosts line up.
+MovingPlatforms.step computes every position in one numpy pass and writes
+back only the moving rows. In the collision grid, only platforms that crossed
+a cell boundary are re-bucketed, so the broadphase is never rebuilt.
+
+PathLoops is the path part on its own; hazards.py moves its enemies with it.
+"""
+
+import numpy as np
+
+TICKS_PER_SECOND = 60.0
+
+
+def parse_specs(specs, platform_count):
+    """Keep the valid entries of a level's "moving_platforms" list"""
+    valid = []
+    for spec in specs or []:
+        try:
+            index = int(spec["index"])
+            path = [[float(v) for v in point[:3]] for point in spec.get("path", [])]
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping moving platform {spec}: {e}")
+            continue
+        if not 0 <= index < platform_count or len(path) < 2:
+            print(f"Skipping moving platform {index}: needs a valid index and at least 2 path points")
+            continue
+        valid.append({"index": index, "path": path,
+                      "speed": float(spec.get("speed", 1.0)),
+                      "phase": float(spec.get("phase", 0.0)) % 1.0})
+    return valid
+
+
+class PathLoops:
+    """Closed loops of offsets, padded into one array so all of them are sampled in one numpy pass"""
+
+    def __init__(self, paths):
+        self.count = len(paths)
+        # Close every loop and pad shorter paths by repeating their end point
+        points = max((len(path) for path in paths), default=1) + 1
+        self.path = np.zeros((self.count, points, 3))
+        for k, path in enumerate(paths):
+            loop = list(path) + [path[0]]
+            self.path[k, :len(loop)] = loop
+            self.path[k, len(loop):] = loop[-1]
+        segment = np.linalg.norm(np.diff(self.path, axis=1), axis=2)
+        self.cumulative = np.concatenate([np.zeros((self.count, 1)), segment.cumsum(axis=1)], axis=1)
+        self.length = self.cumulative[:, -1]
+        self.segment = np.where(segment > 0, segment, 1.0)
+        # For sampling: a nonzero length to wrap around, and where each loop starts in the flattened arrays
+        self._wrap = np.where(self.length > 0, self.length, 1.0)
+        self._rows = np.arange(self.count)
+        self._first = self._rows * points
+
+    def distance(self, phase, speed, tick):
+        """How far along each loop a mover with this phase (0-1) and speed (per tick) is at `tick`"""
+        return (phase * self._wrap + speed * tick) % self._wrap
+
+    def sample(self, s):
+        """(offset, segment direction) at distance `s` along each loop, both [count, 3]"""
+        # Segment containing s: last cumulative distance that is <= s
+        seg = (self.cumulative[:, 1:-1] <= s[:, None]).sum(axis=1)
+        # take() on the flattened arrays is several times faster than fancy indexing by (row, seg)
+        flat = self._first + seg
+        points = self.path.reshape(-1, 3)
+        start, end = points.take(flat, axis=0), points.take(flat + 1, axis=0)
+        t = (s - self.cumulative.take(flat)) / self.segment.take(flat - self._rows)
+        direction = end - start
+        return start + direction * t[:, None], direction
+
+    @property
+    def nbytes(self):
+        return self.path.nbytes + self.cumulative.nbytes + self.segment.nbytes
+
+
+class MovingPlatforms:
+    def __init__(self, platforms, specs):
+        specs = parse_specs(specs, len(platforms))
+        self.count = len(specs)
+        self.indices = [spec["index"] for spec in specs]
+        self.slot = {index: k for k, index in enumerate(self.indices)}
+        self.base = np.array([platforms[i][:3] for i in self.indices], dtype=np.float64).reshape(-1, 3)
+        self.size = np.array([platforms[i][3:6] for i in self.indices], dtype=np.float64).reshape(-1, 3)
+
+        self.loops = PathLoops([spec["path"] for spec in specs])
+        self.speed = np.array([spec["speed"] for spec in specs]) / TICKS_PER_SECOND
+        self.phase = np.array([spec["phase"] for spec in specs])
+
+        self.position = self.positions(0)
+        self.velocity = np.zeros((self.count, 3))  # Displacement over the last tick
+        self._grid = None
+        self._cells = None
+
+    def __bool__(self):
+        return self.count > 0
+
+    def positions(self, tick):
+        """World positions of all moving platforms at `tick`, as a [count, 3] array"""
+        if not self.count:
+            return np.zeros((0, 3))
+        offset, _ = self.loops.sample(self.loops.distance(self.phase, self.speed, tick))
+        return self.base + offset
+
+    def step(self, tick, platforms, grid=None):
+        """Move every platform to `tick`, updating the level rows and the grid in place"""
+        if not self.count:
+            return
+        position = self.positions(tick)
+        self.velocity = position - self.position
+        self.position = position
+        rows = position.tolist()
+        for k, index in enumerate(self.indices):
+            # Replace the row instead of editing it, so snapshots holding the old row stay valid
+            platforms[index] = rows[k] + platforms[index][3:]
+        if grid is not None:
+            self._update_grid(grid, position)
+
+    def _update_grid(self, grid, position):
+        half = self.size / 2
+        lo = position - half
+        hi = position + half
+        cells = np.floor(np.stack([lo[:, 0], lo[:, 2], hi[:, 0], hi[:, 2]], axis=1)
+                         / grid.cell_size).astype(np.int64)
+        # Most ticks a platform stays inside the same cells; only re-bucket the rest
+        if self._grid is not grid:
+            self._grid = grid
+            changed = range(self.count)
+        else:
+            changed = np.flatnonzero((cells != self._cells).any(axis=1)).tolist()
+        self._cells = cells
+        for k in changed:
+            grid.update(self.indices[k], lo[k, 0], lo[k, 2], hi[k, 0], hi[k, 2])
+
+    def velocity_of(self, index):
+        """Per-tick displacement of platform `index`, or None if it doesn't move"""
+        k = self.slot.get(index)
+        return None if k is None else self.velocity[k]
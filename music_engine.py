@@ -0,0 +1,346 @@
+"""
+Procedural background music for the 3D Platformer.
+
+Each level gets its own theme, derived from the level number: tempo, key,
+major or minor pentatonic scale, a four-bar chord progression and a
+sixteen-step arpeggio. A theme is a function from sample index to audio, so
+any stretch of it can be rendered as one block of numpy operations.
+
+Synthesis never runs on a game thread:
+
+    worker thread   renders BLOCK frames at a time into a RingBuffer
+                    whenever there is room, and crossfades (equal power)
+                    from the old theme to the new one when the level changes
+    RingBuffer      single producer, single consumer. Each side only
+                    advances its own index, after it has finished copying,
+                    so no lock is needed
+    pump()          called once per game tick. When the music channel has
+                    nothing queued, it moves one CHUNK from the ring into a
+                    Sound and queues it, which takes a few microseconds.
+                    Otherwise it returns at once
+
+Themes are synthesized at the rate the mixer is open with. make_sound()
+takes raw frames at that rate, so music made for any other rate would play
+off pitch and off tempo.
+
+An underrun is the channel going idle while music should be playing (an
+audible gap). It is counted, as is a pump that found the ring short of a
+chunk. Both go to Instrumentation as music_underruns and music_starved.
+
+    python music_engine.py play --level 3 --seconds 20 --switch-every 5
+    python music_engine.py render --level 2 --seconds 30 -o level2.wav
+"""
+
+import argparse
+import math
+import os
+import threading
+import time
+import wave
+
+import numpy as np
+
+RATE = 22050          # For WAV rendering, and when there is no mixer
+BLOCK = 1024          # Frames synthesized per worker step
+CHUNK = 2048          # Frames per queued Sound (93 ms at 22050 Hz)
+RING_FRAMES = 8192    # About 0.37 s: the delay before a new theme is heard
+CROSSFADE = 2.0       # Seconds
+VOLUME = 0.5
+
+MAJOR_PENTATONIC = np.array([0, 2, 4, 7, 9])
+MINOR_PENTATONIC = np.array([0, 3, 5, 7, 10])
+
+
+def midi_to_hz(note):
+    return 440.0 * 2.0 ** ((note - 69) / 12.0)
+
+
+class RingBuffer:
+    """Stereo int16 frames; write_index and read_index only grow and each has one owner"""
+
+    def __init__(self, frames):
+        self.data = np.zeros((frames, 2), dtype=np.int16)
+        self.capacity = frames
+        self.write_index = 0  # Producer's
+        self.read_index = 0   # Consumer's
+
+    def available(self):
+        return self.write_index - self.read_index
+
+    def space(self):
+        return self.capacity - self.available()
+
+    def write(self, frames):
+        n = len(frames)
+        start = self.write_index % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = frames[:first]
+        self.data[:n - first] = frames[first:]
+        self.write_index += n  # Publish only after the copy
+
+    def read(self, n):
+        start = self.read_index % self.capacity
+        first = min(n, self.capacity - start)
+        out = np.concatenate([self.data[start:start + first], self.data[:n - first]])
+        self.read_index += n  # Hands the space back to the producer
+        return out
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class Theme:
+    def __init__(self, level, rate=RATE):
+        rng = np.random.default_rng(level * 7919 + 17)
+        self.level = level
+        self.rate = rate
+        self.tempo = int(rng.choice([92, 104, 116, 128]))
+        self.step = int(rate * 60 / self.tempo / 4)          # Frames per sixteenth note
+        self.root = 45 + int(rng.integers(0, 12))             # A2 and up
+        self.scale = MINOR_PENTATONIC if level % 2 == 0 else MAJOR_PENTATONIC
+        self.progression = np.concatenate([[0], rng.integers(0, 5, 3)])  # Scale degree per bar
+        self.pattern = rng.integers(0, 8, 16)                 # Arpeggio degrees over the chord
+        self.pattern[rng.random(16) < 0.2] = -1               # Rests
+
+    def __repr__(self):
+        return f"Theme(level {self.level}, {self.tempo} bpm, root {self.root})"
+
+    def semitones(self, degree):
+        """Scale degrees, which may run past one octave, to semitones above the root"""
+        size = len(self.scale)
+        return self.scale[degree % size] + 12 * (degree // size)
+
+    def render(self, start, frames):
+        """[frames, 2] float audio from sample index `start` on"""
+        t = np.arange(start, start + frames)
+        step = t // self.step
+        bar = step // 16
+        chord = self.progression[bar % len(self.progression)]
+
+        # Arpeggio: one plucked note per sixteenth, phase restarting with each note
+        pos = (t % self.step) / self.rate
+        degree = self.pattern[step % 16]
+        lead_freq = midi_to_hz(self.root + 12 + self.semitones(np.maximum(degree, 0) + chord))
+        envelope = np.minimum(pos / 0.004, 1.0) * np.exp(-pos * 9.0) * (degree >= 0)
+        lead = np.sin(2 * np.pi * lead_freq * pos) * envelope
+
+        # Bass: the chord root on every beat, a soft triangle
+        beat_pos = (t % (self.step * 4)) / self.rate
+        bass_freq = midi_to_hz(self.root - 12 + self.semitones(chord))
+        phase = (bass_freq * beat_pos) % 1.0
+        bass = (4 * np.abs(phase - 0.5) - 1) * np.minimum(beat_pos / 0.01, 1.0) * np.exp(-beat_pos * 3.0)
+
+        # Pad: the chord's triad, swelling over each bar so chord changes don't click
+        bar_pos = (t % (self.step * 16)) / (self.step * 16)
+        seconds = t / self.rate
+        pad = sum(np.sin(2 * np.pi * midi_to_hz(self.root + self.semitones(chord + k)) * seconds) for k in (0, 2, 4))
+        pad *= np.sin(np.pi * bar_pos) ** 2 / 3
+
+        left = 0.10 * lead + 0.22 * bass + 0.16 * pad
+        right = 0.16 * lead + 0.22 * bass + 0.10 * pad
+        return np.column_stack([left, right])
+
+
+class Synthesizer:
+    """The current theme, rendered block after block, with crossfades between themes"""
+
+    def __init__(self, rate=RATE, volume=VOLUME):
+        self.rate = rate
+        self.volume = volume
+        self.theme = None
+        self.next_theme = None    # Set by set_theme(), taken by the next block
+        self.fading = None        # (old theme, new theme, frames into the fade)
+        self.sample = 0           # Frames synthesized so far
+
+    def set_theme(self, level):
+        if self.theme is None or self.theme.level != level:
+            self.next_theme = Theme(level, self.rate)
+
+    def block(self, frames):
+        """The next `frames` of music as [frames, 2] int16"""
+        upcoming = self.next_theme
+        if upcoming is not None:
+            self.next_theme = None
+            if self.theme is not None:
+                self.fading = (self.theme, upcoming, 0)
+            self.theme = upcoming
+
+        if self.fading is None:
+            audio = self.theme.render(self.sample, frames) if self.theme else np.zeros((frames, 2))
+        else:
+            old, new, done = self.fading
+            length = int(CROSSFADE * self.rate)
+            x = np.clip((done + np.arange(frames)) / length, 0.0, 1.0)[:, None] * (math.pi / 2)
+            audio = old.render(self.sample, frames) * np.cos(x) + new.render(self.sample, frames) * np.sin(x)
+            done += frames
+            self.fading = (old, new, done) if done < length else None
+
+        self.sample += frames
+        return (np.clip(audio * self.volume, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+class MusicEngine:
+    def __init__(self, channel, stats=None, volume=VOLUME):
+        """channel: index of a mixer channel the sound effects don't use"""
+        import pygame
+        self.pygame = pygame
+        self.stats = stats
+        init = pygame.mixer.get_init()
+        self.enabled = bool(init)
+        if self.enabled:
+            pygame.mixer.set_num_channels(max(pygame.mixer.get_num_channels(), channel + 1))
+            self.channel = pygame.mixer.Channel(channel)
+        self.synth = Synthesizer(init[0] if init else RATE, volume)
+        self.ring = RingBuffer(RING_FRAMES)
+        self.started = False      # Something has been queued
+        self.underruns = 0
+        self.starved = 0
+        self.synth_time = 0.0
+        self.blocks = 0
+        self.running = False
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="music", daemon=True)
+
+    def set_theme(self, level):
+        """Crossfade to this level's theme (reference swap; the worker does the rest)"""
+        self.synth.set_theme(level)
+
+    def start(self):
+        if not self.enabled or self.running:
+            return
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+        if self.enabled:
+            self.channel.stop()
+
+    # Worker thread
+
+    def _loop(self):
+        block_time = BLOCK / self.synth.rate
+        while self.running:
+            if self.ring.space() < BLOCK:
+                self.wake.wait(block_time)
+                self.wake.clear()
+                continue
+            start = time.perf_counter()
+            self.ring.write(self.synth.block(BLOCK))
+            elapsed = time.perf_counter() - start
+            self.synth_time += elapsed
+            self.blocks += 1
+            if self.stats:
+                self.stats.record("music_block_ms", elapsed * 1000.0)
+
+    # Game thread
+
+    def pump(self):
+        """Queue the next chunk on the music channel if it has room; call once per tick"""
+        if not self.running:
+            return
+        channel = self.channel
+        if channel.get_queue() is not None:
+            return  # The common case: one call and out
+        if self.started and not channel.get_busy():
+            self.underruns += 1
+            if self.stats:
+                self.stats.count("music_underruns")
+        if self.ring.available() < CHUNK:
+            self.starved += 1
+            if self.stats:
+                self.stats.count("music_starved")
+            return
+        sound = self.pygame.sndarray.make_sound(self.ring.read(CHUNK))
+        self.wake.set()  # Room in the ring
+        if channel.get_busy():
+            channel.queue(sound)
+        else:
+            channel.play(sound)
+        self.started = True
+
+
+def _init_mixer(rate):
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+    pygame.mixer.init(frequency=rate, size=-16, channels=2, buffer=512)
+    return pygame
+
+
+def play(args):
+    """Run the engine in real time with a 60 Hz pump, switching themes now and then"""
+    pygame = _init_mixer(args.rate)
+    engine = MusicEngine(channel=0)
+    engine.set_theme(args.level)
+    engine.start()
+    pump_time = 0.0
+    pumps = 0
+    level = args.level
+    start = time.perf_counter()
+    next_switch = start + args.switch_every if args.switch_every else None
+    while time.perf_counter() - start < args.seconds:
+        t = time.perf_counter()
+        engine.pump()
+        pump_time += time.perf_counter() - t
+        pumps += 1
+        if next_switch and time.perf_counter() >= next_switch:
+            level += 1
+            engine.set_theme(level)
+            print(f"-> {engine.synth.next_theme}")
+            next_switch += args.switch_every
+        time.sleep(1 / 60.0)
+    engine.stop()
+    elapsed = time.perf_counter() - start
+    audio_seconds = engine.synth.sample / engine.synth.rate
+    print(f"{elapsed:.1f} s: {engine.blocks} blocks, synthesis {engine.synth_time / max(engine.blocks, 1) * 1000:.2f} ms "
+          f"per {BLOCK}-frame block ({engine.synth_time / max(audio_seconds, 1e-9) * 100:.1f}% of real time, worker thread)")
+    print(f"pump(): {pump_time / max(pumps, 1) * 1e6:.1f} us per tick on the calling thread")
+    print(f"underruns: {engine.underruns}, starved pumps: {engine.starved}")
+    pygame.quit()
+    return 1 if engine.underruns else 0
+
+
+def render(args):
+    """Write a theme to a WAV file, synthesized in blocks like the worker does"""
+    synth = Synthesizer()
+    synth.set_theme(args.level)
+    frames = int(args.seconds * RATE)
+    switch = int(args.switch_every * RATE) if args.switch_every else None
+    blocks = []
+    for start in range(0, frames, BLOCK):
+        if switch and start and start // switch != (start - BLOCK) // switch:
+            synth.set_theme(synth.theme.level + 1)
+        blocks.append(synth.block(BLOCK))
+    audio = np.concatenate(blocks)[:frames]
+    with wave.open(args.output, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(RATE)
+        f.writeframes(audio.astype("<i2").tobytes())
+    print(f"Saved: {args.output} ({args.seconds:g} s, {Theme(args.level)})")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Procedural music for the 3D Platformer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("play", help="Play in real time (dummy audio driver unless SDL_AUDIODRIVER is set)")
+    p.add_argument("--level", type=int, default=1)
+    p.add_argument("--seconds", type=float, default=10.0)
+    p.add_argument("--switch-every", type=float, default=0, help="Crossfade to the next level's theme this often")
+    p.add_argument("--rate", type=int, default=RATE, help="Mixer rate to open; themes follow whatever it gets")
+    r = sub.add_parser("render", help="Write a level's theme to a WAV file")
+    r.add_argument("--level", type=int, default=1)
+    r.add_argument("--seconds", type=float, default=30.0)
+    r.add_argument("--switch-every", type=float, default=0)
+    r.add_argument("-o", "--output", default="music.wav")
+    args = parser.parse_args()
+    raise SystemExit(play(args) if args.command == "play" else render(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,853 @@
+"""
+Local network multiplayer for the 3D Platformer.
+
+One game hosts (--host) and runs the authoritative simulation: its own
+player, a Player per connected client, and the level's coins, which all
+players share. Other games join (--connect HOST:PORT). A client sends its
+inputs and draws what the host says, predicting only its own player.
+
+Everything goes over UDP:
+
+    HELLO / WELCOME     join; the host hands out a player id
+    INPUT               client -> host every tick: the inputs the host has
+                        not confirmed yet (so a lost packet is covered by
+                        the next one) and the newest snapshot received
+    SNAPSHOT            host -> client every SNAPSHOT_INTERVAL ticks
+
+Snapshots are delta compressed. The host keeps the last HISTORY snapshots
+it built and encodes each client's against the newest one that client has
+acknowledged, or against nothing if there is none. Player state is
+quantized to integers (positions to 1/256, velocities to 1/4096) and only
+fields that changed are sent, as zigzag varints of the difference. Coins
+are a bitset over the level's coin list (1 = collected); only bytes that
+differ from the baseline go out.
+
+Client-side prediction: the client moves its own player with its input at
+once. Each snapshot says which of its inputs the host has applied; the
+client resets its player to the host's state and replays the inputs after
+that one, stepping moving platforms along from the host's level tick so
+the replay lands on the same platforms the host will use. Other players are drawn INTERP_TICKS behind the newest snapshot,
+interpolated between the two around that time.
+
+Link can drop and delay outgoing packets, so all of this can be exercised
+over loopback. F4 in the game prints the traffic report (NetStats), and
+per-tick figures go to Instrumentation as net_*.
+
+    python 3d-platform-clauder4.py --host
+    python 3d-platform-clauder4.py --connect 192.168.1.20:47800
+    python netcode.py loopback --clients 3 --seconds 20 --loss 0.2 --latency 40
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import math
+import os
+import random
+import socket
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+from sim_thread import PlayerPose
+
+DEFAULT_PORT = 47800
+PROTOCOL = 1
+TICK_RATE = 60
+TICK = 1.0 / TICK_RATE
+SNAPSHOT_INTERVAL = 3      # Ticks between snapshots (20 per second)
+HISTORY = 64               # Snapshots kept as possible baselines, on both ends
+INTERP_TICKS = 6           # How far behind the newest snapshot other players are drawn
+MAX_PLAYERS = 8
+MAX_REDUNDANT = 16         # Unconfirmed inputs resent with each INPUT packet
+MAX_BACKLOG = 4            # Inputs the host holds per client before applying two in one tick
+HELLO_INTERVAL = 0.5
+TIMEOUT = 5.0
+
+HELLO, WELCOME, FULL, INPUT, SNAPSHOT, BYE = range(1, 7)
+
+HELLO_PACKET = struct.Struct("<BH")                  # type, protocol
+WELCOME_PACKET = struct.Struct("<BBHB")              # type, player id, tick rate, snapshot interval
+INPUT_HEADER = struct.Struct("<BBIIIB")              # type, player id, snapshot ack, send time ms, first seq, count
+INPUT_ENTRY = struct.Struct("<bbB")                  # move x, move z (/127), jump
+SNAPSHOT_HEADER = struct.Struct("<BIIIIHHIIb")       # type, tick, baseline, input ack, echo ms, hold ms,
+                                                     # level, level ticks, score, lives
+
+# Player state on the wire: quantized with these scales, ground sent as index + 1
+FIELDS = ("x", "y", "z", "vel_x", "vel_y", "vel_z", "squash", "on_ground", "ground",
+          "coyote_timer", "jump_buffer_timer")
+SCALE = np.array([256, 256, 256, 4096, 4096, 4096, 64, 1, 1, 1000, 1000], dtype=np.float64)
+
+
+# Encoding
+
+def zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def player_state(player):
+    """A Player's state as one quantized row"""
+    ground = player.ground + 1 if player.ground is not None else 0
+    values = (player.x, player.y, player.z, player.vel_x, player.vel_y, player.vel_z, player.squash,
+              player.on_ground, ground, player.coyote_timer, player.jump_buffer_timer)
+    return np.rint(np.array(values, dtype=np.float64) * SCALE).astype(np.int64)
+
+
+def set_player_state(player, row):
+    x, y, z, vel_x, vel_y, vel_z, squash, on_ground, ground, coyote, jump_buffer = (row / SCALE).tolist()
+    player.x, player.y, player.z = x, y, z
+    player.vel_x, player.vel_y, player.vel_z = vel_x, vel_y, vel_z
+    player.squash = squash
+    player.on_ground = bool(on_ground)
+    player.ground = int(ground) - 1 if ground else None
+    player.coyote_timer, player.jump_buffer_timer = coyote, jump_buffer
+
+
+def quantize_player(player):
+    """Round a Player's state to what the wire carries. Host and client both do it after every tick they
+    simulate, so a replay from a snapshot starts from exactly the state the host had."""
+    set_player_state(player, player_state(player))
+
+
+def quantize_input(snapshot):
+    """An InputSnapshot with movement rounded the way INPUT packets carry it, so prediction matches the host"""
+    return snapshot._replace(move_x=_axis(snapshot.move_x) / 127.0, move_z=_axis(snapshot.move_z) / 127.0)
+
+
+def _axis(value):
+    return int(round(max(-1.0, min(1.0, value)) * 127))
+
+
+class Snapshot:
+    """What the host knows at one tick: every player's quantized state and the collected-coin bitset"""
+
+    def __init__(self, tick, level, level_ticks, score, lives, ids, state, coins):
+        self.tick = tick
+        self.level = level
+        self.level_ticks = level_ticks  # Moving platforms follow this
+        self.score = score
+        self.lives = lives
+        self.ids = ids          # [k] player ids
+        self.state = state      # [k, len(FIELDS)] int64
+        self.coins = coins      # uint8 bitset, np.packbits order
+
+    def row(self, player_id):
+        found = np.flatnonzero(self.ids == player_id)
+        return self.state[found[0]] if len(found) else None
+
+
+def encode_snapshot(snapshot, baseline, input_ack=0, echo=0, hold=0):
+    """SNAPSHOT packet for `snapshot`, as a delta against `baseline` (a Snapshot the client has) or in full"""
+    out = bytearray(SNAPSHOT_HEADER.pack(SNAPSHOT, snapshot.tick, baseline.tick if baseline else 0, input_ack,
+                                         echo & 0xFFFFFFFF, min(hold, 0xFFFF), snapshot.level,
+                                         snapshot.level_ticks, snapshot.score, max(-128, min(127, snapshot.lives))))
+
+    # Players: id, a bitmask of changed fields, then the changes
+    base_rows = {}
+    if baseline is not None:
+        base_rows = dict(zip(baseline.ids.tolist(), baseline.state))
+    zeros = np.zeros(len(FIELDS), dtype=np.int64)
+    write_varint(out, len(snapshot.ids))
+    for player_id, row in zip(snapshot.ids.tolist(), snapshot.state):
+        delta = row - base_rows.get(player_id, zeros)
+        changed = np.flatnonzero(delta)
+        write_varint(out, player_id)
+        write_varint(out, int(np.bitwise_or.reduce(1 << changed)) if len(changed) else 0)
+        for value in delta[changed].tolist():
+            write_varint(out, zigzag(value))
+
+    # Coins: (gap, byte) for each bitset byte that differs from the baseline's
+    base_coins = _coin_baseline(snapshot, baseline)
+    changed = np.flatnonzero(snapshot.coins != base_coins)
+    write_varint(out, len(snapshot.coins))
+    write_varint(out, len(changed))
+    previous = 0
+    for index, value in zip(changed.tolist(), snapshot.coins[changed].tolist()):
+        write_varint(out, index - previous)
+        out.append(value)
+        previous = index
+    return bytes(out)
+
+
+def decode_snapshot(data, baselines):
+    """(Snapshot, input ack, echo ms, hold ms) from a SNAPSHOT packet; None if its baseline isn't in `baselines`"""
+    _, tick, base_tick, input_ack, echo, hold, level, level_ticks, score, lives = SNAPSHOT_HEADER.unpack_from(data)
+    baseline = baselines.get(base_tick) if base_tick else None
+    if base_tick and baseline is None:
+        return None
+    pos = SNAPSHOT_HEADER.size
+
+    base_rows = dict(zip(baseline.ids.tolist(), baseline.state)) if baseline is not None else {}
+    zeros = np.zeros(len(FIELDS), dtype=np.int64)
+    count, pos = read_varint(data, pos)
+    ids = np.zeros(count, dtype=np.int64)
+    state = np.zeros((count, len(FIELDS)), dtype=np.int64)
+    for k in range(count):
+        player_id, pos = read_varint(data, pos)
+        mask, pos = read_varint(data, pos)
+        row = base_rows.get(player_id, zeros).copy()
+        for field in range(len(FIELDS)):
+            if mask >> field & 1:
+                value, pos = read_varint(data, pos)
+                row[field] += unzigzag(value)
+        ids[k] = player_id
+        state[k] = row
+
+    size, pos = read_varint(data, pos)
+    snapshot = Snapshot(tick, level, level_ticks, score, lives, ids, state, np.zeros(size, dtype=np.uint8))
+    coins = _coin_baseline(snapshot, baseline).copy()
+    changed, pos = read_varint(data, pos)
+    index = 0
+    for _ in range(changed):
+        gap, pos = read_varint(data, pos)
+        index += gap
+        coins[index] = data[pos]
+        pos += 1
+    snapshot.coins = coins
+    return snapshot, input_ack, echo, hold
+
+
+def _coin_baseline(snapshot, baseline):
+    """The baseline's bitset if it is for the same level's coins, else all zeros"""
+    if (baseline is not None and baseline.level == snapshot.level
+            and len(baseline.coins) == len(snapshot.coins)):
+        return baseline.coins
+    return np.zeros(len(snapshot.coins), dtype=np.uint8)
+
+
+# Transport
+
+class Link:
+    """A non-blocking UDP socket that can lose and delay what it sends (loss is a probability, times in seconds)"""
+
+    def __init__(self, bind=("0.0.0.0", 0), loss=0.0, latency=0.0, jitter=0.0, clock=time.perf_counter,
+                 seed=None, stats=None):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(bind)
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.stats = stats
+        self.delayed = []  # Heap of (due, order, data, address)
+        self.order = 0
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def send(self, data, address):
+        if self.stats:
+            self.stats.sent(len(data))
+        if self.loss and self.random.random() < self.loss:
+            if self.stats:
+                self.stats.count("simulated_loss")
+            return
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay <= 0:
+            self._send(data, address)
+            return
+        self.order += 1
+        heapq.heappush(self.delayed, (self.clock() + delay, self.order, data, address))
+
+    def _send(self, data, address):
+        try:
+            self.socket.sendto(data, address)
+        except OSError:
+            if self.stats:
+                self.stats.count("send_errors")
+
+    def flush(self):
+        """Send delayed packets that are due"""
+        now = self.clock()
+        while self.delayed and self.delayed[0][0] <= now:
+            _, _, data, address = heapq.heappop(self.delayed)
+            self._send(data, address)
+
+    def receive(self):
+        """Every datagram waiting, as (data, address)"""
+        self.flush()
+        packets = []
+        while True:
+            try:
+                data, address = self.socket.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                continue  # ICMP port unreachable from a peer that left
+            if self.stats:
+                self.stats.received(len(data))
+            packets.append((data, address))
+        return packets
+
+    def close(self):
+        self.socket.close()
+
+
+def parse_address(text, default_port=DEFAULT_PORT):
+    host, _, port = text.rpartition(":") if ":" in text else (text, "", "")
+    return socket.gethostbyname(host or "127.0.0.1"), int(port) if port else default_port
+
+
+class NetStats:
+    """Traffic and timing for one end; report() is what F4 prints"""
+
+    def __init__(self, name, stats=None, clock=time.perf_counter, window=1.0):
+        self.name = name
+        self.instrumentation = stats
+        self.clock = clock
+        self.window = window
+        self.started = clock()
+        self.bytes_in = self.bytes_out = 0
+        self.packets_in = self.packets_out = 0
+        self.recent = deque()  # (time, bytes in, bytes out) over the last `window` seconds
+        self.counts = {}
+        self.rtt = deque(maxlen=120)
+        self.snapshot_bytes = deque(maxlen=120)
+        self.full_bytes = deque(maxlen=120)    # What the same snapshots would take without a baseline
+        self.corrections = deque(maxlen=120)
+
+    def sent(self, size):
+        self.bytes_out += size
+        self.packets_out += 1
+        self.recent.append((self.clock(), 0, size))
+        if self.instrumentation:
+            self.instrumentation.count("net_bytes_out", size)
+
+    def received(self, size):
+        self.bytes_in += size
+        self.packets_in += 1
+        self.recent.append((self.clock(), size, 0))
+        if self.instrumentation:
+            self.instrumentation.count("net_bytes_in", size)
+
+    def count(self, name, amount=1):
+        self.counts[name] = self.counts.get(name, 0) + amount
+        if self.instrumentation:
+            self.instrumentation.count(f"net_{name}", amount)
+
+    def sample(self, series, name, value):
+        series.append(value)
+        if self.instrumentation:
+            self.instrumentation.record(name, value)
+
+    def rates(self):
+        """(kbit/s in, kbit/s out) over the last window"""
+        horizon = self.clock() - self.window
+        while self.recent and self.recent[0][0] < horizon:
+            self.recent.popleft()
+        span = min(self.window, max(self.clock() - self.started, 1e-9))
+        return (sum(r[1] for r in self.recent) * 8 / 1000 / span,
+                sum(r[2] for r in self.recent) * 8 / 1000 / span)
+
+    def report(self):
+        down, up = self.rates()
+        lines = [f"🌐 {self.name}: in {down:.1f} kbit/s ({self.packets_in} packets, {self.bytes_in / 1024:.1f} KB), "
+                 f"out {up:.1f} kbit/s ({self.packets_out} packets, {self.bytes_out / 1024:.1f} KB)"]
+        if self.rtt:
+            rtt = sorted(self.rtt)
+            lines.append(f"   round trip {sum(rtt) / len(rtt):.1f} ms mean, {rtt[len(rtt) // 2]:.1f} p50, "
+                         f"{rtt[min(len(rtt) - 1, int(len(rtt) * 0.95))]:.1f} p95")
+        if self.snapshot_bytes:
+            mean = sum(self.snapshot_bytes) / len(self.snapshot_bytes)
+            line = f"   snapshots {mean:.1f} bytes mean, {max(self.snapshot_bytes)} max"
+            if self.full_bytes:
+                line += f" ({mean / (sum(self.full_bytes) / len(self.full_bytes)):.0%} of sending them in full)"
+            lines.append(line)
+        if self.corrections:
+            lines.append(f"   prediction error {sum(self.corrections) / len(self.corrections) * 1000:.2f} mm mean, "
+                         f"{max(self.corrections) * 1000:.2f} mm max")
+        if self.counts:
+            lines.append("   " + ", ".join(f"{name} {count}" for name, count in sorted(self.counts.items())))
+        return "\n".join(lines)
+
+
+class _Muted:
+    """Stands in for the sound manager and particles while replaying or simulating unseen ticks"""
+
+    def play_jump(self, *args):
+        pass
+
+    def emit(self, *args):
+        pass
+
+
+MUTED = _Muted()
+
+
+def _clock_ms(clock):
+    return int(clock() * 1000) & 0xFFFFFFFF
+
+
+# Host
+
+class RemoteClient:
+    def __init__(self, player_id, address, player, now):
+        self.id = player_id
+        self.address = address
+        self.player = player
+        self.inputs = {}          # seq -> (move x, move z, jump) not applied yet
+        self.next_seq = 1
+        self.applied = 0          # Newest seq applied, echoed in snapshots
+        self.acked = 0            # Newest snapshot tick the client has
+        self.echo = 0             # Client send time of its newest INPUT, and when it arrived
+        self.echo_received = now
+        self.last_heard = now
+
+
+class NetHost:
+    authoritative = True
+
+    def __init__(self, game, port=DEFAULT_PORT, loss=0.0, latency=0.0, jitter=0.0, stats=None,
+                 clock=time.perf_counter, seed=None):
+        self.game = game
+        self.clock = clock
+        self.stats = NetStats("host", stats, clock)
+        self.link = Link(("0.0.0.0", port), loss, latency, jitter, clock, seed, self.stats)
+        self.clients = {}         # address -> RemoteClient
+        self.tick = 0
+        self.history = {}         # tick -> Snapshot
+        self.level_coins = {}     # (x, y, z) -> bit index
+        self.coin_count = 0
+        self.level_loaded()
+        print(f"🌐 Hosting on UDP port {self.link.address[1]}")
+
+    @property
+    def address(self):
+        return self.link.address
+
+    def level_loaded(self):
+        """Number the fresh level's coins and put everyone back at the start"""
+        self.level_coins = {tuple(coin[:3]): i for i, coin in enumerate(self.game.coins)}
+        self.coin_count = len(self.game.coins)
+        for client in self.clients.values():
+            client.player.reset()
+
+    def update(self, dt):
+        """Read packets, step the remote players, and send snapshots when due; call once per tick"""
+        self.tick += 1
+        now = self.clock()
+        for data, address in self.link.receive():
+            self._handle(data, address, now)
+        for address, client in list(self.clients.items()):
+            if now - client.last_heard > TIMEOUT:
+                print(f"🌐 Player {client.id} timed out")
+                del self.clients[address]
+        if self.game.game_state == "playing":
+            for client in self.clients.values():
+                self._simulate(client)
+        if self.tick % SNAPSHOT_INTERVAL == 0:
+            self._send_snapshots(now)
+
+    def _handle(self, data, address, now):
+        kind = data[0] if data else 0
+        client = self.clients.get(address)
+        if kind == HELLO:
+            if len(data) < HELLO_PACKET.size or HELLO_PACKET.unpack_from(data)[1] != PROTOCOL:
+                return
+            if client is None:
+                used = {c.id for c in self.clients.values()}
+                free = [i for i in range(1, MAX_PLAYERS) if i not in used]
+                if not free:
+                    self.link.send(bytes([FULL]), address)
+                    return
+                client = RemoteClient(free[0], address, type(self.game.player)(), now)
+                self.clients[address] = client
+                print(f"🌐 Player {client.id} joined from {address[0]}:{address[1]}")
+            client.last_heard = now
+            self.link.send(WELCOME_PACKET.pack(WELCOME, client.id, TICK_RATE, SNAPSHOT_INTERVAL), address)
+        elif kind == INPUT and client is not None and len(data) >= INPUT_HEADER.size:
+            _, _, ack, sent, first, count = INPUT_HEADER.unpack_from(data)
+            client.last_heard = now
+            if ack > client.acked and ack in self.history:
+                client.acked = ack
+            client.echo, client.echo_received = sent, now
+            for k in range(count):
+                seq = first + k
+                if seq >= client.next_seq and seq not in client.inputs:
+                    offset = INPUT_HEADER.size + k * INPUT_ENTRY.size
+                    client.inputs[seq] = INPUT_ENTRY.unpack_from(data, offset)
+        elif kind == BYE and client is not None:
+            print(f"🌐 Player {client.id} left")
+            del self.clients[address]
+
+    def _simulate(self, client):
+        """Apply the client's inputs in sequence: one per tick, more to work off a backlog, none if it's late"""
+        inputs = client.inputs
+        steps = 1 + max(0, len(inputs) - MAX_BACKLOG)
+        for _ in range(steps):
+            if client.next_seq not in inputs:
+                if not inputs:
+                    # Late: wait rather than invent an input, so every tick the host simulates is one the
+                    # client also predicted. The backlog this leaves absorbs later jitter.
+                    self.stats.count("inputs_late")
+                    return
+                client.next_seq = min(inputs)  # Lost beyond what redundancy covered
+                self.stats.count("inputs_skipped")
+            move_x, move_z, jump = inputs.pop(client.next_seq)
+            client.applied = client.next_seq
+            client.next_seq += 1
+
+            game = self.game
+            player = client.player
+            player.control(move_x / 127.0, move_z / 127.0, bool(jump), game.sound_manager, game.particles)
+            player.update(game.platforms, TICK, game.sound_manager, game.particles, game.collision_grid,
+                          game.movers, game.hazards)
+            quantize_player(player)
+            game.collect_coins(player)
+        if steps > 1:
+            self.stats.count("inputs_doubled", steps - 1)
+
+    def capture(self):
+        """The current state as a Snapshot"""
+        game = self.game
+        players = [(0, game.player)] + [(c.id, c.player) for c in self.clients.values()]
+        collected = np.ones(self.coin_count, dtype=bool)
+        for coin in game.coins:
+            index = self.level_coins.get(tuple(coin[:3]))
+            if index is not None:
+                collected[index] = False
+        return Snapshot(self.tick, game.level, game.level_ticks, game.score, game.lives,
+                        np.array([player_id for player_id, _ in players], dtype=np.int64),
+                        np.array([player_state(player) for _, player in players]).reshape(-1, len(FIELDS)),
+                        np.packbits(collected))
+
+    def _send_snapshots(self, now):
+        snapshot = self.capture()
+        self.history[snapshot.tick] = snapshot
+        self.history.pop(snapshot.tick - HISTORY * SNAPSHOT_INTERVAL, None)
+        if self.clients:
+            self.stats.full_bytes.append(len(encode_snapshot(snapshot, None)))
+        for client in self.clients.values():
+            baseline = self.history.get(client.acked)
+            hold = int((now - client.echo_received) * 1000)
+            data = encode_snapshot(snapshot, baseline, client.applied, client.echo, hold)
+            self.link.send(data, client.address)
+            self.stats.sample(self.stats.snapshot_bytes, "net_snapshot_bytes", len(data))
+            self.stats.count("delta_snapshots" if baseline else "full_snapshots")
+
+    def peers(self):
+        return [c.player.pose() for c in self.clients.values()]
+
+    def report(self):
+        lines = [self.stats.report()]
+        for client in self.clients.values():
+            lines.append(f"   player {client.id} at {client.address[0]}:{client.address[1]}: "
+                         f"acked tick {client.acked} of {self.tick}, {len(client.inputs)} inputs buffered")
+        return "\n".join(lines)
+
+    def close(self):
+        self.link.close()
+
+
+# Client
+
+class NetClient:
+    authoritative = False
+
+    def __init__(self, game, address, loss=0.0, latency=0.0, jitter=0.0, stats=None,
+                 clock=time.perf_counter, seed=None):
+        self.game = game
+        self.clock = clock
+        self.server = parse_address(address) if isinstance(address, str) else tuple(address)
+        self.stats = NetStats("client", stats, clock)
+        self.link = Link(("0.0.0.0", 0), loss, latency, jitter, clock, seed, self.stats)
+        self.id = None
+        self.seq = 0
+        self.pending = deque(maxlen=TICK_RATE * 2)  # (seq, move x, move z, jump) not confirmed yet
+        self.received = {}        # tick -> Snapshot, baselines for what comes next
+        self.newest = None
+        self.timeline = deque(maxlen=16)  # Applied snapshots, oldest first, for interpolating others
+        self.server_tick = 0.0    # Estimate of the host's current tick
+        self.level_coins = []
+        self.shown_coins = None   # Bitset game.coins was last built from
+        self.last_hello = -math.inf
+        self.last_heard = clock()
+        self.lost_host = False
+        self.level_loaded()
+        print(f"🌐 Joining {self.server[0]}:{self.server[1]}")
+
+    def level_loaded(self):
+        self.level_coins = [list(coin) for coin in self.game.coins]
+        self.shown_coins = None
+
+    def update(self, dt):
+        """Send this tick's input, take in snapshots and correct the prediction; call once per tick"""
+        now = self.clock()
+        if self.id is not None:
+            self.server_tick += 1
+            self._record_input()
+        for data, address in self.link.receive():
+            if address == self.server:
+                self._handle(data, now)
+        if self.id is None:
+            if now - self.last_hello >= HELLO_INTERVAL:
+                self.link.send(HELLO_PACKET.pack(HELLO, PROTOCOL), self.server)
+                self.last_hello = now
+            return
+        if now - self.last_heard > TIMEOUT and not self.lost_host:
+            print("🌐 No word from the host")
+            self.lost_host = True
+        self._send_inputs()
+
+    def _record_input(self):
+        game = self.game
+        snapshot = game.last_input
+        if game.game_state == "playing" and snapshot is not None:
+            entry = (_axis(snapshot.move_x), _axis(snapshot.move_z), int(bool(snapshot.jump)))
+        else:
+            entry = (0, 0, 0)
+        self.seq += 1
+        self.pending.append((self.seq,) + entry)
+        quantize_player(game.player)  # This tick's prediction, rounded like the replays will be
+
+    def _send_inputs(self):
+        entries = list(self.pending)[-MAX_REDUNDANT:]
+        first = entries[0][0] if entries else self.seq + 1
+        out = bytearray(INPUT_HEADER.pack(INPUT, self.id, self.newest.tick if self.newest else 0,
+                                          _clock_ms(self.clock), first, len(entries)))
+        for _, move_x, move_z, jump in entries:
+            out += INPUT_ENTRY.pack(move_x, move_z, jump)
+        self.link.send(bytes(out), self.server)
+
+    def _handle(self, data, now):
+        self.last_heard = now
+        self.lost_host = False
+        kind = data[0] if data else 0
+        if kind == WELCOME and self.id is None:
+            self.id = WELCOME_PACKET.unpack_from(data)[1]
+            print(f"🌐 Joined as player {self.id}")
+        elif kind == FULL and self.id is None:
+            print("🌐 The game is full")
+            self.last_hello = math.inf
+        elif kind == SNAPSHOT and self.id is not None:
+            decoded = decode_snapshot(data, self.received)
+            if decoded is None:
+                self.stats.count("missing_baseline")
+                return
+            snapshot, input_ack, echo, hold = decoded
+            self.stats.sample(self.stats.snapshot_bytes, "net_snapshot_bytes", len(data))
+            rtt = ((_clock_ms(self.clock) - echo) & 0xFFFFFFFF) - hold
+            if 0 <= rtt < 60000:
+                self.stats.sample(self.stats.rtt, "net_rtt_ms", rtt)
+            self.received[snapshot.tick] = snapshot
+            if self.newest is None or snapshot.tick > self.newest.tick:
+                if self.newest is not None:
+                    missed = (snapshot.tick - self.newest.tick) // SNAPSHOT_INTERVAL - 1
+                    if missed > 0:
+                        self.stats.count("snapshots_missed", missed)
+                self.newest = snapshot
+                self._apply(snapshot, input_ack)
+            else:
+                self.stats.count("snapshots_late")
+            for tick in [t for t in self.received if t <= self.newest.tick - HISTORY * SNAPSHOT_INTERVAL]:
+                del self.received[tick]
+
+    def _apply(self, snapshot, input_ack):
+        game = self.game
+        reloaded = snapshot.level != game.level
+        if reloaded:
+            game.load_level(snapshot.level)
+        game.score, game.lives = snapshot.score, snapshot.lives
+
+        # Coins: rebuild the visible list when the bitset changes
+        if self.shown_coins is None or not np.array_equal(self.shown_coins, snapshot.coins):
+            collected = np.unpackbits(snapshot.coins)[:len(self.level_coins)]
+            game.coins = [coin for coin, taken in zip(self.level_coins, collected.tolist()) if not taken]
+            self.shown_coins = snapshot.coins
+
+        # Interpolation target for this snapshot's tick
+        if abs(snapshot.tick - self.server_tick) > 30:
+            self.server_tick = float(snapshot.tick)
+        else:
+            self.server_tick += (snapshot.tick - self.server_tick) * 0.1
+        self.timeline.append(snapshot)
+
+        row = snapshot.row(self.id)
+        if row is not None:
+            self._reconcile(row, input_ack, snapshot.level_ticks, measure=not reloaded)
+
+    def _reconcile(self, row, input_ack, level_ticks, measure=True):
+        """Start from the host's state for our player and replay the inputs it hasn't seen"""
+        game = self.game
+        player = game.player
+        movers, hazards = game.movers, game.hazards
+        predicted = (player.x, player.y, player.z)
+        while self.pending and self.pending[0][0] <= input_ack:
+            self.pending.popleft()
+        set_player_state(player, row)
+        # The host's next tick moves platforms and hazards to level_ticks; replay inputs against the same positions
+        movers.step(level_ticks - 1, game.platforms, game.collision_grid)
+        for k, (_, move_x, move_z, jump) in enumerate(self.pending):
+            movers.step(level_ticks + k, game.platforms, game.collision_grid)
+            hazards.step(level_ticks + k)
+            player.control(move_x / 127.0, move_z / 127.0, bool(jump), MUTED, MUTED)
+            player.update(game.platforms, TICK, MUTED, MUTED, game.collision_grid, movers, hazards)
+            quantize_player(player)
+        game.level_ticks = level_ticks + len(self.pending)
+        if not measure:
+            return  # A level change moved us, not a misprediction
+        error = math.dist(predicted, (player.x, player.y, player.z))
+        self.stats.sample(self.stats.corrections, "net_correction", error)
+        if error > 0.05:
+            self.stats.count("mispredictions")
+
+    def peers(self):
+        """Other players as PlayerPoses, INTERP_TICKS behind the newest snapshot"""
+        if not self.timeline:
+            return []
+        target = self.server_tick - INTERP_TICKS
+        after = next((s for s in self.timeline if s.tick >= target), self.timeline[-1])
+        before = next((s for s in reversed(self.timeline) if s.tick <= target), after)
+        span = after.tick - before.tick
+        alpha = min(max((target - before.tick) / span, 0.0), 1.0) if span else 0.0
+        size = self.game.player.size
+        poses = []
+        for player_id, row in zip(after.ids.tolist(), after.state):
+            if player_id == self.id:
+                continue
+            start = before.row(player_id)
+            values = row / SCALE if start is None else (start + (row - start) * alpha) / SCALE
+            poses.append(PlayerPose(values[0], values[1], values[2], values[6], bool(values[7]), size))
+        return poses
+
+    def report(self):
+        return self.stats.report() + f"\n   player {self.id}, {len(self.pending)} inputs unconfirmed"
+
+    def close(self):
+        if self.id is not None:
+            self.link._send(bytes([BYE]), self.server)  # Now, past any simulated delay or loss
+        self.link.close()
+
+
+# Loopback test
+
+def coin_bot(seed):
+    """Input for a player that heads for the nearest coin and hops now and then"""
+    rng = random.Random(seed)
+
+    def drive(game):
+        from input_snapshot import InputSnapshot
+        player = game.player
+        if not game.coins:
+            return InputSnapshot(time.perf_counter(), 0.0, 0.0, False, 0.0, 0.0)
+        x, y, z = min(game.coins, key=lambda c: (c[0] - player.x) ** 2 + (c[2] - player.z) ** 2)[:3]
+        dx, dz = x - player.x, z - player.z
+        jump = (y > player.y + 0.3 and player.on_ground) or rng.random() < 0.02
+        return InputSnapshot(time.perf_counter(), max(-1.0, min(1.0, dx)), max(-1.0, min(1.0, dz)), jump, 0.0, 0.0)
+
+    return drive
+
+
+def loopback(args):
+    """A host and several clients in one process over 127.0.0.1, driven by coin-hunting bots on a shared clock"""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    from offscreen import load_game
+    game_module = load_game()
+    import pygame
+    pygame.init()
+    game_module.init_display(opengl=False)
+
+    tick = [0]
+    clock = lambda: tick[0] * TICK
+    conditions = dict(loss=args.loss, latency=args.latency / 1000.0, jitter=args.jitter / 1000.0, clock=clock)
+    chatter = io.StringIO()  # Coin and join messages from every game in the process
+    with contextlib.redirect_stdout(chatter):
+        def new_game():
+            return game_module.Game(pacing="uncapped", max_ghosts=0, renderer="null", quality="low", music=False)
+        host = new_game()
+        host.load_level(args.level)
+        host.net = NetHost(host, port=0, seed=0, **conditions)
+        clients = []
+        for k in range(args.clients):
+            game = new_game()
+            game.load_level(args.level)
+            game.net = NetClient(game, ("127.0.0.1", host.net.address[1]), seed=k + 1, **conditions)
+            clients.append(game)
+    games = [host] + clients
+    bots = [coin_bot(k) for k in range(len(games))]
+
+    def step(playing):
+        for game, bot in zip(games, bots):
+            game.last_input = bot(game) if playing else bot(game)._replace(move_x=0.0, move_z=0.0, jump=False)
+            game.apply_input(game.last_input)
+            game.update(TICK)
+            game.stats.end_frame()
+        tick[0] += 1
+
+    ticks = int(args.seconds * TICK_RATE)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(chatter):
+        for _ in range(ticks):
+            step(True)
+        # Stand still for a second so the last snapshots get through the loss
+        for _ in range(TICK_RATE):
+            step(False)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.clients} clients, {args.seconds:g} s at {TICK_RATE} Hz, loss {args.loss:.0%}, "
+          f"latency {args.latency:g} ms + up to {args.jitter:g} ms jitter "
+          f"({elapsed / (ticks + TICK_RATE) / len(games) * 1000:.2f} ms per game tick)")
+    print(host.net.report())
+    failures = 0
+    host_coins = sorted(map(tuple, host.coins))
+    for game in clients:
+        net = game.net
+        print(net.report())
+        agree = net.id is not None and sorted(map(tuple, game.coins)) == host_coins and game.level == host.level
+        remote = next((c.player for c in host.net.clients.values() if c.id == net.id), None)
+        drift = math.dist((remote.x, remote.y, remote.z), (game.player.x, game.player.y, game.player.z)) if remote else math.inf
+        print(f"   level {game.level}, {len(game.coins)} coins left ({'matches' if agree else 'DIFFERS FROM'} "
+              f"the host), own position {drift * 1000:.1f} mm from the host's")
+        failures += not agree or drift > 0.05
+    print(f"Host: level {host.level}, score {host.score}, {len(host.coins)} coins left")
+    for game in games:
+        game.net.close()
+    pygame.quit()
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local network multiplayer for the 3D Platformer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    t = sub.add_parser("loopback", help="Host and clients in one process over loopback, with simulated loss")
+    t.add_argument("--clients", type=int, default=3)
+    t.add_argument("--seconds", type=float, default=20.0)
+    t.add_argument("--level", type=int, default=1)
+    t.add_argument("--loss", type=float, default=0.1, help="Chance each packet is dropped, both directions")
+    t.add_argument("--latency", type=float, default=30.0, help="One-way delay in ms")
+    t.add_argument("--jitter", type=float, default=10.0, help="Extra random delay in ms, up to this")
+    args = parser.parse_args()
+    raise SystemExit(loopback(args))
+
+
+if __name__ == "__main__":
+    main()
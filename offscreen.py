@@ -0,0 +1,407 @@
+"""
+Headless rendering for the 3D Platformer.
+
+Runs the game's normal render path (Game.render and the chosen renderer,
+see renderers.py) into an offscreen GL context. No window or display is needed, so it works on a
+CPU-only Linux box with software Mesa (llvmpipe). Two backends:
+
+    egl      EGL pbuffer on the surfaceless platform (libEGL from Mesa)
+    osmesa   OSMesa rendering into a client-memory buffer (libOSMesa)
+
+The GL platform has to be chosen before OpenGL is first imported, so the
+game module is loaded only after configure_environment() runs.
+
+    python offscreen.py bench --levels 1 2 3 4 5 --frames 300
+    python offscreen.py --renderer immediate bench
+    python offscreen.py --quality low bench
+    python offscreen.py --width 1920 --height 1080 --render-scale 0.5 bench
+    python offscreen.py capture --level 3 --frames 120 --output level3.png
+    python offscreen.py golden --dir golden            # compare, exit 1 on mismatch
+    python offscreen.py golden --dir golden --update   # (re)write the images
+    python offscreen.py check                          # behavior checks, exit 1 on failure
+"""
+
+import argparse
+import ctypes
+import importlib.util
+import os
+import random
+import sys
+import time
+
+BACKENDS = ("egl", "osmesa")
+GAME_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "3d-platform-clauder4.py")
+
+
+def configure_environment(backend="egl"):
+    """Pick the GL platform and keep SDL away from any display or sound device"""
+    os.environ["PYOPENGL_PLATFORM"] = backend
+    if backend == "egl":
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+
+class OffscreenContext:
+    def __init__(self, width=800, height=600, backend="egl"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        if os.environ.get("PYOPENGL_PLATFORM") != backend:
+            raise RuntimeError("call configure_environment() before importing OpenGL")
+        self.width = width
+        self.height = height
+        self.backend = backend
+        if backend == "egl":
+            self._create_egl()
+        else:
+            self._create_osmesa()
+
+    def _create_egl(self):
+        from OpenGL import EGL
+
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not EGL.eglInitialize(display, None, None):
+            raise RuntimeError("eglInitialize failed")
+        attributes = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE)
+        config = EGL.EGLConfig()
+        count = EGL.EGLint()
+        if not EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count)) or not count.value:
+            raise RuntimeError("no EGL config with an OpenGL pbuffer")
+        size = (EGL.EGLint * 5)(EGL.EGL_WIDTH, self.width, EGL.EGL_HEIGHT, self.height, EGL.EGL_NONE)
+        self.surface = EGL.eglCreatePbufferSurface(display, config, size)
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(display, self.surface, self.surface, self.context):
+            raise RuntimeError("eglMakeCurrent failed")
+        self.display = display
+
+    def _create_osmesa(self):
+        from OpenGL import GL, arrays, osmesa
+
+        self.context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not self.context:
+            raise RuntimeError("OSMesaCreateContextExt failed")
+        self.buffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL.GL_UNSIGNED_BYTE, self.width, self.height):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+
+    def renderer(self):
+        from OpenGL.GL import GL_RENDERER, glGetString
+        return glGetString(GL_RENDERER).decode()
+
+    def finish(self):
+        """Stands in for display.flip: wait until the frame is fully drawn"""
+        from OpenGL.GL import glFinish
+        glFinish()
+
+    def read_pixels(self):
+        """The current frame as an RGB uint8 array, top row first"""
+        import numpy as np
+        from OpenGL.GL import GL_PACK_ALIGNMENT, GL_RGB, GL_UNSIGNED_BYTE, glPixelStorei, glReadPixels
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)[::-1]
+
+    def save_png(self, filename, pixels=None):
+        import pygame
+        pixels = self.read_pixels() if pixels is None else pixels
+        surface = pygame.image.frombuffer(pixels.tobytes(), (self.width, self.height), "RGB")
+        pygame.image.save(surface, filename)
+
+    def close(self):
+        if self.backend == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(self.display, self.surface)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglTerminate(self.display)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.context)
+
+
+def load_game():
+    """Import the game script (its file name isn't a valid module name)"""
+    spec = importlib.util.spec_from_file_location("platformer_game", GAME_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class HeadlessGame:
+    """A Game instance driven frame by frame with no input, rendering offscreen"""
+
+    def __init__(self, width=800, height=600, backend="egl", ghosts=0, renderer="batched", quality="high",
+                 render_scale=1.0):
+        configure_environment(backend)
+        self.context = OffscreenContext(width, height, backend)
+        import pygame
+        self.game_module = load_game()
+        self.game_module.display_width, self.game_module.display_height = width, height
+        pygame.display.set_mode((1, 1))  # Dummy driver; only so events and key state work
+        self.game_module.setup_gl()
+        # A fixed quality tier, so frames don't depend on how fast this machine is
+        self.game = self.game_module.Game(pacing="uncapped", max_ghosts=ghosts, renderer=renderer,
+                                          quality=quality,
+                                          render_scale=self.game_module.parse_render_scale(str(render_scale)))
+        self.game.present = self.context.finish
+
+    def load_level(self, level):
+        random.seed(level)  # Particles use random; keep frames reproducible
+        self.game.load_level(level)
+        self.game.game_state = "playing"
+
+    def step(self, render=True):
+        """One fixed 60 Hz frame: events, simulation, and optionally rendering"""
+        game = self.game
+        game.handle_events()
+        game.apply_input(game.last_input)
+        game.update(1 / 60.0)
+        if render:
+            game.render(game.build_snapshot())
+        game.stats.end_frame()
+
+    def run_frames(self, frames):
+        for _ in range(frames):
+            self.step()
+
+    def close(self):
+        self.context.close()
+
+
+def bench(args):
+    headless = HeadlessGame(args.width, args.height, args.backend, renderer=args.renderer,
+                            quality=args.quality, render_scale=args.render_scale)
+    print(f"Renderer: {args.renderer} on {headless.context.renderer()} ({args.backend}), "
+          f"{args.width}x{args.height}, quality {args.quality}, render scale {args.render_scale}")
+    print(f"{'level':>6} {'fps':>8} {'mean ms':>8} {'p95 ms':>8} {'items':>7} {'changes':>8}")
+    game = headless.game
+    for level in args.levels:
+        headless.load_level(level)
+        headless.run_frames(args.warmup)
+        game.stats.samples.clear()
+        times = []
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            frame_start = time.perf_counter()
+            headless.step()
+            times.append((time.perf_counter() - frame_start) * 1000.0)
+        elapsed = time.perf_counter() - start
+        times.sort()
+        items = game.stats.stats("draw_items")
+        changes = game.stats.stats("gl_state_changes")
+        print(f"{level:>6} {args.frames / elapsed:8.1f} {sum(times) / len(times):8.2f} "
+              f"{times[int(len(times) * 0.95)]:8.2f} {items['mean'] if items else 0:7.0f} "
+              f"{changes['mean'] if changes else 0:8.1f}")
+    headless.close()
+
+
+def capture(args):
+    headless = HeadlessGame(args.width, args.height, args.backend, renderer=args.renderer,
+                            quality=args.quality, render_scale=args.render_scale)
+    headless.load_level(args.level)
+    headless.run_frames(args.frames)
+    pixels = headless.context.read_pixels()
+    if args.output:
+        headless.context.save_png(args.output, pixels)
+        print(f"Saved {args.output}")
+    if args.npy:
+        import numpy as np
+        np.save(args.npy, pixels)
+        print(f"Saved {args.npy}")
+    headless.close()
+
+
+def golden(args):
+    """Render each level after a fixed number of frames and compare with stored PNGs"""
+    import numpy as np
+    import pygame
+
+    headless = HeadlessGame(args.width, args.height, args.backend, renderer=args.renderer,
+                            quality=args.quality, render_scale=args.render_scale)
+    os.makedirs(args.dir, exist_ok=True)
+    failed = 0
+    for level in args.levels:
+        headless.load_level(level)
+        headless.run_frames(args.frames)
+        pixels = headless.context.read_pixels()
+        filename = os.path.join(args.dir, f"level_{level}.png")
+        if args.update or not os.path.exists(filename):
+            headless.context.save_png(filename, pixels)
+            print(f"level {level}: wrote {filename}")
+            continue
+        expected = pygame.surfarray.array3d(pygame.image.load(filename)).transpose(1, 0, 2)
+        if expected.shape != pixels.shape:
+            print(f"level {level}: FAIL size {expected.shape[1]}x{expected.shape[0]} != {args.width}x{args.height}")
+            failed += 1
+            continue
+        diff = np.abs(expected.astype(np.int16) - pixels.astype(np.int16)).max(axis=2)
+        bad = int((diff > args.tolerance).sum())
+        if bad > args.max_pixels:
+            failed += 1
+            headless.context.save_png(os.path.join(args.dir, f"level_{level}.actual.png"), pixels)
+            print(f"level {level}: FAIL {bad} pixels differ (max {int(diff.max())})")
+        else:
+            print(f"level {level}: ok ({bad} pixels differ)")
+    headless.close()
+    return 1 if failed else 0
+
+
+FLAT_LEVEL = {"platforms": [[0, -0.5, 0, 200, 0.5, 200]], "platform_colors": [[0.2, 0.7, 0.2]],
+              "coins": [[90, 0.5, 90]]}
+
+
+def check_frame_rate(headless):
+    """Holding right and jump for two seconds goes as high and as far at 30, 60 and 144 fps"""
+    from input_snapshot import InputSnapshot
+    game = headless.game
+    tracks = {}
+    for fps in (30, 60, 144):
+        game.apply_level_data(FLAT_LEVEL)
+        game.player.reset()
+        game.level_ready()
+        game.game_state = "playing"
+        game.stepper.reset()
+        game.last_input = InputSnapshot(0.0, 1.0, 0.0, True, 0.0, 0.0)
+        track = tracks[fps] = {}
+        for _ in range(2 * fps):
+            game.simulate(1.0 / fps)
+            track[game.level_ticks] = (game.player.x, game.player.y)
+    # Frames at different rates end on different ticks; compare the ones every rate saw
+    common = sorted(set.intersection(*(set(track) for track in tracks.values())))
+    ok = True
+    for fps, track in tracks.items():
+        top = max(track[tick][1] for tick in common)
+        print(f"   {fps:>3} fps: {max(track)} ticks, highest y {top:.4f}, ran {track[max(track)][0]:.4f}")
+        ok &= max(track) == 120 and all(track[tick] == tracks[60][tick] for tick in common)
+    return ok
+
+
+def check_vsync_governor(headless, seconds=4.0):
+    """Frames that wait out a 60 Hz vsync in flip() don't make --quality auto step down"""
+    from quality_governor import QualityGovernor
+    game = headless.game
+    saved = game.quality, game.present, game.pacer.mode
+    game.quality = QualityGovernor("auto", 60, stats=game.stats)
+    game.pacer.mode = "vsync"
+    period = 1.0 / 60
+    epoch = time.perf_counter()
+
+    def vsync_flip():
+        headless.context.finish()
+        time.sleep(period - (time.perf_counter() - epoch) % period)
+
+    game.present = vsync_flip
+    headless.load_level(1)
+    work, frames = [], []
+    for _ in range(int(seconds * 60)):
+        game.frame()
+        work.append((game.work_done - game.pacer.last_frame) * 1000.0)
+        frames.append((time.perf_counter() - game.pacer.last_frame) * 1000.0)
+    tier = game.quality.current.name
+    print(f"   work {sum(work) / len(work):.1f} ms, whole frame {sum(frames) / len(frames):.1f} ms, "
+          f"tier {tier} after {len(frames)} frames")
+    game.quality, game.present, game.pacer.mode = saved
+    return tier == "high"
+
+
+def check_audio(headless):
+    """The game's mixer opens with the engine's settings, and effects and music last as long at its rate as intended"""
+    import pygame
+    sound = headless.game.sound_manager
+    init = pygame.mixer.get_init()
+    if not sound.enabled or not init:
+        print("   no mixer; nothing to check")
+        return True
+    engine = sound.engine
+    print(f"   mixer {init}, buffer {engine.buffer} ({engine.latency_ms:.1f} ms)")
+    ok = init[0] == engine.frequency and abs(engine.latency_ms - engine.buffer / init[0] * 1000.0) < 1e-9
+    for name, sound_object, seconds in (("jump", sound.jump_sound, 0.1), ("coin", sound.coin_sound, 0.15)):
+        length = sound_object.get_length()
+        print(f"   {name}: {length * 1000:.1f} ms, made for {seconds * 1000:.0f} ms")
+        ok &= abs(length - seconds) < 0.002
+    music = headless.game.music
+    if music is not None:
+        # A chunk queued on the mixer must last as long as the synthesizer meant, or pitch and tempo are off
+        from music_engine import CHUNK
+        length = pygame.sndarray.make_sound(music.synth.block(CHUNK)).get_length()
+        print(f"   music: {music.synth.rate} Hz, a chunk lasts {length * 1000:.1f} ms, "
+              f"made for {CHUNK / music.synth.rate * 1000:.1f} ms")
+        ok &= music.synth.rate == init[0] and abs(length - CHUNK / music.synth.rate) < 0.001
+    return ok
+
+
+CHECKS = {
+    "frame-rate": check_frame_rate,
+    "vsync-governor": check_vsync_governor,
+    "audio": check_audio,
+}
+
+
+def check(args):
+    headless = HeadlessGame(args.width, args.height, args.backend, renderer=args.renderer,
+                            quality=args.quality, render_scale=args.render_scale)
+    failed = 0
+    for name in args.checks or CHECKS:
+        print(f"{name}:")
+        ok = CHECKS[name](headless)
+        print(f"{name}: {'ok' if ok else 'FAIL'}")
+        failed += not ok
+    headless.close()
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless rendering: benchmarks, captures and golden images")
+    parser.add_argument("--backend", choices=BACKENDS, default="egl")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--renderer", choices=("batched", "immediate", "null"), default="batched")
+    parser.add_argument("--quality", choices=("high", "medium", "low", "minimal"), default="high")
+    parser.add_argument("--render-scale", default="1.0", help="3D resolution as a fraction, or auto")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    b = sub.add_parser("bench", help="Frames per second for each level")
+    b.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    b.add_argument("--frames", type=int, default=300)
+    b.add_argument("--warmup", type=int, default=30)
+
+    c = sub.add_parser("capture", help="Save one frame as PNG and/or .npy")
+    c.add_argument("--level", type=int, default=1)
+    c.add_argument("--frames", type=int, default=60, help="Frames to simulate before capturing")
+    c.add_argument("--output", default="frame.png")
+    c.add_argument("--npy", help="Also save the RGB array with numpy.save")
+
+    g = sub.add_parser("golden", help="Compare level renders against stored images")
+    g.add_argument("--dir", default="golden")
+    g.add_argument("--levels", type=int, nargs="+", default=[1, 2, 3, 4, 5])
+    g.add_argument("--frames", type=int, default=60)
+    g.add_argument("--tolerance", type=int, default=8, help="Per-channel difference still counted as equal")
+    g.add_argument("--max-pixels", type=int, default=50, help="Differing pixels allowed per image")
+    g.add_argument("--update", action="store_true", help="Rewrite the stored images")
+
+    k = sub.add_parser("check", help="Gameplay and pacing behavior checks")
+    k.add_argument("checks", nargs="*", metavar="check", help=f"Any of {', '.join(CHECKS)} (default: all)")
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        bench(args)
+    elif args.command == "capture":
+        capture(args)
+    elif args.command == "check":
+        unknown = set(args.checks) - set(CHECKS)
+        if unknown:
+            parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+        sys.exit(check(args))
+    else:
+        sys.exit(golden(args))
+
+
+if __name__ == "__main__":
+    main()
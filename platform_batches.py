@@ -0,0 +1,183 @@
+"""
+Static platform batches for the 3D Platformer.
+
+Platforms used to be drawn as one glBegin/glEnd cube each, so a level with
+thousands of them cost thousands of draws and tens of thousands of PyOpenGL
+calls per frame. When a level is indexed, PlatformBatches lays out every
+static platform (not moving, not part of a prefab instance) as vertex
+arrays grouped by material: 24 quad corners, their normals and 24 outline
+ends per platform, sorted so each color is one run of rows.
+
+Each frame the LOD still decides which platforms are visible. select() turns
+those into sorted rows, a fancy index gathers them into single arrays,
+and the batched renderer draws each material with one glDrawArrays and
+every outline with one more. Moving platforms and impostors are drawn one
+at a time as before.
+
+    python platform_batches.py bench --platforms 20000
+"""
+
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+from OpenGL.GL import *
+
+from ghosts import CUBE_NORMALS, CUBE_QUADS
+from render_queue import OPAQUE, OUTLINE
+
+DEFAULT_COLOR = (0.2, 0.7, 0.2)
+
+# The 12 edges of the same -1 to 1 cube, 2 ends each, in GL_LINES order
+CUBE_LINES = np.array([
+    [-1, -1, -1], [1, -1, -1], [-1, 1, -1], [1, 1, -1],    # Along x
+    [-1, -1, 1], [1, -1, 1], [-1, 1, 1], [1, 1, 1],
+    [-1, -1, -1], [-1, 1, -1], [1, -1, -1], [1, 1, -1],    # Along y
+    [-1, -1, 1], [-1, 1, 1], [1, -1, 1], [1, 1, 1],
+    [-1, -1, -1], [-1, -1, 1], [1, -1, -1], [1, -1, 1],    # Along z
+    [-1, 1, -1], [-1, 1, 1], [1, 1, -1], [1, 1, 1],
+], dtype=np.float32)
+
+CORNERS = len(CUBE_QUADS)  # Vertices per platform, for faces and for outlines alike
+
+# The batched platforms one frame shows: sorted rows with faces, and the rows also outlined
+BatchSelection = namedtuple("BatchSelection", "batches faces edges")
+
+
+class PlatformBatches:
+    def __init__(self, center, half, colors, static):
+        """`center` and `half` are [n, 3] (PlatformLOD's arrays); `static` masks the platforms to batch"""
+        n = len(center)
+        members = np.flatnonzero(static)
+        if len(colors) == n and all(len(color) == 3 for color in colors):
+            rgb = np.array(colors, dtype=np.float64).reshape(n, 3)[members]
+        else:
+            rgb = np.array([colors[i][:3] if i < len(colors) else DEFAULT_COLOR for i in members],
+                           dtype=np.float64).reshape(-1, 3)
+        palette, material = np.unique(rgb, axis=0, return_inverse=True)
+        material = material.reshape(-1)
+        order = np.argsort(material, kind="stable")
+        members, material = members[order], material[order]
+
+        self.count = len(members)
+        self.colors = [tuple(color) for color in palette.tolist()]
+        self.material = material
+        self.starts = np.searchsorted(material, np.arange(len(palette) + 1))  # First row of each material
+        self.row = np.full(n, -1, dtype=np.int64)
+        self.row[members] = np.arange(self.count)
+
+        c = center[members].astype(np.float32)[:, None, :]
+        h = half[members].astype(np.float32)[:, None, :]
+        self.boxes = np.hstack([center[members], half[members] * 2])
+        self.quads = c + CUBE_QUADS[None] * h
+        self.lines = c + CUBE_LINES[None] * h
+        # What glScalef does to a unit cube's normals without GL_NORMALIZE, so batched platforms
+        # light exactly like the ones drawn one at a time
+        self.normals = CUBE_NORMALS[None] / (h * 2)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.material, self.starts, self.row, self.boxes, self.quads, self.lines,
+                                      self.normals))
+
+    def select(self, outlined, faces_only, outlines=True):
+        """A BatchSelection of the batched platforms among the LOD tiers `outlined` and `faces_only`,
+        plus the indices in each tier it doesn't cover (moving platforms)"""
+        outlined = np.asarray(outlined, dtype=np.int64)
+        faces_only = np.asarray(faces_only, dtype=np.int64)
+        near, far = self.row[outlined], self.row[faces_only]
+        edges = np.sort(near[near >= 0])
+        faces = np.sort(np.concatenate([edges, far[far >= 0]]))
+        selection = BatchSelection(self, faces, edges if outlines else edges[:0])
+        return selection, outlined[near < 0].tolist(), faces_only[far < 0].tolist()
+
+    def select_all(self, outlines=True):
+        """Every batched platform, for drawing without LOD"""
+        rows = np.arange(self.count)
+        return BatchSelection(self, rows, rows if outlines else rows[:0])
+
+    def runs(self, rows):
+        """(first vertex, vertex count, color) for each material among sorted `rows`"""
+        bounds = np.searchsorted(rows, self.starts).tolist()
+        return [(bounds[m] * CORNERS, (bounds[m + 1] - bounds[m]) * CORNERS, color)
+                for m, color in enumerate(self.colors) if bounds[m + 1] > bounds[m]]
+
+    def draws(self, selection):
+        """The selection as Scene.platforms entries (box, color, outline), for drawing one at a time"""
+        outlined = np.isin(selection.faces, selection.edges).tolist()
+        colors = self.colors
+        return [(box, colors[m], outline) for box, m, outline in
+                zip(self.boxes[selection.faces].tolist(), self.material[selection.faces].tolist(), outlined)]
+
+
+def batch_geometry(verts, normals, first, count):
+    # Closed boxes wound counter-clockwise, like hazards; back faces can go
+    glEnable(GL_CULL_FACE)
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, verts)
+    glNormalPointer(GL_FLOAT, 0, normals)
+    glDrawArrays(GL_QUADS, first, count)
+    glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+    glDisable(GL_CULL_FACE)
+
+
+def line_array_geometry(verts):
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, verts)
+    glDrawArrays(GL_LINES, 0, len(verts))
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+
+def submit_batches(queue, selection, outline_color):
+    """Queue a BatchSelection: one lit draw per material, then one draw for all outlines"""
+    if selection is None or not len(selection.faces):
+        return
+    batches = selection.batches
+    verts = batches.quads[selection.faces].reshape(-1, 3)
+    normals = batches.normals[selection.faces].reshape(-1, 3)
+    for first, count, color in batches.runs(selection.faces):
+        queue.submit(OPAQUE, batch_geometry, verts, normals, first, count, color=color)
+    if len(selection.edges):
+        queue.submit(OUTLINE, line_array_geometry, batches.lines[selection.edges].reshape(-1, 3),
+                     color=outline_color)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static platform batch tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="Time building the batches and gathering a visible set")
+    bench.add_argument("--platforms", type=int, default=20000)
+    bench.add_argument("--colors", type=int, default=8)
+    bench.add_argument("--visible", type=float, default=0.25, help="Fraction of platforms drawn per frame")
+    bench.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    center = rng.uniform(-200, 200, size=(args.platforms, 3))
+    half = rng.uniform(0.5, 2.0, size=(args.platforms, 3))
+    colors = rng.random((args.colors, 3))[rng.integers(0, args.colors, args.platforms)].tolist()
+
+    start = time.perf_counter()
+    batches = PlatformBatches(center, half, colors, np.ones(args.platforms, dtype=bool))
+    build = (time.perf_counter() - start) * 1000.0
+
+    visible = np.flatnonzero(rng.random(args.platforms) < args.visible)
+    near = len(visible) // 4
+    start = time.perf_counter()
+    for _ in range(args.frames):
+        selection, _, _ = batches.select(visible[:near], visible[near:])
+        batches.quads[selection.faces].reshape(-1, 3)
+        batches.normals[selection.faces].reshape(-1, 3)
+        batches.lines[selection.edges].reshape(-1, 3)
+        runs = batches.runs(selection.faces)
+    per_frame = (time.perf_counter() - start) * 1000.0 / args.frames
+    print(f"{args.platforms} platforms, {len(batches.colors)} materials: built in {build:.1f} ms, "
+          f"{batches.nbytes / 1e6:.1f} MB")
+    print(f"{len(visible)} visible: {per_frame:.3f} ms per frame to select and gather, {len(runs)} face draws")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Prefabs: structures defined once in a level and placed any number of times.
+
+A staircase or a turn of a spiral used to be written out platform by
+platform wherever it appeared. A level can instead define it once and place
+instances of it:
+
+    "prefabs": {
+        "stairs": {"platforms": [[x, y, z, w, h, d], ...],
+                   "platform_colors": [[r, g, b], ...],   # optional
+                   "coins": [[x, y, z], ...]}             # optional
+    },
+    "instances": [
+        {"prefab": "stairs", "position": [x, y, z], "rotation": 1, "color": [r, g, b]}
+    ]
+
+Prefab rows are relative to the instance's position. rotation is in quarter
+turns about the y axis, counter-clockwise seen from above (the direction of
+glRotatef), so boxes stay axis aligned and only swap width and depth. color
+is optional and replaces the prefab's colors for that instance. Plain
+"platforms" and "coins" can sit next to instances as before.
+
+expand_level() turns such a level into the flat layout the rest of the game
+uses. It runs at load time, in numpy, one prefab at a time. Instanced
+platforms go after the level's own platforms, and each instance's platforms
+are contiguous. It also returns an InstanceTable. Renderers use it to draw
+each instance from geometry compiled once per prefab, and the LOD uses it to
+pick a tier per instance.
+"""
+
+import itertools
+
+import numpy as np
+
+DEFAULT_COLOR = (0.2, 0.7, 0.2)
+
+# (x, z) -> (x', z') for 0-3 quarter turns: rows of x' and z' coefficients
+QUARTER_TURNS = np.array([
+    [[1, 0], [0, 1]],
+    [[0, 1], [-1, 0]],
+    [[-1, 0], [0, -1]],
+    [[0, -1], [1, 0]],
+], dtype=np.float64)
+
+_libraries = itertools.count(1)
+
+
+def rotate_points(points, rotation):
+    """[n, 3] points turned `rotation` quarter turns about the y axis through the origin"""
+    turn = QUARTER_TURNS[rotation % 4]
+    out = np.array(points, dtype=np.float64).reshape(-1, 3)
+    out[:, [0, 2]] = out[:, [0, 2]] @ turn.T
+    return out
+
+
+def rotate_boxes(boxes, rotation):
+    """[n, 6] boxes turned about the y axis; odd turns swap width and depth"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 6)
+    out = np.hstack([rotate_points(boxes[:, :3], rotation), boxes[:, 3:6]])
+    if rotation % 2:
+        out[:, [3, 5]] = out[:, [5, 3]]
+    return out
+
+
+class Prefab:
+    def __init__(self, name, spec, library=0):
+        self.name = name
+        self.library = library  # Same for every prefab expanded from one level
+        self.platforms = np.array([p[:6] for p in spec.get("platforms", [])], dtype=np.float64).reshape(-1, 6)
+        colors = [c[:3] for c in spec.get("platform_colors", [])][:len(self.platforms)]
+        colors += [DEFAULT_COLOR] * (len(self.platforms) - len(colors))
+        self.colors = np.array(colors, dtype=np.float64).reshape(-1, 3)
+        self.coins = np.array([c[:3] for c in spec.get("coins", [])], dtype=np.float64).reshape(-1, 3)
+        # All four turns, so instances of any rotation expand with one fancy index
+        self.turned_platforms = np.stack([rotate_boxes(self.platforms, k) for k in range(4)])
+        self.turned_coins = np.stack([rotate_points(self.coins, k) for k in range(4)])
+
+    def __len__(self):
+        return len(self.platforms)
+
+    def __repr__(self):
+        return f"Prefab({self.name!r}, {len(self.platforms)} platforms, {len(self.coins)} coins)"
+
+
+class InstanceTable:
+    """Placed instances and the range of flat platform indices each one expanded to"""
+
+    def __init__(self, prefabs, prefab, position, rotation, color, first):
+        self.prefabs = prefabs      # name -> Prefab
+        self.prefab = prefab        # Prefab per instance
+        self.position = position    # [k, 3]
+        self.rotation = rotation    # [k] quarter turns
+        self.color = color          # Override color tuple or None, per instance
+        self.first = first          # [k] flat index of the instance's first platform
+        self.count = np.array([len(p) for p in prefab], dtype=np.int64)
+        self.lo = np.zeros((len(prefab), 3))
+        self.hi = np.zeros((len(prefab), 3))
+
+    def __len__(self):
+        return len(self.prefab)
+
+    def _slots(self):
+        """(instance, flat platform index) for every instanced platform"""
+        instance = np.repeat(np.arange(len(self)), self.count)
+        offset = np.arange(len(instance)) - np.repeat(np.cumsum(self.count) - self.count, self.count)
+        return instance, self.first[instance] + offset
+
+    def bound(self, platforms):
+        """World bounds of each instance, from the flat [n, 6] platform array"""
+        instance, slots = self._slots()
+        rows = platforms[slots]
+        starts = np.cumsum(self.count) - self.count
+        placed = self.count > 0
+        if len(rows):
+            self.lo[placed] = np.minimum.reduceat(rows[:, :3] - rows[:, 3:6] / 2, starts[placed])
+            self.hi[placed] = np.maximum.reduceat(rows[:, :3] + rows[:, 3:6] / 2, starts[placed])
+
+    def members(self, total):
+        """Instance per flat platform index, -1 for platforms outside any instance"""
+        owner = np.full(total, -1, dtype=np.int64)
+        instance, slots = self._slots()
+        owner[slots] = instance
+        return owner
+
+    def without(self, indices, total):
+        """The table minus instances containing any of `indices` (moving platforms draw on their own)"""
+        if not len(indices):
+            return self
+        owner = self.members(total)[np.asarray(indices, dtype=np.int64)]
+        keep = np.setdiff1d(np.arange(len(self)), owner[owner >= 0])
+        if len(keep) == len(self):
+            return self
+        table = InstanceTable(self.prefabs, [self.prefab[i] for i in keep], self.position[keep],
+                              self.rotation[keep], [self.color[i] for i in keep], self.first[keep])
+        table.lo, table.hi = self.lo[keep], self.hi[keep]
+        return table
+
+
+def expand_level(level_data):
+    """(flat level dict, InstanceTable or None). Levels without instances come back unchanged."""
+    specs = level_data.get("instances")
+    if not specs:
+        return level_data, None
+
+    library = next(_libraries)
+    prefabs = {name: Prefab(name, spec, library) for name, spec in level_data.get("prefabs", {}).items()}
+    for i, spec in enumerate(specs):
+        if spec.get("prefab") not in prefabs:
+            raise ValueError(f"instance {i} uses unknown prefab '{spec.get('prefab')}'")
+
+    base = np.array([p[:6] for p in level_data.get("platforms", [])], dtype=np.float64).reshape(-1, 6)
+    base_colors = [c[:3] for c in level_data.get("platform_colors", [])][:len(base)]
+    base_colors += [DEFAULT_COLOR] * (len(base) - len(base_colors))
+    base_coins = np.array([c[:3] for c in level_data.get("coins", [])], dtype=np.float64).reshape(-1, 3)
+
+    prefab = [prefabs[spec["prefab"]] for spec in specs]
+    position = np.array([spec.get("position", (0, 0, 0))[:3] for spec in specs], dtype=np.float64).reshape(-1, 3)
+    rotation = np.array([int(spec.get("rotation", 0)) % 4 for spec in specs], dtype=np.int64)
+    color = [tuple(spec["color"][:3]) if spec.get("color") else None for spec in specs]
+    counts = np.array([len(p) for p in prefab], dtype=np.int64)
+    first = len(base) + np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+
+    # One vectorized expansion per prefab, written into each instance's slot
+    platforms = np.empty((len(base) + int(counts.sum()), 6))
+    platforms[:len(base)] = base
+    colors = np.empty((len(platforms), 3))
+    colors[:len(base)] = base_colors
+    coins = [base_coins]
+    names = np.array([p.name for p in prefab])
+    for name, definition in prefabs.items():
+        ids = np.flatnonzero(names == name)
+        if not len(ids):
+            continue
+        n = len(definition)
+        rows = definition.turned_platforms[rotation[ids]]            # [k, n, 6]
+        rows[:, :, :3] += position[ids, None, :]
+        slots = (first[ids, None] + np.arange(n)).reshape(-1)
+        platforms[slots] = rows.reshape(-1, 6)
+        instance_colors = np.broadcast_to(definition.colors, (len(ids), n, 3)).copy()
+        for k, i in enumerate(ids.tolist()):
+            if color[i] is not None:
+                instance_colors[k] = color[i]
+        colors[slots] = instance_colors.reshape(-1, 3)
+        if len(definition.coins):
+            placed = definition.turned_coins[rotation[ids]] + position[ids, None, :]
+            coins.append(placed.reshape(-1, 3))
+
+    table = InstanceTable(prefabs, prefab, position, rotation, color, first)
+    table.bound(platforms)
+    flat = {key: value for key, value in level_data.items() if key not in ("prefabs", "instances")}
+    flat["platforms"] = platforms.tolist()
+    flat["platform_colors"] = colors.tolist()
+    flat["coins"] = np.concatenate(coins).tolist()
+    return flat, table
+
+
+def instance_spec(prefab, position, rotation=0, color=None):
+    """One entry of a level's "instances" list"""
+    spec = {"prefab": prefab, "position": [float(v) for v in position[:3]]}
+    if rotation % 4:
+        spec["rotation"] = int(rotation % 4)
+    if color is not None:
+        spec["color"] = [float(v) for v in color[:3]]
+    return spec
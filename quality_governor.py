@@ -0,0 +1,127 @@
+"""
+Adaptive quality for the 3D Platformer.
+
+QualityGovernor watches how long each frame's work took (frame time minus
+the pacer's wait) over a rolling window. It steps through a few quality tiers
+to keep that work inside the frame budget:
+
+    high      everything on
+    medium    half the particles, coarser shadow, shorter draw distance
+    low       quarter particles, no outlines, simple HUD, 70% resolution
+    minimal   no particles or shadow, half draw distance and resolution
+
+Hysteresis keeps the tier from flapping. The governor steps down after one
+window that runs over budget, but steps back up only after several seconds
+with plenty of headroom. If a tier it restored soon has to be dropped again,
+the wait before the next attempt to restore it doubles.
+
+    python 3d-platform-clauder4.py --quality auto      # governed (default)
+    python 3d-platform-clauder4.py --quality low       # fixed tier
+"""
+
+import copy
+from collections import deque, namedtuple
+
+QualityTier = namedtuple("QualityTier", [
+    "name",
+    "particle_scale",       # Multiplier on every emit() count
+    "particle_cap",         # Most live particles; the oldest go first
+    "shadow_segments",      # Triangles in the blob shadow, 0 for none
+    "outlines",             # Black edges on platforms, coins and the player
+    "draw_distance_scale",  # Multiplier on the LOD draw distance and fog
+    "hud_detail",           # Coin icons in the HUD, or a single bar
+    "render_scale",         # 3D resolution with --render-scale auto
+])
+
+TIERS = (
+    QualityTier("high", 1.0, 400, 12, True, 1.0, True, 1.0),
+    QualityTier("medium", 0.5, 200, 8, True, 0.8, True, 0.85),
+    QualityTier("low", 0.25, 80, 6, False, 0.65, False, 0.7),
+    QualityTier("minimal", 0.0, 0, 0, False, 0.5, False, 0.5),
+)
+TIER_NAMES = tuple(tier.name for tier in TIERS)
+QUALITY_MODES = ("auto",) + TIER_NAMES
+
+
+def scaled_lod_settings(settings, scale):
+    """A copy of LODSettings with the draw distance (and everything beyond it) scaled"""
+    scaled = copy.copy(settings)
+    scaled.draw_distance = settings.draw_distance * scale
+    scaled.fog_start = settings.fog_start * scale
+    scaled.impostor_distance = min(settings.impostor_distance, scaled.draw_distance)
+    scaled.outline_distance = min(settings.outline_distance, scaled.draw_distance)
+    return scaled
+
+
+class QualityGovernor:
+    def __init__(self, mode="auto", target_fps=60, window=60, stats=None,
+                 degrade_at=0.9, restore_at=0.6, restore_after=180, relapse_frames=600):
+        if mode not in QUALITY_MODES:
+            raise ValueError(f"Unknown quality '{mode}', expected one of {QUALITY_MODES}")
+        self.adaptive = mode == "auto"
+        self.tier = 0 if self.adaptive else TIER_NAMES.index(mode)
+        self.budget_ms = 1000.0 / target_fps
+        self.degrade_ms = self.budget_ms * degrade_at
+        self.restore_ms = self.budget_ms * restore_at
+        self.relapse_frames = relapse_frames
+        self.stats = stats
+
+        self.samples = deque(maxlen=window)
+        self.restore_after = [restore_after] * len(TIERS)  # Frames of headroom before trying tier k
+        self.comfortable = 0   # Consecutive frames with room to spare
+        self.ignore = 0        # Frames left to skip (level loads)
+        self.frames = 0
+        self.restored_at = None  # (tier, frame) of the last step up
+
+    @property
+    def current(self):
+        return TIERS[self.tier]
+
+    def describe(self):
+        return f"{self.current.name} ({'auto' if self.adaptive else 'fixed'})"
+
+    def settle(self, frames=30):
+        """Skip the next few frames, e.g. after a level load, so a one-off hitch isn't a trend"""
+        self.ignore = frames
+        self.samples.clear()
+        self.comfortable = 0
+
+    def observe(self, work_ms):
+        """Feed one frame's work time. Returns True when the tier changed."""
+        self.frames += 1
+        if self.stats:
+            self.stats.record("quality_tier", self.tier)
+        if not self.adaptive:
+            return False
+        if self.ignore:
+            self.ignore -= 1
+            return False
+
+        samples = self.samples
+        samples.append(work_ms)
+        self.comfortable = self.comfortable + 1 if work_ms < self.restore_ms else 0
+
+        if len(samples) == samples.maxlen and self.tier < len(TIERS) - 1:
+            # A tenth of the window over the line is enough; isolated spikes aren't
+            slow = sorted(samples)[int(len(samples) * 0.9)]
+            if slow > self.degrade_ms:
+                if self.restored_at and self.restored_at[0] == self.tier \
+                        and self.frames - self.restored_at[1] < self.relapse_frames:
+                    # Restored too early last time; be more patient before the next try
+                    self.restore_after[self.tier] = min(self.restore_after[self.tier] * 2, 3600)
+                self.restored_at = None
+                return self._change(self.tier + 1, slow)
+
+        if self.tier > 0 and self.comfortable >= self.restore_after[self.tier - 1]:
+            self.restored_at = (self.tier - 1, self.frames)
+            return self._change(self.tier - 1, max(samples))
+        return False
+
+    def _change(self, tier, measured_ms):
+        direction = "down" if tier > self.tier else "up"
+        self.tier = tier
+        self.samples.clear()
+        self.comfortable = 0
+        print(f"Quality {direction} to {self.current.name} "
+              f"({measured_ms:.1f} ms of work, budget {self.budget_ms:.1f} ms)")
+        return True
@@ -0,0 +1,169 @@
+"""
+Render queue for the 3D Platformer.
+
+Instead of every draw function switching GL state on and off around itself,
+a frame submits draw items to a RenderQueue, each tagged with the
+RenderState it needs. flush() sorts the items so that
+
+    3D before the 2D overlay (HUD, pause screen)
+    opaque before blended
+    items sharing a state are drawn together, and opaque ones by color
+
+and then walks them, applying only the differences between consecutive
+states through GLStateCache. Redundant glEnable/glDisable/glColor calls are
+skipped. The changes issued and skipped each frame go to Instrumentation as
+gl_state_changes and gl_calls_elided.
+
+Blended and overlay items keep their submission order within a state, since
+for them order is part of what gets drawn.
+"""
+
+from collections import namedtuple
+
+from OpenGL.GL import *
+
+RenderState = namedtuple("RenderState", "overlay blend lighting depth_test depth_write primitive")
+
+OPAQUE = RenderState(False, False, True, True, True, "faces")
+OUTLINE = RenderState(False, False, True, True, True, "lines")
+TRANSLUCENT = RenderState(False, True, False, True, True, "faces")    # Shadow, particles
+GHOST = RenderState(False, True, False, True, False, "faces")         # Don't hide each other
+OVERLAY = RenderState(True, False, False, False, True, "faces")       # HUD
+OVERLAY_BLEND = RenderState(True, True, False, False, True, "faces")  # Pause screen
+
+OUTLINE_WIDTH = 1.5
+
+_CAPS = (("blend", GL_BLEND), ("lighting", GL_LIGHTING), ("depth_test", GL_DEPTH_TEST))
+
+
+class GLStateCache:
+    """Remembers the GL state it set so repeated requests cost nothing"""
+
+    def __init__(self):
+        self.changes = 0
+        self.elided = 0
+        self.invalidate()
+
+    def invalidate(self):
+        """Forget everything, e.g. at frame start in case other code touched GL state"""
+        self.caps = {}
+        self.rgba = None
+        self.depth_mask = None
+        self.width = None
+        self.overlay = False
+
+    def set_cap(self, name, cap, enabled):
+        if self.caps.get(name) == enabled:
+            self.elided += 1
+            return
+        if enabled:
+            glEnable(cap)
+        else:
+            glDisable(cap)
+        self.caps[name] = enabled
+        self.changes += 1
+
+    def color(self, rgba):
+        if len(rgba) == 3:
+            rgba = (rgba[0], rgba[1], rgba[2], 1.0)
+        if rgba == self.rgba:
+            self.elided += 1
+            return
+        glColor4f(*rgba)
+        self.rgba = rgba
+        self.changes += 1
+
+    def forget_color(self):
+        """A draw call set its own colors"""
+        self.rgba = None
+
+    def set_depth_write(self, enabled):
+        if enabled == self.depth_mask:
+            self.elided += 1
+            return
+        glDepthMask(enabled)
+        self.depth_mask = enabled
+        self.changes += 1
+
+    def line_width(self, width):
+        if width == self.width:
+            self.elided += 1
+            return
+        glLineWidth(width)
+        self.width = width
+        self.changes += 1
+
+    def set_overlay(self, enabled, width, height):
+        """Switch between the 3D camera and a pixel-space orthographic projection"""
+        if enabled == self.overlay:
+            return
+        if enabled:
+            glMatrixMode(GL_PROJECTION)
+            glPushMatrix()
+            glLoadIdentity()
+            glOrtho(0, width, 0, height, -1, 1)
+            glMatrixMode(GL_MODELVIEW)
+            glPushMatrix()
+            glLoadIdentity()
+        else:
+            glPopMatrix()
+            glMatrixMode(GL_PROJECTION)
+            glPopMatrix()
+            glMatrixMode(GL_MODELVIEW)
+        self.overlay = enabled
+        self.changes += 1
+
+    def apply(self, state, width, height):
+        self.set_overlay(state.overlay, width, height)
+        for name, cap in _CAPS:
+            self.set_cap(name, cap, getattr(state, name))
+        self.set_depth_write(state.depth_write)
+        if state.blend:
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)  # Only blend func the game uses
+        if state.primitive == "lines":
+            self.line_width(OUTLINE_WIDTH)
+
+
+class RenderQueue:
+    def __init__(self, width, height, stats=None):
+        self.width = width
+        self.height = height
+        self.stats = stats
+        self.cache = GLStateCache()
+        self.items = []
+
+    def submit(self, state, draw, *args, color=None):
+        """Queue draw(*args) to run under `state`. With `color` None, draw sets its own colors."""
+        if color is not None:
+            color = tuple(color)
+        self.items.append((state, color, len(self.items), draw, args))
+
+    def _sort_key(self, item):
+        state, color, seq = item[0], item[1], item[2]
+        if color is not None and not state.blend and not state.overlay:
+            return state, color, seq
+        return state, (), seq
+
+    def flush(self):
+        """Draw everything submitted this frame and leave GL in the default opaque state"""
+        cache = self.cache
+        cache.invalidate()
+        cache.changes = cache.elided = 0
+
+        state = None
+        for item_state, color, _, draw, args in sorted(self.items, key=self._sort_key):
+            if item_state != state:
+                cache.apply(item_state, self.width, self.height)
+                state = item_state
+            if color is not None:
+                cache.color(color)
+            draw(*args)
+            if color is None:
+                cache.forget_color()
+        cache.apply(OPAQUE, self.width, self.height)
+
+        if self.stats:
+            self.stats.count("draw_items", len(self.items))
+            self.stats.count("gl_state_changes", cache.changes)
+            self.stats.count("gl_calls_elided", cache.elided)
+        self.items = []
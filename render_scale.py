@@ -0,0 +1,159 @@
+"""
+Render-resolution scaling for the 3D Platformer.
+
+At a render scale below 1 the 3D scene is drawn into a smaller offscreen
+framebuffer (FBO) with a texture as its color buffer. That texture is then
+stretched over the window as one linear-filtered quad. A scaling
+glBlitFramebuffer would be simpler, but Mesa's software rasterizers do it far
+slower than a textured quad. The HUD and pause screen are drawn afterwards at
+the window's own resolution, so they stay sharp.
+
+The 3D pass gets cheaper with the pixel count, but the upscale costs one
+full-window quad. Scaling therefore pays off when the scene fills more than
+that: big windows on integrated GPUs, or dense levels. On single-core llvmpipe
+it does not. There the upscale of a 1080p window takes about as long as a
+mostly-sky level at full size, so measure before turning it on.
+
+    python 3d-platform-clauder4.py --render-scale 0.75   # fixed
+    python 3d-platform-clauder4.py --render-scale auto   # follows the quality tier
+
+At scale 1 (the default) no FBO is used and drawing goes straight to the
+window as before.
+"""
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+
+MIN_SCALE = 0.25
+FIELD_OF_VIEW = 45
+NEAR_PLANE, FAR_PLANE = 0.1, 50.0
+
+
+def parse_render_scale(text):
+    """'auto' or a fraction; the argparse type for --render-scale"""
+    if text == "auto":
+        return text
+    value = float(text)
+    if not MIN_SCALE <= value <= 1.0:
+        raise ValueError(f"render scale must be between {MIN_SCALE} and 1.0")
+    return value
+
+
+def set_perspective(width, height):
+    """Viewport and projection for a `width` x `height` target"""
+    glViewport(0, 0, width, height)
+    glMatrixMode(GL_PROJECTION)
+    glLoadIdentity()
+    gluPerspective(FIELD_OF_VIEW, width / max(height, 1), NEAR_PLANE, FAR_PLANE)
+    glMatrixMode(GL_MODELVIEW)
+
+
+class ScaledTarget:
+    """Where the 3D pass is drawn: the window, or a scaled FBO stretched onto it"""
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.fbo = None
+        self.texture = None
+        self.buffers = ()
+        self.size = (0, 0)
+        self.supported = True
+
+    def scaled_size(self, width, height):
+        return max(1, int(width * self.scale + 0.5)), max(1, int(height * self.scale + 0.5))
+
+    @property
+    def active(self):
+        return self.scale < 1.0 and self.supported
+
+    def set_scale(self, scale):
+        self.scale = max(MIN_SCALE, min(1.0, scale))
+
+    def _create(self, width, height):
+        self.release()
+        try:
+            self.fbo = glGenFramebuffers(1)
+            glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+            self.texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, self.texture)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+            glBindTexture(GL_TEXTURE_2D, 0)
+            glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+            depth = glGenRenderbuffers(1)
+            glBindRenderbuffer(GL_RENDERBUFFER, depth)
+            glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+            glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, depth)
+            glBindRenderbuffer(GL_RENDERBUFFER, 0)
+            self.buffers = (depth,)
+            status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            if status != GL_FRAMEBUFFER_COMPLETE:
+                raise RuntimeError(f"framebuffer incomplete (0x{status:x})")
+        except Exception as e:
+            print(f"Render scaling not available ({e}), drawing at full resolution")
+            glBindFramebuffer(GL_FRAMEBUFFER, 0)
+            self.release()
+            self.supported = False
+            return
+        self.size = (width, height)
+
+    def begin(self, width, height):
+        """Bind the target for the 3D pass of a `width` x `height` window"""
+        if not self.active:
+            return
+        size = self.scaled_size(width, height)
+        if self.fbo is None or size != self.size:
+            self._create(*size)
+            if not self.supported:
+                return
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, *size)
+
+    def end(self, width, height):
+        """Upscale the 3D pass into the window; overlays are drawn after this"""
+        if not self.active or self.fbo is None:
+            return
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glViewport(0, 0, width, height)
+
+        # Every window pixel is overwritten, so neither a clear nor depth is needed
+        glPushAttrib(GL_ENABLE_BIT | GL_DEPTH_BUFFER_BIT)
+        for cap in (GL_DEPTH_TEST, GL_LIGHTING, GL_FOG, GL_BLEND):
+            glDisable(cap)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_REPLACE)
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glBegin(GL_QUADS)
+        for u, v in ((0, 0), (1, 0), (1, 1), (0, 1)):
+            glTexCoord2f(u, v)
+            glVertex2f(u * 2 - 1, v * 2 - 1)
+        glEnd()
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_MODULATE)
+        glPopAttrib()
+
+    def release(self):
+        if self.buffers:
+            glDeleteRenderbuffers(len(self.buffers), self.buffers)
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+        if self.fbo is not None:
+            glDeleteFramebuffers(1, [self.fbo])
+        self.fbo = None
+        self.texture = None
+        self.buffers = ()
+        self.size = (0, 0)
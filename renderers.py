@@ -0,0 +1,514 @@
+"""
+Renderers for the 3D Platformer.
+
+Game logic no longer calls GL. Each frame it describes what should be on
+screen as a Scene (camera, platforms picked by LOD, prefab instances, coins,
+player, other network players, hazards, ghosts, shadow, particles, HUD) and hands it to a Renderer:
+
+    immediate   one draw at a time, each switching its own GL state (the
+                original drawing code)
+    batched     draw items go through the RenderQueue, sorted by GL state
+    null        no GL at all; only counts what was submitted, so with
+                --renderer null --pacing uncapped the frame rate is pure
+                game-logic throughput
+
+Pick one with --renderer on the game's command line. GL renderers draw the
+3D pass through a ScaledTarget (see render_scale.py) and the HUD after it at
+window resolution.
+
+Prefab instances (see prefabs.py) are drawn from display lists compiled once
+per prefab, so a repeated structure costs one call per instance instead of
+one draw per platform. Lists are freed when a level with other prefabs
+comes in.
+
+Static platforms arrive as a BatchSelection (see platform_batches.py). The
+batched renderer draws them with one glDrawArrays per material and one for
+all their outlines; the immediate renderer still draws them one by one.
+"""
+
+import math
+from collections import namedtuple
+
+from OpenGL.GL import *
+from OpenGL.GLU import *
+
+from ghosts import GHOST_COLOR, quad_array_geometry, submit_ghosts
+from hazards import hazard_batches, hazard_geometry, submit_hazards
+from platform_batches import submit_batches
+from render_queue import RenderQueue, OPAQUE, OUTLINE, TRANSLUCENT, OVERLAY, OVERLAY_BLEND
+from render_scale import ScaledTarget, set_perspective
+
+Scene = namedtuple("Scene", [
+    "camera",          # Eye position (x, y, z)
+    "target",          # Look-at point (x, y, z)
+    "platforms",       # List of (box, color, outline); box is (x, y, z, w, h, d). Moving ones and impostors
+    "static",          # BatchSelection of the static platforms in view, or None
+    "instances",       # List of (prefab, position, rotation, color or None, outline)
+    "coins",           # Sequence of (x, y, z)
+    "coin_rotation",
+    "player",          # PlayerPose
+    "peers",           # Other players' PlayerPoses in a network game
+    "hazards",         # HazardFrame of the visible hazards, or None
+    "ghosts",          # GhostSet or None
+    "ghost_tick",
+    "shadow",          # (x, y, z, size, opacity) or None
+    "particles",       # Sequence of (x, y, z, r, g, b, alpha)
+    "hud",             # (score, lives, coins_remaining, level) or None
+    "paused",
+    "quality",         # QualityTier: shadow segments, outlines, HUD detail
+])
+
+PLAYER_COLOR = (0.8, 0.2, 0.2)
+PEER_COLOR = (0.2, 0.4, 0.9)
+COIN_COLOR = (0.9, 0.8, 0.1)
+OUTLINE_COLOR = (0.0, 0.0, 0.0)
+SHADOW_COLOR = (0.1, 0.1, 0.1)
+SKY_COLOR = [0.5, 0.8, 1.0, 1.0]
+
+CUBE_FACES = [
+    ([0, 1, 2, 3], [0, 0, -1]), ([4, 7, 6, 5], [0, 0, 1]),
+    ([7, 3, 2, 6], [-1, 0, 0]), ([1, 0, 4, 5], [1, 0, 0]),
+    ([0, 3, 7, 4], [0, 1, 0]), ([1, 5, 6, 2], [0, -1, 0])
+]
+
+CUBE_EDGES = [
+    (0, 1), (1, 2), (2, 3), (3, 0),
+    (4, 5), (5, 6), (6, 7), (7, 4),
+    (0, 4), (1, 5), (2, 6), (3, 7)
+]
+
+
+# Geometry. These only emit vertices and transforms; color and GL state are
+# left to the caller.
+
+def cube_vertices(size):
+    return [
+        [size, size, -size], [size, -size, -size], [-size, -size, -size], [-size, size, -size],
+        [size, size, size], [size, -size, size], [-size, -size, size], [-size, size, size]
+    ]
+
+def cube_faces(size):
+    vertices = cube_vertices(size)
+    glBegin(GL_QUADS)
+    for face_vertices, normal in CUBE_FACES:
+        glNormal3f(*normal)
+        for vertex_index in face_vertices:
+            glVertex3f(*vertices[vertex_index])
+    glEnd()
+
+def cube_edges(size):
+    vertices = cube_vertices(size)
+    glBegin(GL_LINES)
+    for edge in CUBE_EDGES:
+        for vertex_index in edge:
+            glVertex3f(*vertices[vertex_index])
+    glEnd()
+
+def platform_geometry(x, y, z, width, height, depth, edges=False):
+    glPushMatrix()
+    glTranslatef(x, y, z)
+    glScalef(width, height, depth)
+    if edges:
+        cube_edges(0.5)
+    else:
+        cube_faces(0.5)
+    glPopMatrix()
+
+def instance_geometry(lists, x, y, z, rotation, plain=False, edges=False):
+    """A prefab's compiled lists, placed and turned: its own colors, no colors (plain), or edges"""
+    glPushMatrix()
+    glTranslatef(x, y, z)
+    glRotatef(90 * rotation, 0, 1, 0)
+    glCallList(lists + (2 if edges else 1 if plain else 0))
+    glPopMatrix()
+
+def compile_prefab(prefab):
+    """Three display lists for a prefab's platforms; returns the first"""
+    lists = glGenLists(3)
+    boxes = prefab.platforms.tolist()
+    glNewList(lists, GL_COMPILE)
+    for box, color in zip(boxes, prefab.colors.tolist()):
+        glColor3f(*color)
+        platform_geometry(*box)
+    glEndList()
+    glNewList(lists + 1, GL_COMPILE)
+    for box in boxes:
+        platform_geometry(*box)
+    glEndList()
+    glNewList(lists + 2, GL_COMPILE)
+    for box in boxes:
+        platform_geometry(*box, True)
+    glEndList()
+    return lists
+
+def coin_geometry(x, y, z, rotation, edges=False):
+    glPushMatrix()
+    glTranslatef(x, y + math.sin(rotation * 0.1) * 0.1, z)
+    glRotatef(rotation, 0, 1, 0)
+    if edges:
+        cube_edges(0.15)
+    else:
+        cube_faces(0.15)
+    glPopMatrix()
+
+def player_geometry(pose, edges=False):
+    glPushMatrix()
+    glTranslatef(pose.x, pose.y, pose.z)
+    # Squash effect
+    glScalef(pose.squash, 1.0 / pose.squash, pose.squash)
+    if edges:
+        cube_edges(pose.size)
+    else:
+        cube_faces(pose.size)
+    glPopMatrix()
+
+def particle_geometry(particles):
+    """All particles as one batch of quads, each with its own color and fade"""
+    size = 0.03
+    glBegin(GL_QUADS)
+    for x, y, z, r, g, b, alpha in particles:
+        glColor4f(r, g, b, alpha)
+        glVertex3f(x - size, y - size, z)
+        glVertex3f(x + size, y - size, z)
+        glVertex3f(x + size, y + size, z)
+        glVertex3f(x - size, y + size, z)
+    glEnd()
+
+def shadow_geometry(x, y, z, size, segments=12):
+    glPushMatrix()
+    glTranslatef(x, y, z)
+
+    # Draw shadow as a simple circle made of triangles
+    glBegin(GL_TRIANGLE_FAN)
+    glVertex3f(0, 0, 0)  # Center
+    for i in range(segments + 1):
+        angle = (i / segments) * 2 * math.pi
+        glVertex3f(size * math.cos(angle), 0, size * math.sin(angle))
+    glEnd()
+    glPopMatrix()
+
+def draw_hud(width, height, score, lives, coins_remaining, level, detail=True):
+    """HUD bars in pixel coordinates; the caller sets up the 2D projection"""
+    # Score bar (white)
+    glColor3f(1, 1, 1)
+    score_width = min(200, score // 10)
+    glBegin(GL_QUADS)
+    glVertex2f(10, height - 40)
+    glVertex2f(10 + score_width, height - 40)
+    glVertex2f(10 + score_width, height - 30)
+    glVertex2f(10, height - 30)
+    glEnd()
+
+    # Lives (red squares)
+    glColor3f(1, 0, 0)
+    for i in range(lives):
+        x = 230 + i * 25
+        glBegin(GL_QUADS)
+        glVertex2f(x, height - 40)
+        glVertex2f(x + 20, height - 40)
+        glVertex2f(x + 20, height - 20)
+        glVertex2f(x, height - 20)
+        glEnd()
+
+    # Coins remaining (yellow circles, or one bar at low detail)
+    glColor3f(1, 1, 0)
+    if detail:
+        for i in range(min(coins_remaining, 10)):
+            x = 350 + i * 15
+            glBegin(GL_POLYGON)
+            for angle in range(0, 360, 30):
+                rad = math.radians(angle)
+                glVertex2f(x + 6 + 5 * math.cos(rad), height - 30 + 5 * math.sin(rad))
+            glEnd()
+    else:
+        bar = min(coins_remaining, 10) * 15
+        glBegin(GL_QUADS)
+        glVertex2f(351, height - 35)
+        glVertex2f(351 + bar, height - 35)
+        glVertex2f(351 + bar, height - 25)
+        glVertex2f(351, height - 25)
+        glEnd()
+
+    # Level indicator (blue bar)
+    glColor3f(0, 0, 1)
+    glBegin(GL_QUADS)
+    glVertex2f(width - 80, height - 40)
+    glVertex2f(width - 80 + level * 30, height - 40)
+    glVertex2f(width - 80 + level * 30, height - 30)
+    glVertex2f(width - 80, height - 30)
+    glEnd()
+
+def draw_pause_screen(width, height):
+    """Pause overlay in pixel coordinates, drawn with blending on"""
+    # Semi-transparent overlay
+    glColor4f(0, 0, 0, 0.5)
+    glBegin(GL_QUADS)
+    glVertex2f(0, 0)
+    glVertex2f(width, 0)
+    glVertex2f(width, height)
+    glVertex2f(0, height)
+    glEnd()
+
+    # Pause text
+    glColor4f(1, 1, 1, 1)
+    for i in range(6):
+        x = width//2 - 60 + i * 20
+        glBegin(GL_QUADS)
+        glVertex2f(x, height//2)
+        glVertex2f(x + 15, height//2)
+        glVertex2f(x + 15, height//2 + 30)
+        glVertex2f(x, height//2 + 30)
+        glEnd()
+
+
+class Renderer:
+    name = "base"
+    presents = True  # Whether the game should flip the display after render()
+
+    def __init__(self, width, height, stats=None):
+        self.width = width
+        self.height = height
+        self.stats = stats
+
+    def set_fog(self, settings, enabled=True):
+        pass
+
+    def set_render_scale(self, scale):
+        pass
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+    def render(self, scene):
+        raise NotImplementedError
+
+
+class GLRenderer(Renderer):
+    def __init__(self, width, height, stats=None):
+        super().__init__(width, height, stats)
+        self.target = ScaledTarget()
+        self.prefab_library = None
+        self.compiled = {}  # Prefab name -> first of its display lists
+
+    def prefab_lists(self, prefab):
+        if prefab.library != self.prefab_library:
+            # Another level's prefabs; names may repeat with different contents
+            for lists in self.compiled.values():
+                glDeleteLists(lists, 3)
+            self.compiled.clear()
+            self.prefab_library = prefab.library
+        lists = self.compiled.get(prefab.name)
+        if lists is None:
+            lists = self.compiled[prefab.name] = compile_prefab(prefab)
+        return lists
+
+    def set_render_scale(self, scale):
+        self.target.set_scale(scale)
+
+    def resize(self, width, height):
+        super().resize(width, height)
+        set_perspective(width, height)
+
+    def set_fog(self, settings, enabled=True):
+        # Fog in the sky color hides where LOD tiers switch and the draw distance
+        if not enabled:
+            glDisable(GL_FOG)
+            return
+        glEnable(GL_FOG)
+        glFogi(GL_FOG_MODE, GL_LINEAR)
+        glFogfv(GL_FOG_COLOR, SKY_COLOR)
+        glFogf(GL_FOG_START, settings.fog_start)
+        glFogf(GL_FOG_END, settings.draw_distance)
+
+    def begin(self, scene):
+        self.target.begin(self.width, self.height)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        glLoadIdentity()
+        if scene is not None:
+            gluLookAt(*scene.camera, *scene.target, 0, 1, 0)
+
+    def end_scene(self):
+        """The 3D pass is done; what follows draws at window resolution"""
+        self.target.end(self.width, self.height)
+        if self.stats:
+            self.stats.record("render_scale", self.target.scale if self.target.active else 1.0)
+
+
+class ImmediateRenderer(GLRenderer):
+    """Draws each object as soon as it is reached, switching GL state around it"""
+    name = "immediate"
+
+    def draw_cube_at(self, geometry, color, *args, outline=True):
+        if color is not None:
+            glColor3f(*color)
+        geometry(*args)
+        if outline:
+            glColor3f(*OUTLINE_COLOR)
+            glLineWidth(1.5)
+            geometry(*args, True)
+
+    def overlay(self, draw, *args, blend=False):
+        # Switch to 2D
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, self.width, 0, self.height, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_LIGHTING)
+        if blend:
+            glEnable(GL_BLEND)
+            glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        draw(self.width, self.height, *args)
+        if blend:
+            glDisable(GL_BLEND)
+        # Restore 3D
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_LIGHTING)
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    def translucent(self, draw, *args, color=None, depth_write=True):
+        glDisable(GL_LIGHTING)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glDepthMask(depth_write)
+        if color is not None:
+            glColor4f(*color)
+        draw(*args)
+        glDepthMask(True)
+        glDisable(GL_BLEND)
+        glEnable(GL_LIGHTING)
+
+    def render(self, scene):
+        self.begin(scene)
+        if scene is None:
+            self.end_scene()
+            return
+        static = scene.static.batches.draws(scene.static) if scene.static else []
+        for box, color, outline in scene.platforms + static:
+            self.draw_cube_at(platform_geometry, color, *box[:6], outline=outline)
+        for prefab, position, rotation, color, outline in scene.instances:
+            self.draw_cube_at(instance_geometry, color, self.prefab_lists(prefab), *position, rotation,
+                              color is not None, outline=outline)
+        outlines = scene.quality.outlines
+        for coin in scene.coins:
+            self.draw_cube_at(coin_geometry, COIN_COLOR, coin[0], coin[1], coin[2], scene.coin_rotation,
+                              outline=outlines)
+        self.draw_cube_at(player_geometry, PLAYER_COLOR, scene.player, outline=outlines)
+        for pose in scene.peers:
+            self.draw_cube_at(player_geometry, PEER_COLOR, pose, outline=outlines)
+        for verts, normals, color in hazard_batches(scene.hazards):
+            self.draw_cube_at(hazard_geometry, color, verts, normals, outline=False)
+        if scene.ghosts is not None and scene.ghosts.count:
+            poses = scene.ghosts.sample(scene.ghost_tick)
+            if len(poses):
+                self.translucent(quad_array_geometry, scene.ghosts.vertices(poses),
+                                 color=GHOST_COLOR, depth_write=False)
+        if scene.shadow:
+            x, y, z, size, opacity = scene.shadow
+            self.translucent(shadow_geometry, x, y, z, size, scene.quality.shadow_segments,
+                             color=SHADOW_COLOR + (opacity,))
+        if scene.particles:
+            self.translucent(particle_geometry, scene.particles)
+        self.end_scene()
+        if scene.hud:
+            self.overlay(draw_hud, *scene.hud, scene.quality.hud_detail)
+        if scene.paused:
+            self.overlay(draw_pause_screen, blend=True)
+
+
+class BatchedRenderer(GLRenderer):
+    """Queues everything and lets the RenderQueue sort it by GL state"""
+    name = "batched"
+
+    def __init__(self, width, height, stats=None):
+        super().__init__(width, height, stats)
+        self.queue = RenderQueue(width, height, stats)
+
+    def resize(self, width, height):
+        super().resize(width, height)
+        self.queue.width, self.queue.height = width, height
+
+    def submit_cube(self, geometry, color, *args, outline=True):
+        self.queue.submit(OPAQUE, geometry, *args, color=color)
+        if outline:
+            self.queue.submit(OUTLINE, geometry, *args, True, color=OUTLINE_COLOR)
+
+    def render(self, scene):
+        self.begin(scene)
+        if scene is None:
+            self.end_scene()
+            return
+        queue = self.queue
+        submit_batches(queue, scene.static, OUTLINE_COLOR)
+        for box, color, outline in scene.platforms:
+            self.submit_cube(platform_geometry, color, *box[:6], outline=outline)
+        for prefab, position, rotation, color, outline in scene.instances:
+            self.submit_cube(instance_geometry, color, self.prefab_lists(prefab), *position, rotation,
+                             color is not None, outline=outline)
+        outlines = scene.quality.outlines
+        for coin in scene.coins:
+            self.submit_cube(coin_geometry, COIN_COLOR, coin[0], coin[1], coin[2], scene.coin_rotation,
+                             outline=outlines)
+        self.submit_cube(player_geometry, PLAYER_COLOR, scene.player, outline=outlines)
+        for pose in scene.peers:
+            self.submit_cube(player_geometry, PEER_COLOR, pose, outline=outlines)
+        submit_hazards(queue, scene.hazards)
+        submit_ghosts(queue, scene.ghosts, scene.ghost_tick)
+        if scene.shadow:
+            x, y, z, size, opacity = scene.shadow
+            queue.submit(TRANSLUCENT, shadow_geometry, x, y, z, size, scene.quality.shadow_segments,
+                         color=SHADOW_COLOR + (opacity,))
+        if scene.particles:
+            queue.submit(TRANSLUCENT, particle_geometry, scene.particles)
+        queue.flush()
+        self.end_scene()
+        if scene.hud:
+            queue.submit(OVERLAY, draw_hud, self.width, self.height, *scene.hud, scene.quality.hud_detail)
+        if scene.paused:
+            queue.submit(OVERLAY_BLEND, draw_pause_screen, self.width, self.height)
+        queue.flush()
+
+
+class NullRenderer(Renderer):
+    """Draws nothing; counts what each frame asked for"""
+    name = "null"
+    presents = False
+
+    def __init__(self, width, height, stats=None):
+        super().__init__(width, height, stats)
+        self.frames = 0
+
+    def render(self, scene):
+        self.frames += 1
+        if scene is None or not self.stats:
+            return
+        self.stats.count("submitted_platforms", len(scene.platforms) + (len(scene.static.faces) if scene.static else 0))
+        self.stats.count("submitted_instances", len(scene.instances))
+        self.stats.count("submitted_coins", len(scene.coins))
+        self.stats.count("submitted_particles", len(scene.particles))
+        self.stats.count("submitted_peers", len(scene.peers))
+        if scene.hazards is not None:
+            self.stats.count("submitted_hazards", len(scene.hazards.kind))
+        if scene.ghosts is not None:
+            self.stats.count("submitted_ghosts", scene.ghosts.count)
+
+
+RENDERERS = {
+    "immediate": ImmediateRenderer,
+    "batched": BatchedRenderer,
+    "null": NullRenderer,
+}
+
+
+def create_renderer(name, width, height, stats=None):
+    try:
+        return RENDERERS[name](width, height, stats)
+    except KeyError:
+        raise ValueError(f"Unknown renderer '{name}', expected one of {tuple(RENDERERS)}") from None
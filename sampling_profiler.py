@@ -0,0 +1,182 @@
+"""
+Sampling profiler for live sessions of the 3D Platformer.
+
+cProfile has to be there from the start and slows every Python call, which
+distorts exactly the update and render timings we want to look at. This
+profiler can be switched on in a running game instead:
+
+    F9          start / stop a capture (in the game)
+    SIGUSR1     same, from outside: kill -USR1 <pid>
+
+While it runs, a daemon thread wakes every few milliseconds and reads the
+game threads' stacks with sys._current_frames(). The game threads themselves
+do no extra work. Each sample is tagged with the level and game state at
+that moment. Stopping writes collapsed stacks, one line per distinct stack
+with its sample count:
+
+    level_3;playing;MainThread;run (3d-platform-clauder4.py:1180);render (...) 42
+
+That is the input format of flamegraph.pl, speedscope and inferno. Captures go
+to profiles/profile_<time>_level<N>.folded.
+
+    python sampling_profiler.py top profiles/profile_...folded   # hottest functions
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = "profiles"
+
+
+def _label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, threads, context=None, interval=0.01, output_dir=PROFILE_DIR):
+        """
+        threads: callable returning {thread ident: name} of the threads to sample
+        context: callable returning the tags for a sample, e.g. ("level_3", "playing")
+        """
+        self.threads = threads
+        self.context = context or (lambda: ())
+        self.interval = interval
+        self.output_dir = output_dir
+        self.stacks = Counter()  # (tags, thread name, code objects root first) -> samples
+        self.labels = {}         # code object -> frame label, so each is formatted once
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.started = None
+        self.running = False
+        self.thread = None
+
+    # Control
+
+    def start(self):
+        if self.running:
+            return
+        self.stacks.clear()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.started = time.perf_counter()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+        self.thread.start()
+        print(f"🔬 Profiling started ({self.interval * 1000:.0f} ms interval); press F9 again to stop")
+
+    def stop(self):
+        """Stop sampling and write the capture. Returns the file name, or None."""
+        if not self.running:
+            return None
+        self.running = False
+        self.thread.join(timeout=1.0)
+        return self.save()
+
+    def toggle(self):
+        return self.stop() if self.running else self.start()
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR1", None)):
+        """Toggle on a Unix signal. Only possible from the main thread."""
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *_: self.toggle())
+        return True
+
+    # Sampling
+
+    def _loop(self):
+        own = threading.get_ident()
+        next_sample = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            tags = tuple(self.context())
+            names = self.threads()
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident)
+                if name is None or ident == own:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self.stacks[(tags, name, tuple(codes))] += 1
+            self.samples += 1
+            done = time.perf_counter()
+            self.sampling_time += done - start
+
+            next_sample += self.interval
+            if next_sample < done:
+                next_sample = done  # Fell behind; don't burst to catch up
+            time.sleep(next_sample - done)
+
+    # Output
+
+    def collapsed(self):
+        """Lines of the collapsed-stack format, heaviest first"""
+        labels = self.labels
+        lines = []
+        for (tags, name, codes), count in self.stacks.most_common():
+            frames = []
+            for code in codes:
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _label(code)
+                frames.append(label)
+            lines.append(";".join(list(tags) + [name] + frames) + f" {count}")
+        return lines
+
+    def save(self):
+        elapsed = time.perf_counter() - self.started
+        if not self.stacks:
+            print("🔬 Profiling stopped: no samples")
+            return None
+        tags = next(iter(self.stacks))[0]
+        level = next((tag for tag in tags if tag.startswith("level_")), "level_0").replace("_", "")
+        os.makedirs(self.output_dir, exist_ok=True)
+        filename = os.path.join(self.output_dir, f"profile_{time.strftime('%Y%m%d_%H%M%S')}_{level}.folded")
+        with open(filename, "w") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+        overhead = self.sampling_time / max(elapsed, 1e-9) * 100
+        print(f"🔬 Profiling stopped: {self.samples} samples over {elapsed:.1f}s "
+              f"(sampler busy {overhead:.1f}% of one core) -> {filename}")
+        for label, count in top_functions(self.collapsed(), 5):
+            print(f"   {count / max(self.samples, 1) * 100:5.1f}%  {label}")
+        return filename
+
+
+def top_functions(lines, limit=20):
+    """(frame label, samples) for the functions most often on top of the stack"""
+    self_counts = Counter()
+    for line in lines:
+        stack, _, count = line.rpartition(" ")
+        self_counts[stack.rsplit(";", 1)[-1]] += int(count)
+    return self_counts.most_common(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize sampling profiler captures")
+    sub = parser.add_subparsers(dest="command", required=True)
+    top = sub.add_parser("top", help="Functions with the most samples on top of the stack")
+    top.add_argument("capture")
+    top.add_argument("--limit", type=int, default=20)
+    top.add_argument("--tag", help="Only stacks with this tag, e.g. level_3 or paused")
+    args = parser.parse_args()
+
+    with open(args.capture, "r") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    if args.tag:
+        lines = [line for line in lines if args.tag in line.split(";")]
+    total = sum(int(line.rpartition(" ")[2]) for line in lines)
+    print(f"{args.capture}: {total} samples")
+    for label, count in top_functions(lines, args.limit):
+        print(f"{count / max(total, 1) * 100:6.1f}%  {count:>6}  {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Simulation thread for the 3D Platformer.
+
+With --sim-thread the game simulation (player physics, coins, particles)
+runs on its own thread at a fixed tick rate. After every tick it publishes
+an immutable FrameSnapshot of everything the renderer needs. The main thread
+keeps handling events and GL: it draws whatever snapshot is newest, so a
+slow frame no longer slows gameplay down, and the time PyOpenGL and
+display.flip spend outside the GIL overlaps with simulation.
+
+The camera stays on the main thread because it is late-latched just before
+drawing (see Game.latch_camera); it follows the player pose in the snapshot.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+PlayerPose = namedtuple("PlayerPose", "x y z squash on_ground size")
+
+
+def blend_poses(previous, current, alpha):
+    """`current` moved back towards `previous` by 1 - alpha; a teleport (respawn, level load) isn't blended"""
+    if previous is None or alpha >= 1.0 or abs(current.x - previous.x) + abs(current.y - previous.y) \
+            + abs(current.z - previous.z) > 1.0:
+        return current
+    return current._replace(x=previous.x + (current.x - previous.x) * alpha,
+                            y=previous.y + (current.y - previous.y) * alpha,
+                            z=previous.z + (current.z - previous.z) * alpha,
+                            squash=previous.squash + (current.squash - previous.squash) * alpha)
+
+FrameSnapshot = namedtuple("FrameSnapshot", [
+    "tick",             # Simulation tick that produced this frame
+    "time",             # perf_counter when it was published
+    "input_time",       # When the input used by that tick was sampled
+    "game_state",
+    "player",           # PlayerPose
+    "platforms",        # Level data; replaced wholesale on load, never edited
+    "platform_colors",
+    "lod",              # PlatformLOD and PlatformBVH are shared, not copied: moving
+    "bvh",              # platforms update in place every tick, so read them under game.lock
+    "batches",          # PlatformBatches of the static platforms; rebuilt per level, never edited
+    "coins",            # Tuple of (x, y, z)
+    "coin_rotation",
+    "ghosts",           # GhostSet; read-only once loaded
+    "hazards",          # HazardFrame or None; its arrays are replaced each tick, never edited
+    "peers",            # Tuple of PlayerPose: other players in a network game
+    "level_ticks",      # Simulation ticks since the level started
+    "particles",        # Tuple of (x, y, z, r, g, b, alpha)
+    "score",
+    "lives",
+    "level",
+    "coins_remaining",
+])
+
+
+class SnapshotBuffer:
+    """Two snapshot slots: the simulation fills the back slot, then swaps"""
+
+    def __init__(self):
+        self.slots = [None, None]
+        self.front = 0
+        self.lock = threading.Lock()
+        self.published = 0
+
+    def publish(self, snapshot):
+        back = 1 - self.front
+        self.slots[back] = snapshot
+        with self.lock:
+            self.front = back
+            self.published += 1
+
+    def latest(self):
+        with self.lock:
+            return self.slots[self.front]
+
+
+class SimulationThread:
+    def __init__(self, game, rate=60):
+        self.game = game
+        self.rate = rate
+        self.dt = 1.0 / rate
+        self.buffer = SnapshotBuffer()
+        self.input = None
+        self.tick = 0
+        self.running = False
+        self.thread = threading.Thread(target=self._loop, name="simulation", daemon=True)
+
+    def start(self):
+        # Have something to draw before the first tick finishes
+        with self.game.lock:
+            self.buffer.publish(self.game.build_snapshot(self.tick, copy=True))
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join(timeout=1.0)
+
+    def submit_input(self, snapshot):
+        """Hand over the newest input snapshot (a plain reference swap)"""
+        self.input = snapshot
+
+    def _loop(self):
+        stats = self.game.stats
+        next_tick = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            input_snapshot = self.input
+            with self.game.lock:
+                if input_snapshot is not None:
+                    self.game.apply_input(input_snapshot)
+                self.game.update(self.dt)
+                self.tick += 1
+                snapshot = self.game.build_snapshot(self.tick, copy=True)
+            self.buffer.publish(snapshot)
+            stats.record("sim_tick_ms", (time.perf_counter() - start) * 1000.0)
+
+            next_tick += self.dt
+            now = time.perf_counter()
+            if next_tick < now - self.dt:
+                # Too far behind (e.g. a long level load); don't fast-forward
+                next_tick = now
+            elif next_tick > now:
+                time.sleep(next_tick - now)
@@ -0,0 +1,122 @@
+"""
+Uniform grid spatial index over XZ footprints.
+
+SpatialGrid is the incremental version: objects are inserted into every cell
+their footprint touches and can be moved one at a time, which suits things
+that change during play. overlap_pairs() is the batch version for tools that
+need every intersecting pair of two large box sets at once.
+"""
+
+import math
+
+import numpy as np
+
+
+class SpatialGrid:
+    def __init__(self, cell_size=2.0):
+        self.cell_size = cell_size
+        self.cells = {}   # (cx, cz) -> set of item ids
+        self.ranges = {}  # item id -> (cx0, cz0, cx1, cz1)
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __contains__(self, item):
+        return item in self.ranges
+
+    def cell_range(self, xmin, zmin, xmax, zmax):
+        size = self.cell_size
+        return (math.floor(xmin / size), math.floor(zmin / size),
+                math.floor(xmax / size), math.floor(zmax / size))
+
+    def insert(self, item, xmin, zmin, xmax, zmax):
+        cell_range = self.cell_range(xmin, zmin, xmax, zmax)
+        self.ranges[item] = cell_range
+        cx0, cz0, cx1, cz1 = cell_range
+        for cx in range(cx0, cx1 + 1):
+            for cz in range(cz0, cz1 + 1):
+                self.cells.setdefault((cx, cz), set()).add(item)
+
+    def remove(self, item):
+        cell_range = self.ranges.pop(item, None)
+        if cell_range is None:
+            return
+        cx0, cz0, cx1, cz1 = cell_range
+        for cx in range(cx0, cx1 + 1):
+            for cz in range(cz0, cz1 + 1):
+                bucket = self.cells.get((cx, cz))
+                if bucket is not None:
+                    bucket.discard(item)
+                    if not bucket:
+                        del self.cells[(cx, cz)]
+
+    def update(self, item, xmin, zmin, xmax, zmax):
+        """Move an item. Returns True if it changed cells (cheap when it did not)"""
+        if self.ranges.get(item) == self.cell_range(xmin, zmin, xmax, zmax):
+            return False
+        self.remove(item)
+        self.insert(item, xmin, zmin, xmax, zmax)
+        return True
+
+    def query(self, xmin, zmin, xmax, zmax):
+        """Ids of items whose cells overlap the box (a superset of true hits)"""
+        cx0, cz0, cx1, cz1 = self.cell_range(xmin, zmin, xmax, zmax)
+        found = set()
+        for cx in range(cx0, cx1 + 1):
+            for cz in range(cz0, cz1 + 1):
+                bucket = self.cells.get((cx, cz))
+                if bucket:
+                    found |= bucket
+        return found
+
+    def query_point(self, x, z, radius=0.0):
+        return self.query(x - radius, z - radius, x + radius, z + radius)
+
+    def clear(self):
+        self.cells.clear()
+        self.ranges.clear()
+
+
+def cell_keys(cx, cz):
+    """Pack integer cell coordinates into one sortable int64 key"""
+    return (cx.astype(np.int64) + 2**31) << 32 | (cz.astype(np.int64) + 2**31)
+
+
+def overlap_pairs(a, b, cell):
+    """Index pairs (i, j) where box a[i] intersects box b[j].
+
+    Boxes are rows of (xmin, xmax, ymin, ymax, zmin, zmax). b is bucketed by
+    center on a uniform XZ grid of `cell` sized squares, which must be at
+    least as large as any box, so only the 3x3 neighbourhood of each box in a
+    has to be checked.
+    """
+    b_keys = cell_keys(np.floor((b[:, 0] + b[:, 1]) / 2 / cell),
+                       np.floor((b[:, 4] + b[:, 5]) / 2 / cell))
+    order = np.argsort(b_keys, kind="stable")
+    sorted_keys = b_keys[order]
+
+    acx = np.floor((a[:, 0] + a[:, 1]) / 2 / cell)
+    acz = np.floor((a[:, 4] + a[:, 5]) / 2 / cell)
+
+    pairs_a, pairs_b = [], []
+    for ox in (-1, 0, 1):
+        for oz in (-1, 0, 1):
+            keys = cell_keys(acx + ox, acz + oz)
+            lo = np.searchsorted(sorted_keys, keys, side="left")
+            hi = np.searchsorted(sorted_keys, keys, side="right")
+            counts = hi - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            ai = np.repeat(np.arange(len(a)), counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            bi = order[starts + np.arange(total)]
+            hit = ((a[ai, 0] < b[bi, 1]) & (b[bi, 0] < a[ai, 1]) &
+                   (a[ai, 2] < b[bi, 3]) & (b[bi, 2] < a[ai, 3]) &
+                   (a[ai, 4] < b[bi, 5]) & (b[bi, 4] < a[ai, 5]))
+            pairs_a.append(ai[hit])
+            pairs_b.append(bi[hit])
+
+    if not pairs_a:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)